@@ -0,0 +1,136 @@
+import io # For streaming the page into the parser
+import json # For the schema.org JSON-LD blocks
+import re # For the postcode / ZIP patterns
+
+from bs4 import BeautifulSoup, SoupStrainer # Fallback, only builds the targeted tags
+
+try:
+    from lxml import etree # Optional: C parser, much faster than html.parser
+except ImportError:
+    etree = None
+
+TARGET_TAGS = ('a', 'address', 'script')
+
+# UK postcode, eg: DD1 1HG / DD11HG / SW1A 2AA
+UK_POSTCODE = re.compile(r'\b[A-Z]{1,2}\d[A-Z\d]? ?\d[A-Z]{2}\b')
+# US state and ZIP, eg: CA 94103 / NY 10001-1234
+US_ZIP = re.compile(r'\b[A-Z]{2},? \d{5}(?:-\d{4})?\b')
+# Cheap check before a JSON-LD block is parsed
+POSTAL_ADDRESS = re.compile(r'"@type"\s*:\s*"PostalAddress"|"streetAddress"\s*:')
+# The blocks of the page that are never visible text, or are already read from their tag (address)
+SKIPPED_BLOCKS = re.compile(r'<(script|style|noscript|template|address)\b.*?</\1\s*>|<!--.*?-->', re.IGNORECASE | re.DOTALL)
+# The tags that break the visible text into lines
+LINE_BREAK_TAGS = re.compile(r'<(?:br|/p|/div|/li|/td|/th|/tr|/h[1-6]|/address|/section|/footer|/header)\b[^>]*>', re.IGNORECASE)
+TAGS = re.compile(r'<[^>]+>')
+MAX_ADDRESS_LENGTH = 150 # Longer lines with a postcode in them are prose, not an address
+MAX_ANCHOR_LENGTH = 100 # The anchor text kept with each link, for scoring it
+
+
+def formatText(text: str):
+    return " ".join(text.split())
+
+
+# Format a schema.org PostalAddress as a single line
+def formatPostalAddress(address: dict):
+    parts = [address.get(key) for key in ['streetAddress', 'addressLocality', 'addressRegion', 'postalCode', 'addressCountry']]
+    parts = [part.get('name', '') if isinstance(part, dict) else part for part in parts]
+    return formatText(", ".join(str(part) for part in parts if part))
+
+
+# Find every PostalAddress in a parsed JSON-LD document
+def findPostalAddresses(node, found: list):
+    if isinstance(node, list):
+        for item in node:
+            findPostalAddresses(item, found)
+    elif isinstance(node, dict):
+        types = node.get('@type', [])
+        types = types if isinstance(types, list) else [types]
+        if 'PostalAddress' in types or ('streetAddress' in node and 'address' not in node):
+            found.append(formatPostalAddress(node))
+        for value in node.values():
+            if isinstance(value, (dict, list)):
+                findPostalAddresses(value, found)
+    return found
+
+
+def addressesFromJsonLd(script: str):
+    if not POSTAL_ADDRESS.search(script):
+        return []
+    try:
+        return findPostalAddresses(json.loads(script), [])
+    except ValueError:
+        return []
+
+
+# The lines of the visible text that contain a postcode or ZIP
+def addressesFromText(html: str):
+    text = LINE_BREAK_TAGS.sub('\n', SKIPPED_BLOCKS.sub('\n', html))
+    text = TAGS.sub(' ', text)
+    found = []
+    for line in text.split('\n'):
+        if not (UK_POSTCODE.search(line) or US_ZIP.search(line)):
+            continue
+        line = formatText(line.replace('&amp;', '&').replace('&nbsp;', ' '))
+        if line and len(line) <= MAX_ADDRESS_LENGTH:
+            found.append(line)
+    return found
+
+
+# Only the targeted tags are looked at: <a href> for the crawl, <address> and the JSON-LD scripts for the addresses.
+# Both parsers join the text of a tag with spaces (the lines of an address are often split by <br>) so they find the same addresses
+def parseTargetTags(content: bytes):
+    if etree is not None:
+        return parseTargetTagsLxml(content)
+    return parseTargetTagsSoup(content)
+
+
+def parseTargetTagsLxml(content: bytes):
+    addresses = []
+    links = []
+    parser = etree.iterparse(io.BytesIO(content), events=('end',), tag=TARGET_TAGS, html=True, recover=True, no_network=True)
+    try:
+        for event, element in parser:
+            if element.tag == 'a':
+                href = element.get('href')
+                if href and href.startswith('http'):
+                    links.append([href, formatText(" ".join(element.itertext()) or element.get('title') or '')[:MAX_ANCHOR_LENGTH]])
+                continue
+            if element.tag == 'address':
+                addresses.append(formatText(" ".join(element.itertext())))
+            elif element.get('type') == 'application/ld+json':
+                addresses.extend(addressesFromJsonLd(element.text or ''))
+            element.clear(keep_tail=True)
+    except etree.XMLSyntaxError:
+        pass # Keep what was found before the page became unparsable (eg: an empty body)
+    return addresses, links
+
+
+def parseTargetTagsSoup(content: bytes):
+    addresses = []
+    links = []
+    soup = BeautifulSoup(content, 'html.parser', parse_only=SoupStrainer(TARGET_TAGS))
+    for element in soup.find_all(TARGET_TAGS):
+        if element.name == 'a':
+            href = element.get('href')
+            if href and href.startswith('http'):
+                links.append([href, formatText(element.get_text(' ') or element.get('title') or '')[:MAX_ANCHOR_LENGTH]])
+        elif element.name == 'address':
+            addresses.append(formatText(element.get_text(' ')))
+        elif element.get('type') == 'application/ld+json':
+            addresses.extend(addressesFromJsonLd(element.string or ''))
+    return addresses, links
+
+
+# Extract the addresses and the absolute links of a page ([url, anchor text] pairs), the addresses come from the <address> tags,
+# schema.org PostalAddress JSON-LD and the lines of text with a UK postcode or US ZIP in them
+def extractPage(content: bytes):
+    addresses, links = parseTargetTags(content)
+    addresses.extend(addressesFromText(content.decode('utf-8', errors='replace')))
+    # Drop the empty and repeated addresses, keeping the page order
+    unique = []
+    seen = set()
+    for address in addresses:
+        if address and address not in seen:
+            seen.add(address)
+            unique.append(address)
+    return unique, links
@@ -2,10 +2,15 @@
 import os
 import googlemaps
 import folium
+import cv2 # For saving the tile mosaics
+import numpy as np # For mapping the footprints back to lat / lng
 
 # Custom imports
 from imageProcessor import ImageVulnProcessor
+from changeDetection import findPreviousLocation, changedMask
+from satelliteTiles import latLngToPixels, pixelsToLatLng, metersPerPixel
 from logger import Logger, logTypes
+from metrics import metrics
 
 
 class AddressHandler():
@@ -19,12 +24,28 @@ class AddressHandler():
     maxPlaces = 5 # Only get the first 5 results
     securityDetected = None
     workingDirectory = None # The directory that the working with. This is used to create the scan folder
-    def __init__(self, address: str, googleMapsClient, logger: Logger, aiMetaData, nearbyPlacesLimit: int, scanid: str):
+    fetcher = None # The shared http engine used to download the area images
+    detector = None # The shared YOLO detector used by the vulnerability scan
+    imageOptions = None # Passed on to the ImageVulnProcessor: saveImages, maxImageBytes
+    detectionStore = None # The scan wide store of the detections
+    locationIndex = 0 # The index of this location in the detection store
+    placesClient = None # Answers the nearby places queries, the google maps client unless a local OSM extract is used
+    tileLayer = None # Builds the satellite image from the shared z/x/y tile cache instead of one static map per location
+    # initialise=False only sets up the handler, the stages are then run by the caller (see LocationPipeline)
+    def __init__(self, address: str, googleMapsClient, logger: Logger, aiMetaData, nearbyPlacesLimit: int, scanid: str, fetcher=None, detector=None, imageOptions: dict = None, detectionStore=None, locationIndex: int = 0, placesClient=None, tileLayer=None, initialise: bool = True):
         self.gmaps = googleMapsClient
+        self.placesClient = placesClient or googleMapsClient
+        self.tileLayer = tileLayer
+        self.detectionStore = detectionStore
+        self.locationIndex = locationIndex
+        self.imageOptions = imageOptions or {}
+        self.fetcher = fetcher
+        self.detector = detector
         self.logger = logger
         self.scanID = scanid
         self.aiMetaData = aiMetaData
         self.maxPlaces = nearbyPlacesLimit
+        self.nearBy = [] # Each location needs its own list, the class attribute would be shared between the handlers
         self.workingDirectory = f'./scans/{self.scanID}'
         self.address = {
             'address': address,
@@ -43,13 +64,19 @@ class AddressHandler():
             },
             'types': None,
             'topDownImagePath': None,
+            'topDownImageZoom': None,
+            'topDownImageOrigin': None, # The global pixel coordinates of the top left corner of the satellite image at its zoom
+            'footprints': None, # The building footprints and perimeter barriers found in the satellite image
+            'imageryChange': None, # The fraction of the satellite image that changed since the previous scan (incremental scans)
             'topDownImagePathProcess': None
         }
 
+        if not initialise:
+            return
         try:
             self.findLocationGeoCodeFromAddress()
-            self.getTopDownImageOfLocation()
-            self.findNearbyBuildings()
+            if self.getImagery() is False:
+                return
             self.getTopDownImageOfLocationForProcessing()
             
         except Exception as e:
@@ -63,7 +90,8 @@ class AddressHandler():
 
     def findLocationGeoCodeFromAddress(self):
 #       Find the geocode from the address
-        geocodeInfoFromGoogleMaps = self.gmaps.geocode(self.address["address"])[0]
+        with metrics.span('geocode'):
+            geocodeInfoFromGoogleMaps = self.gmaps.geocode(self.address["address"])[0]
 #       [
 #       'formatted_address': 'Bell St, Dundee DD1 1HG, UK',
 #       'geometry': {'bounds': {
@@ -86,6 +114,12 @@ class AddressHandler():
         self.logger.vprint(logTypes.SUCCESS, f'AddressHandler initialised with address: {self.address["address"]}')
         
 
+#   Get the satellite image and the nearby places, both only need the geocode. False when there is no satellite image
+    def getImagery(self):
+        if self.getTopDownImageOfLocation() is False:
+            return False
+        self.findNearbyBuildings()
+
 #   Get the top down image of the location
     def getTopDownImageOfLocation(self):
         images_folder = f"{self.workingDirectory}/{self.address['id']}"
@@ -95,17 +129,82 @@ class AddressHandler():
 #       Check if the folder image already exists if not create it
         if not os.path.exists(images_folder):
             os.makedirs(images_folder)
-            self.logger.vprint(logTypes.DEBUG, f'Created folder: {images_folder}')
+            self.logger.vprint(logTypes.DEBUG, 'Created folder: {}', images_folder)
+
+#       Stitch the image together from the tiles that cover the bounds of the location
+        if self.tileLayer:
+            mosaic = self.tileLayer.mosaic(self.address["geocode"])
+            if mosaic is None:
+                self.logger.vprint(logTypes.WARNING, 'No bounds or viewport to make a satellite mosaic of: {}', self.address["address"])
+                return False
+            image, self.address["topDownImageZoom"], self.address["topDownImageOrigin"] = mosaic
+            cv2.imwrite(self.address["topDownImagePath"], image)
+            self.logger.vprint(logTypes.DEBUG, 'Saving satellite mosaic ({}x{} at zoom {}) to: {}', image.shape[1], image.shape[0], self.address["topDownImageZoom"], self.address["topDownImagePath"])
+            self.compareTopDownImage()
+            return
 
 #       Download the image
-        with open(self.address["topDownImagePath"], 'wb') as out:
+        self.address["topDownImageZoom"] = 17
+        centreX, centreY = latLngToPixels(lat, lng, 17)
+        self.address["topDownImageOrigin"] = (float(centreX) - 250, float(centreY) - 250)
+        with open(self.address["topDownImagePath"], 'wb') as out, metrics.span('static_map'):
             for chunk in self.gmaps.static_map(size=(500, 500),
                                         center=(lat,lng),
                                         zoom=17,
                                         maptype='satellite'):
                 if chunk:
                     out.write(chunk)
-        self.logger.vprint(logTypes.DEBUG, f'Saving satellite image to: {self.address["topDownImagePath"]}')
+        self.logger.vprint(logTypes.DEBUG, 'Saving satellite image to: {}', self.address["topDownImagePath"])
+        self.compareTopDownImage()
+
+#   Compare the satellite image with the one of the previous scan of the location, the changed pixels are saved to change.png
+    def compareTopDownImage(self):
+        if not self.imageOptions.get('incremental'):
+            return
+        images_folder = f"{self.workingDirectory}/{self.address['id']}"
+        previousFolder = findPreviousLocation(self.address['id'], images_folder, 'original.png', self.imageOptions.get('baselineScan'), os.path.dirname(self.workingDirectory))
+        if previousFolder is None:
+            self.logger.vprint(logTypes.DEBUG, 'No previous satellite image of: {}', self.address["address"])
+            return
+        previous, current = cv2.imread(f"{previousFolder}/original.png"), cv2.imread(self.address["topDownImagePath"])
+        if previous is None or current is None:
+            return
+        mask, changed = changedMask(previous, current, self.imageOptions.get('changeThreshold') or 30)
+        cv2.imwrite(f"{images_folder}/change.png", mask)
+        self.address["imageryChange"] = round(changed, 4)
+        self.logger.vprint(logTypes.INFO, '{:.1f}% of the satellite image changed since: {}', changed * 100, previousFolder)
+
+#   Find the building footprints and the perimeter barriers (walls, fences, hedges) in the satellite image, the extractor
+#   batches the images of every location together. The polygons are mapped to lat / lng and the lengths and areas to metres
+    def findFootprints(self, extractor):
+        image = cv2.imread(self.address["topDownImagePath"]) if self.address["topDownImagePath"] else None
+        if image is None or self.address["topDownImageOrigin"] is None:
+            self.logger.vprint(logTypes.WARNING, 'No satellite image to find the footprints of: {}', self.address["address"])
+            return
+        found = extractor.detect([image])[0]
+        zoom = self.address["topDownImageZoom"] or 17
+        scale = float(metersPerPixel(self.address["geocode"]['location']['lat'], zoom))
+        originX, originY = self.address["topDownImageOrigin"]
+        buildings = []
+        for polygon, area, perimeter in zip(found['footprints'], found['areas'], found['perimeters']):
+            corners = np.array(polygon, dtype=np.float64)
+            lats, lngs = pixelsToLatLng(originX + corners[:, 0], originY + corners[:, 1], zoom)
+            buildings.append({'polygon': np.round(np.stack([lats, lngs], axis=1), 7).tolist(), 'area': round(area * scale ** 2, 1), 'perimeter': round(perimeter * scale, 1)})
+        self.address["footprints"] = {
+            'buildings': buildings,
+            'builtFraction': found['builtFraction'],
+            'barrierLength': round(found['barrierLength'] * scale, 1),
+            'barriers': len(found['barriers']),
+            'metersPerPixel': round(scale, 4)
+        }
+        metrics.count('building footprints', len(buildings))
+        self.logger.vprint(logTypes.INFO, 'Found {} building footprints and {}m of perimeter barriers at: {}', len(buildings), self.address["footprints"]["barrierLength"], self.address["address"])
+
+#   If the satellite image shows anything worth running the YOLO pass on: a building or at least minBarrierLength metres
+#   of perimeter barrier (a few straight edges are found in every image, so any barrier at all is not enough)
+    def hasStructures(self, minBarrierLength: float = 100):
+        footprints = self.address.get("footprints")
+        return footprints is None or bool(footprints['buildings']) or footprints['barrierLength'] >= minBarrierLength
 
     def getTopDownImageOfLocationForProcessing(self):
         images_folder = f"{self.workingDirectory}/{self.address['id']}"
@@ -117,14 +216,25 @@ class AddressHandler():
         for place in self.nearBy:
             folium.Marker([place['geometry']['location']['lat'], place['geometry']['location']['lng']], popup=place['name']).add_to(m)
 
-        self.logger.vprint(logTypes.INFO, f'Saving map to: {self.address["topDownImagePathProcess"]}')
-        m.save(self.address["topDownImagePathProcess"])
+        # Outline the building footprints found in the satellite image
+        for building in (self.address.get("footprints") or {}).get('buildings', []):
+            folium.Polygon(building['polygon'], color='red', weight=2, fill=True, fill_opacity=0.2, popup=f'{building["area"]}m², perimeter {building["perimeter"]}m').add_to(m)
+
+        self.logger.vprint(logTypes.INFO, 'Saving map to: {}', self.address["topDownImagePathProcess"])
+        with metrics.span('map render'):
+            m.save(self.address["topDownImagePathProcess"])
     
     # Near by public buildings that are with in 100m (WIFI connection) - so that a hacker will still be within range to attempt an attack
     def findNearbyBuildings(self):
         lat, lng = self.address["geocode"]['location'].values()
        
-        for place in self.gmaps.places_nearby(location=(lat,lng), radius=100)['results']: 
+        with metrics.span('places'):
+            places = self.placesClient.places_nearby(location=(lat,lng), radius=100)['results']
+        self.addNearbyPlaces(places)
+
+    # Keep the nearby places that are not a whole locality, up to the places limit
+    def addNearbyPlaces(self, places: list):
+        for place in places: 
             if self.maxPlaces > 0:
                 if "locality" in place['types']:
                     continue
@@ -135,17 +245,17 @@ class AddressHandler():
                     'geometry': place['geometry'],
                     'vicinity': place['vicinity']
                 }
-                self.logger.vprint(logTypes.INFO, f'Found nearby place: {placeInfo["name"]}')
+                self.logger.vprint(logTypes.INFO, 'Found nearby place: {}', placeInfo["name"])
                 self.nearBy.append(placeInfo)
                 self.maxPlaces -= 1
             else:
                 break
-        self.logger.vprint(logTypes.DEBUG, f'Found {len(self.nearBy)} nearby places')
+        self.logger.vprint(logTypes.DEBUG, 'Found {} nearby places', len(self.nearBy))
             
         
     #  Run the vulnerability scan on the images found in the area for cameras and feces
     def runVulnerabilityScan(self):
-        vulnerabilityScan = ImageVulnProcessor(f"{self.workingDirectory}/{self.address['id']}", self.address["geocode"]['location'], self.address["address"], self.logger, aiMetaData=self.aiMetaData)
+        vulnerabilityScan = ImageVulnProcessor(f"{self.workingDirectory}/{self.address['id']}", self.address["geocode"]['location'], self.address["address"], self.logger, aiMetaData=self.aiMetaData, fetcher=self.fetcher, detector=self.detector, detectionStore=self.detectionStore, locationIndex=self.locationIndex, **self.imageOptions)
         self.securityDetected = vulnerabilityScan.securityDetected
         pass
 
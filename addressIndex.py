@@ -0,0 +1,130 @@
+import re # For the postcode / ZIP patterns
+import threading # For the crawl workers adding at the same time
+
+from addressExtractor import UK_POSTCODE, US_ZIP
+
+# The common abbreviations, expanded so "Bell St" and "Bell Street" have the same tokens
+ABBREVIATIONS = {
+    'st': 'street', 'rd': 'road', 'ave': 'avenue', 'av': 'avenue', 'ln': 'lane', 'dr': 'drive', 'ct': 'court',
+    'pl': 'place', 'sq': 'square', 'cres': 'crescent', 'blvd': 'boulevard', 'hwy': 'highway', 'pk': 'park',
+    'terr': 'terrace', 'ter': 'terrace', 'gdns': 'gardens', 'bldg': 'building', 'ste': 'suite', 'fl': 'floor',
+    'n': 'north', 's': 'south', 'e': 'east', 'w': 'west', 'uni': 'university'
+}
+# The words that say nothing about where the site is
+STOP_WORDS = {'the', 'of', 'and', 'at', 'uk', 'united', 'kingdom', 'usa', 'us', 'gb', 'address', 'head', 'office', 'email', 'tel', 'phone'}
+WORDS = re.compile(r'[a-z0-9]+')
+HOUSE_NUMBER = re.compile(r'^\d+[a-z]?$')
+# A 5 digit number at the very end of an address, a ZIP even without its state
+ZIP_AT_END = re.compile(r'\b(\d{5})(?:-\d{4})?\W*$')
+US_STATES = {
+    'AL', 'AK', 'AZ', 'AR', 'CA', 'CO', 'CT', 'DE', 'DC', 'FL', 'GA', 'HI', 'ID', 'IL', 'IN', 'IA', 'KS', 'KY', 'LA', 'ME', 'MD',
+    'MA', 'MI', 'MN', 'MS', 'MO', 'MT', 'NE', 'NV', 'NH', 'NJ', 'NM', 'NY', 'NC', 'ND', 'OH', 'OK', 'OR', 'PA', 'RI', 'SC', 'SD',
+    'TN', 'TX', 'UT', 'VT', 'VA', 'WA', 'WV', 'WI', 'WY', 'PR', 'GU', 'VI', 'AS', 'MP'
+}
+
+
+# The canonical postcode / ZIP of an address (upper case, no spaces) and where it is in the address, None when it has neither.
+# A UK postcode wins, a 5 digit number is only a ZIP after a state (CA 94103) or at the end of the address, so the
+# house and suite numbers of an address are never taken for one
+def findPostcode(address: str):
+    upper = address.upper()
+    match = UK_POSTCODE.search(upper)
+    if match:
+        return match.group(0).replace(' ', ''), match.span()
+    for match in US_ZIP.finditer(upper):
+        if match.group(0)[:2] in US_STATES:
+            return re.search(r'\d{5}', match.group(0)).group(0), match.span()
+    match = ZIP_AT_END.search(upper)
+    if match:
+        return match.group(1), match.span(1)
+    return None, None
+
+
+# Lower case, expand the abbreviations and drop the postcode and the stop words.
+# Returns the postcode and the set of tokens that are left
+def normaliseAddress(address: str):
+    postcode, span = findPostcode(address)
+    text = address.lower()
+    if span:
+        # The postcode is the block key, it is not one of the tokens
+        text = text[:span[0]] + ' ' + text[span[1]:]
+    tokens = frozenset(ABBREVIATIONS.get(word, word) for word in WORDS.findall(text) if word not in STOP_WORDS)
+    return postcode, tokens
+
+
+def jaccard(a: frozenset, b: frozenset):
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+# Groups the address variants of the same site before they are geocoded, then the geocoded sites by place_id.
+# Addresses are blocked by postcode (or by their exact tokens when they have none) so each new address is only
+# compared with the few addresses that share its block
+class AddressIndex():
+    similarity = 0.6 # The min Jaccard similarity of the tokens of two addresses in the same block to be merged
+    merged = 0 # The addresses merged into an existing site before geocoding
+    placeMerged = 0 # The sites merged after geocoding because they have the same place_id
+    def __init__(self, similarity: float = 0.6):
+        self.similarity = similarity
+        self.lock = threading.Lock()
+        self.sites = [] # The first address seen of each site, in the order they were found
+        self.variants = {} # The site address -> every variant of it that was found
+        self.siteOf = {} # Every address that was added -> the site address it belongs to
+        self.blocks = {} # The block key -> [(tokens, site address)]
+        self.placeIds = {} # The place_id -> the location it was first geocoded for
+
+    # The site an address belongs to, None when it is a new site
+    def findSite(self, postcode: str, tokens: frozenset):
+        for siteTokens, site in self.blocks.get(postcode or tokens, []):
+            if tokens == siteTokens:
+                return site
+            # Different house numbers on the same street are different sites
+            numbers, siteNumbers = {t for t in tokens if HOUSE_NUMBER.match(t)}, {t for t in siteTokens if HOUSE_NUMBER.match(t)}
+            if numbers and siteNumbers and numbers != siteNumbers:
+                continue
+            if jaccard(tokens, siteTokens) >= self.similarity:
+                return site
+        return None
+
+    # Add an address, returns True when it is a new site and False when it is a variant of a known one
+    def add(self, address: str):
+        postcode, tokens = normaliseAddress(address)
+        with self.lock:
+            if address in self.siteOf:
+                return False
+            site = self.findSite(postcode, tokens)
+            if site is not None:
+                self.variants[site].append(address)
+                self.siteOf[address] = site
+                self.merged += 1
+                return False
+            self.sites.append(address)
+            self.variants[address] = [address]
+            self.siteOf[address] = address
+            self.blocks.setdefault(postcode or tokens, []).append((tokens, address))
+            return True
+
+    def addresses(self):
+        with self.lock:
+            return list(self.sites)
+
+    # Record the place_id a location was geocoded to, returns False when another location already has it
+    def addPlace(self, placeId: str, location):
+        if not placeId:
+            return True
+        with self.lock:
+            first = self.placeIds.setdefault(placeId, location)
+            if first != location:
+                self.placeMerged += 1
+                return False
+            return True
+
+    def __len__(self):
+        return len(self.sites)
+
+    def __contains__(self, address: str):
+        return address in self.siteOf
+
+    def stats(self):
+        return f'{len(self.sites) - self.placeMerged} sites, {self.merged} address variants merged before geocoding, {self.placeMerged} merged by place_id'
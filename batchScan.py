@@ -0,0 +1,275 @@
+# Batch mode: scan thousands of targets from a JSONL or CSV file across a pool of worker processes.
+# Each worker keeps its google maps client, http engine and caches warm between its targets, the YOLO model is loaded once
+# in a single detection process that batches the images of every worker, and each result is appended to the output JSONL as it finishes
+# Run from the root of the repo: python batchScan.py targets.jsonl --output results.jsonl --processes 8 -d 2 --osm-extract ./scotland.osm.pbf
+import argparse
+import csv # For the CSV target files
+import json # For the JSONL target and result files
+import os
+import threading # For the scans of the daemon setting up the warm resources at the same time
+import time # For the target timings
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from multiprocessing.managers import BaseManager # For sharing the detector between the worker processes
+from multiprocessing.util import Finalize # For closing the warm resources when a worker process exits
+
+import main
+from metrics import metrics
+from yoloDetector import createDetector
+from detectionService import DetectionService
+from imageHash import HashCachedDetector
+from tiledInference import TiledDetector
+from logger import Logger, logTypes
+
+sharedDetector = None # The detector of the detection process, every worker process sends its images to it
+
+
+# Load the YOLO model once in the detection process, in front of the batching service and the hash cache like a single scan
+def loadSharedDetector(scanArgv: list):
+    global sharedDetector
+    args = main.parseArguments(scanArgv)
+    logger = Logger(args.verbose)
+    model = createDetector(args.detector, args.weights, confidence=args.confidence, threads=args.detector_threads)
+    logger.vprint(logTypes.SUCCESS, f'Loaded the YOLO weights: {model.weights} with the {model.backend} backend for the batch')
+    sharedDetector = DetectionService(model, logger, batchSize=args.batch_size, deadline=args.batch_deadline / 1000)
+    modelKey = f'{model.weights}|{args.confidence}'
+    if args.tiled_inference:
+        sharedDetector = TiledDetector(sharedDetector, window=args.inference_window, overlap=args.inference_overlap, minDetail=args.inference_min_detail)
+        modelKey += f'|tiled {args.inference_window}'
+    if args.hash_cache:
+        sharedDetector = HashCachedDetector(sharedDetector, modelKey, maxDistance=args.hash_cache_distance, maxEntries=args.hash_cache_size)
+
+
+def getSharedDetector():
+    return sharedDetector
+
+
+# Serves the shared detector to the worker processes, each connection is handled on its own thread
+# so the images of different workers meet in the same detection batches
+class DetectionManager(BaseManager):
+    pass
+
+DetectionManager.register('detector', callable=getSharedDetector, exposed=['detect', 'stats'])
+
+
+# A scan of one target inside a worker process. The resources that cost the most to set up (google maps client,
+# OSM extract, http engine, crawl cache, tile layer, footprint extractor) are created once by warmUp and reused by every target of the worker
+class BatchScan(main.OpenSourceLocationFingerPrint):
+    scanArgv = [] # The scan arguments shared by every target
+    resources = {} # The warm resources of this worker process
+    resourcesLock = threading.Lock()
+    remoteDetector = None # The proxy of the shared detector in the detection process
+    perScanMetrics = True # Each target gets its own run profile, the scans of a worker run one at a time
+
+    # Set up the warm resources before the first target arrives
+    @classmethod
+    def warmUp(cls, scanArgs: argparse.Namespace):
+        scan = cls.__new__(cls)
+        scan.args = scanArgs
+        scan.logger = Logger(scanArgs.verbose)
+        scan.crawlThreads = max(1, scanArgs.threads)
+        scan.vulnScan = scanArgs.no_vuln
+        scan.setUpResources()
+        return scan
+
+    def shared(self, name: str, setUp):
+        with self.resourcesLock:
+            if name not in self.resources:
+                setUp()
+                self.resources[name] = getattr(self, name)
+        setattr(self, name, self.resources[name])
+        return True
+
+    def setUpGoogleMapsAPI(self):
+        return self.shared('googleMapsClient', super().setUpGoogleMapsAPI)
+
+    def setUpOsmPlaces(self):
+        return self.shared('placesClient', super().setUpOsmPlaces)
+
+    def setUpFetcher(self):
+        return self.shared('fetcher', super().setUpFetcher)
+
+    def setUpCrawlCache(self):
+        return self.shared('crawlCache', super().setUpCrawlCache)
+
+    def setUpTileLayer(self):
+        return self.shared('tileLayer', super().setUpTileLayer)
+
+    def setUpFootprints(self):
+        return self.shared('footprintService', super().setUpFootprints)
+
+    def setUpDetector(self):
+        self.detector = self.remoteDetector
+        return True
+
+    # The results are streamed to the output file instead of the human report
+    def generateReport(self):
+        pass
+
+    def run(self):
+        try:
+            super().run()
+        finally:
+            self.checkpoint.close() # A target with nothing to scan exits midway
+
+    # The warm resources stay open for the next target of the worker
+    def tearDown(self):
+        self.checkpoint.close()
+        self.saveProfile()
+
+
+def closeSharedResources():
+    for name, resource in BatchScan.resources.items():
+        try:
+            resource.close()
+        except Exception:
+            pass
+
+
+def startWorker(scanArgv: list, detectionAddress):
+    BatchScan.scanArgv = scanArgv
+    BatchScan.resources = {}
+    if detectionAddress:
+        manager = DetectionManager(address=detectionAddress)
+        manager.connect()
+        BatchScan.remoteDetector = manager.detector()
+    BatchScan.warmUp(main.parseArguments(scanArgv))
+    Finalize(None, closeSharedResources, exitpriority=10)
+
+
+# The scan arguments of a target: the shared arguments with its urls, addresses and depth
+def targetArguments(scanArgv: list, target: dict):
+    scanArgv = list(scanArgv)
+    if target['url']:
+        scanArgv += ['-u', *target['url']]
+    if target['address']:
+        scanArgv += ['-a', *target['address']]
+    if target['depth'] is not None:
+        scanArgv += ['-d', str(target['depth'])]
+    return main.parseArguments(scanArgv)
+
+
+# Scan one target and return its result line
+def scanTarget(target: dict, scanClass=BatchScan):
+    startTime = time.perf_counter()
+    result = {'id': target['id'], 'url': target['url'], 'address': target['address']}
+    if scanClass.perScanMetrics:
+        metrics.reset()
+    try:
+        scan = scanClass(scanArgs=targetArguments(scanClass.scanArgv, target))
+        result.update(status='done', **scan.results())
+    except SystemExit: # The argument errors and the targets with nothing to scan exit the scan
+        result.update(status='failed', error='No url entry point or known location could be scanned, see the log of the scan')
+    except Exception as e:
+        result.update(status='failed', error=f'{type(e).__name__}: {e}')
+    result['elapsedSeconds'] = round(time.perf_counter() - startTime, 3)
+    return result
+
+
+# A target line: {"id", "url", "address", "depth"}, url and address can be a list or a string of | separated values
+def makeTarget(fields: dict, line: int):
+    def values(value):
+        if not value:
+            return []
+        if isinstance(value, str):
+            return [part.strip() for part in value.split('|') if part.strip()]
+        return [str(part) for part in value]
+    depth = fields.get('depth')
+    return {
+        'id': str(fields.get('id') or line),
+        'url': values(fields.get('url')),
+        'address': values(fields.get('address')),
+        'depth': int(depth) if depth not in (None, '') else None
+    }
+
+
+# Read the targets one at a time so the file is never held in memory
+def readTargets(path: str, logger: Logger):
+    with open(path, newline='', encoding='utf-8') as f:
+        if path.endswith('.csv'):
+            for line, row in enumerate(csv.DictReader(f), start=1):
+                yield makeTarget(row, line)
+            return
+        for line, text in enumerate(f, start=1):
+            if not text.strip():
+                continue
+            try:
+                yield makeTarget(json.loads(text), line)
+            except (ValueError, AttributeError) as e:
+                logger.vprint(logTypes.ERROR, 'Skipping line {} of {}, it is not a target: {}', line, path, e)
+
+
+# The ids of the targets already done in the output, so a batch that stopped midway carries on where it was
+def doneTargets(path: str):
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, encoding='utf-8') as f:
+        for text in f:
+            try:
+                result = json.loads(text)
+            except ValueError:
+                continue # The last line can be cut short if the batch died while writing it
+            if result.get('status') == 'done':
+                done.add(result['id'])
+    return done
+
+
+def runBatch(batchArgs, scanArgv: list):
+    scanArgs = main.parseArguments(scanArgv)
+    logger = Logger(scanArgs.verbose)
+    folder = os.path.dirname(batchArgs.output)
+    if folder and not os.path.exists(folder):
+        os.makedirs(folder)
+    done = doneTargets(batchArgs.output)
+    if done:
+        logger.vprint(logTypes.SUCCESS, 'Skipping the {} targets already done in: {}', len(done), batchArgs.output)
+
+    manager = None
+    if scanArgs.no_vuln:
+        manager = DetectionManager()
+        manager.start(initializer=loadSharedDetector, initargs=(scanArgv,))
+    processes = max(1, batchArgs.processes)
+    inFlight = batchArgs.in_flight or processes * 2 # Only a few targets are queued ahead so the memory stays flat
+    counts = {'done': 0, 'failed': 0}
+    startTime = time.perf_counter()
+    try:
+        with open(batchArgs.output, 'a', encoding='utf-8') as output, ProcessPoolExecutor(processes, initializer=startWorker, initargs=(scanArgv, manager.address if manager else None)) as pool:
+            def writeResults(futures):
+                for future in futures:
+                    result = future.result()
+                    output.write(json.dumps(result, default=str) + '\n')
+                    output.flush() # The results so far are usable while the batch runs
+                    counts[result['status']] += 1
+                    logger.vprint(logTypes.SUCCESS if result['status'] == 'done' else logTypes.ERROR, 'Target {}: {} in {:.1f}s ({} done, {} failed)', result['id'], result['status'], result['elapsedSeconds'], counts['done'], counts['failed'])
+
+            pending = set()
+            for target in readTargets(batchArgs.targets, logger):
+                if target['id'] in done:
+                    continue
+                pending.add(pool.submit(scanTarget, target))
+                if len(pending) >= inFlight:
+                    finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    writeResults(finished)
+            writeResults(wait(pending).done)
+        if manager:
+            logger.vprint(logTypes.SUCCESS, f'Detection: {manager.detector().stats()}')
+    finally:
+        if manager:
+            manager.shutdown()
+    elapsed = time.perf_counter() - startTime
+    targetsPerMinute = (counts['done'] + counts['failed']) / elapsed * 60 if elapsed > 0 else 0
+    logger.vprint(logTypes.SUCCESS, 'Batch finished: {} done, {} failed in {:.1f}s ({:.1f} targets/min), results in: {}', counts["done"], counts["failed"], elapsed, targetsPerMinute, batchArgs.output)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+                    prog = 'Open Source Loacation Fingerprinting - Batch',
+                    description = 'Scans every target of a JSONL or CSV file across a pool of processes and streams the results to a JSONL file',
+                    epilog = 'Every other argument is passed on to the scan of each target, see python main.py --help',
+                    allow_abbrev = False)
+    parser.add_argument('targets', help='The JSONL or CSV file of the targets, one {"id", "url", "address", "depth"} per line. url and address can be lists or | separated', type=str)
+    parser.add_argument('-o', '--output', help='The JSONL file the result of each target is appended to, the targets already done in it are skipped', type=str, default='./scans/batch.jsonl')
+    parser.add_argument('--processes', help='Specify the number of targets scanned at the same time, one worker process each', type=int, default=os.cpu_count() or 4)
+    parser.add_argument('--in-flight', help='Specify the max number of targets queued on the workers at once (default: twice the processes)', type=int, default=0)
+    batchArgs, scanArgv = parser.parse_known_args()
+    runBatch(batchArgs, scanArgv)
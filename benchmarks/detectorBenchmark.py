@@ -0,0 +1,80 @@
+# Compare the detector backends on the same images: ms/image and the peak RSS of the process
+# Run from the root of the repo: python benchmarks/detectorBenchmark.py --images ./testing/areaImages
+import argparse
+import multiprocessing # Each backend runs in its own process so the peak RSS is its own
+import os
+import resource # For the peak RSS
+import sys
+import time
+import cv2
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from yoloDetector import BACKENDS, YoloDetector, createDetector
+from tiledInference import TiledDetector
+
+
+def loadImages(folder: str):
+    images = []
+    for file in sorted(os.listdir(folder)):
+        image = cv2.imread(os.path.join(folder, file))
+        if image is not None:
+            images.append(image)
+    return images
+
+
+def benchmarkBackend(backend: str, args, results):
+    try:
+        images = loadImages(args.images)
+        startTime = time.perf_counter()
+        detector = createDetector(backend, args.weights, confidence=args.confidence, threads=args.threads)
+        loadTime = time.perf_counter() - startTime
+        if args.tiled:
+            detector = TiledDetector(detector, window=args.window, minDetail=args.min_detail)
+        detector.detect(images[:1]) # Warm up
+        timings = []
+        detections = 0
+        for _ in range(args.repeat):
+            startTime = time.perf_counter()
+            for start in range(0, len(images), args.batch_size):
+                detections += sum(len(boxes) for boxes in detector.detect(images[start:start + args.batch_size]))
+            timings.append(time.perf_counter() - startTime)
+        peakRss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024 # KB on linux
+        results[backend] = {
+            'load': loadTime,
+            'msPerImage': min(timings) / len(images) * 1000,
+            'detections': detections // args.repeat,
+            'peakRss': peakRss
+        }
+    except Exception as e:
+        results[backend] = {'error': str(e)}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the YOLO detector backends')
+    parser.add_argument('--images', help='The folder of images to detect on', default='./testing/areaImages')
+    parser.add_argument('--weights', help='The .pt weights, the onnx backends use the .onnx export next to them', default=YoloDetector.weights)
+    parser.add_argument('--backends', nargs='+', choices=BACKENDS, default=BACKENDS)
+    parser.add_argument('--confidence', type=float, default=0.6)
+    parser.add_argument('--threads', help='CPU threads per backend (0 = library default)', type=int, default=0)
+    parser.add_argument('--batch-size', type=int, default=10)
+    parser.add_argument('--tiled', help='Run the images through the tiled sliding window inference', action='store_true')
+    parser.add_argument('--window', help='Pixels per side of a tiled inference window', type=int, default=416)
+    parser.add_argument('--min-detail', help='Min mean edge strength of a tiled inference window, 0 runs every window', type=float, default=4.0)
+    parser.add_argument('--repeat', help='Number of timed passes over the images, the fastest is reported', type=int, default=3)
+    args = parser.parse_args()
+
+    manager = multiprocessing.Manager()
+    results = manager.dict()
+    for backend in args.backends:
+        process = multiprocessing.Process(target=benchmarkBackend, args=(backend, args, results))
+        process.start()
+        process.join()
+
+    print(f'{len(loadImages(args.images))} images from {args.images}\n')
+    print(f'{"backend":<12} {"load (s)":>10} {"ms/image":>10} {"detections":>11} {"peak RSS (MB)":>14}')
+    for backend in args.backends:
+        result = results.get(backend, {'error': 'did not run'})
+        if 'error' in result:
+            print(f'{backend:<12} skipped: {result["error"]}')
+            continue
+        print(f'{backend:<12} {result["load"]:>10.2f} {result["msPerImage"]:>10.1f} {result["detections"]:>11} {result["peakRss"]:>14.1f}')
@@ -0,0 +1,207 @@
+# Offline stand-ins for the benchmarks: a local synthetic website, a fake googlemaps.Client and a fetcher
+# that answers the google image search from the local site. Nothing here touches the network or a billed api key
+import hashlib # For the deterministic geocodes
+import os
+import random
+import threading # For the server thread
+import time # For the injected latency
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, quote
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+IMAGE_FOLDERS = ['testing/areaImages', 'testing/cameras', 'traing_data/images/train', 'traing_data/images/val']
+STREETS = ['High Street', 'Bell Street', 'Market Street', 'Church Road', 'Station Road', 'Park Lane', 'Mill Lane', 'King Street']
+TOWNS = [('Dundee', 'DD1'), ('Perth', 'PH1'), ('Aberdeen', 'AB10'), ('Glasgow', 'G1'), ('Edinburgh', 'EH1'), ('London', 'SW1A')]
+
+
+# The bytes of the images in testing/ and traing_data/, used for the image search results and the satellite images
+def loadFixtureImages(limit: int = None):
+    images = []
+    for folder in IMAGE_FOLDERS:
+        path = os.path.join(ROOT, folder)
+        if not os.path.isdir(path):
+            continue
+        for file in sorted(os.listdir(path)):
+            if file.lower().endswith(('.jpeg', '.jpg', '.png')):
+                with open(os.path.join(path, file), 'rb') as f:
+                    images.append(f.read())
+    if not images:
+        raise FileNotFoundError(f'No fixture images found in: {", ".join(IMAGE_FOLDERS)}')
+    return images[:limit] if limit else images
+
+
+# A synthetic website served from memory: pages pages in a tree of the given depth with extra cross links,
+# addressDensity of them mention one of sites physical addresses (written in a few different ways)
+class SyntheticSite():
+    pages = 200
+    depth = 3
+    addressDensity = 0.3 # The fraction of the pages that have an address on them
+    sites = 10 # The number of different physical addresses across the website
+    crossLinks = 3 # The extra links per page to random pages
+    mediaLinks = 0 # The links per page to images with no extension, only their Content-Type says they are not pages
+    latency = 0.0 # Seconds added to every response
+    seed = 0
+    server = None
+    def __init__(self, pages: int = 200, depth: int = 3, addressDensity: float = 0.3, sites: int = 10, crossLinks: int = 3, latency: float = 0.0, images: list = None, seed: int = 0, mediaLinks: int = 0):
+        self.pages = max(1, pages)
+        self.depth = max(1, depth)
+        self.addressDensity = addressDensity
+        self.sites = max(1, sites)
+        self.crossLinks = crossLinks
+        self.mediaLinks = mediaLinks
+        self.latency = latency
+        self.images = images or loadFixtureImages()
+        self.seed = seed
+        # Spread the pages over the levels so the crawl reaches all of them at the given depth
+        self.branching = 1
+        while sum(self.branching ** level for level in range(self.depth + 1)) < self.pages:
+            self.branching += 1
+        rng = random.Random(seed)
+        self.addresses = []
+        for i in range(self.sites):
+            town, district = rng.choice(TOWNS)
+            self.addresses.append((rng.randint(1, 200), rng.choice(STREETS), town, f'{district} {rng.randint(1, 9)}{rng.choice("ABDEFGHJLNPQRSTUWXYZ")}{rng.choice("ABDEFGHJLNPQRSTUWXYZ")}'))
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def children(self, page: int):
+        first = page * self.branching + 1
+        return [child for child in range(first, first + self.branching) if child < self.pages]
+
+    # One of the ways the site address is written on a page
+    def addressVariant(self, rng: random.Random, site: int):
+        number, street, town, postcode = self.addresses[site]
+        variants = [
+            f'<address>{number} {street}<br>{town} {postcode}</address>',
+            f'<address>{number} {street.replace("Street", "St").replace("Road", "Rd")}, {town.upper()} {postcode.replace(" ", "")}</address>',
+            f'<p>Visit us at {number} {street}, {town}, {postcode}</p>',
+            '<script type="application/ld+json">{"@type": "PostalAddress", '
+            f'"streetAddress": "{number} {street}", "addressLocality": "{town}", "postalCode": "{postcode}"}}</script>'
+        ]
+        return rng.choice(variants)
+
+    def page(self, page: int):
+        rng = random.Random(self.seed * 1000003 + page)
+        links = [f'{self.url}/{child}.html' for child in self.children(page)]
+        links += [f'{self.url}/{rng.randrange(self.pages)}.html' for _ in range(self.crossLinks)]
+        links += [f'{self.url}/images/{rng.randrange(len(self.images))}' for _ in range(self.mediaLinks)]
+        parts = [f'<html><head><title>Page {page}</title></head><body><nav>']
+        parts += [f'<a href="{link}">Link {i}</a>' for i, link in enumerate(links)]
+        parts.append('</nav><main>')
+        parts += [f'<p>Paragraph {i} of page {page}, some filler text about the company and its services.</p>' for i in range(rng.randint(5, 30))]
+        if rng.random() < self.addressDensity:
+            parts.append(self.addressVariant(rng, rng.randrange(self.sites)))
+        parts.append('</main></body></html>')
+        return ''.join(parts).encode('utf-8')
+
+    # The google image search stand-in: img tags pointing at the fixture images
+    def searchPage(self, query: str):
+        rng = random.Random(query)
+        picks = rng.sample(range(len(self.images)), min(20, len(self.images)))
+        return ''.join(f'<img src="{self.url}/images/{i}">' for i in picks).encode('utf-8')
+
+    def start(self):
+        site = self
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if site.latency:
+                    time.sleep(site.latency)
+                path = urlsplit(self.path)
+                body, contentType = None, 'text/html'
+                if path.path.endswith('.html') and path.path[1:-5].isdigit() and int(path.path[1:-5]) < site.pages:
+                    body = site.page(int(path.path[1:-5]))
+                elif path.path == '/search':
+                    body = site.searchPage(path.query)
+                elif path.path.startswith('/images/') and path.path[8:].isdigit() and int(path.path[8:]) < len(site.images):
+                    body, contentType = site.images[int(path.path[8:])], 'image/jpeg'
+                if body is None:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', contentType)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass # Keep the benchmark output clean
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, name='oslfp-fixture-site', daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+# Stand-in for googlemaps.Client with canned geocode, places_nearby and static_map responses.
+# Each request sleeps for latency seconds to act like the api round trip
+class FakeMapsClient():
+    latency = 0.05
+    places = 5 # The number of nearby places returned
+    def __init__(self, latency: float = 0.05, images: list = None, places: int = 5):
+        self.latency = latency
+        self.images = images or loadFixtureImages()
+        self.places = places
+        self.calls = {'geocode': 0, 'places_nearby': 0, 'static_map': 0}
+        self.lock = threading.Lock()
+
+    def request(self, kind: str):
+        with self.lock:
+            self.calls[kind] += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    # The same address always geocodes to the same place
+    def geocode(self, address: str, **kwargs):
+        self.request('geocode')
+        key = ' '.join(address.lower().replace(',', ' ').split())
+        digest = int(hashlib.sha1(key.encode('utf-8')).hexdigest(), 16)
+        lat, lng = 50 + (digest % 10000) / 1000, -5 + (digest // 10000 % 10000) / 1000
+        return [{
+            'formatted_address': address,
+            'types': ['street_address'],
+            'place_id': f'fake-{digest % 10 ** 12}',
+            'geometry': {
+                'location': {'lat': lat, 'lng': lng},
+                'viewport': {'northeast': {'lat': lat + 0.001, 'lng': lng + 0.001}, 'southwest': {'lat': lat - 0.001, 'lng': lng - 0.001}}
+            }
+        }]
+
+    def places_nearby(self, location=None, radius=None, **kwargs):
+        self.request('places_nearby')
+        lat, lng = location
+        return {'results': [{
+            'name': f'Place {i}',
+            'place_id': f'fake-place-{lat:.4f}-{lng:.4f}-{i}',
+            'types': ['establishment'],
+            'geometry': {'location': {'lat': lat + i * 0.0001, 'lng': lng - i * 0.0001}},
+            'vicinity': f'{i} Nearby Road'
+        } for i in range(self.places)]}
+
+    def static_map(self, size=None, center=None, zoom=None, maptype=None, **kwargs):
+        self.request('static_map')
+        lat, lng = center
+        return iter([self.images[int(abs(lat * 1000 + lng * 1000)) % len(self.images)]])
+
+
+# Wraps the scan's fetcher so the google image search made by the ImageVulnProcessor is answered by the local site
+class FixtureFetcher():
+    fetcher = None
+    site = None
+    def __init__(self, fetcher, site: SyntheticSite):
+        self.fetcher = fetcher
+        self.site = site
+
+    def __getattr__(self, name):
+        return getattr(self.fetcher, name)
+
+    def fetch(self, url: str, headers: dict = None, maxBytes: int = None, contentTypes: tuple = None):
+        if url.startswith('https://www.google.com/search'):
+            url = f'{self.site.url}/search?{quote(urlsplit(url).query, safe="=&")}'
+        return self.fetcher.fetch(url, headers=headers, maxBytes=maxBytes, contentTypes=contentTypes)
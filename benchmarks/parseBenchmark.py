@@ -0,0 +1,96 @@
+# Compare the parse time and the addresses found per page of the old full BeautifulSoup parse against addressExtractor
+# Run from the root of the repo: python benchmarks/parseBenchmark.py [--pages ./savedPages | --crawl-cache ./scans/crawlCache.sqlite]
+import argparse
+import os
+import sys
+import time
+from bs4 import BeautifulSoup
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import addressExtractor
+from crawlCache import CrawlCache
+
+
+# The parse the crawler did before addressExtractor: a full html.parser tree, then the address and a tags
+def fullSoupParse(content: bytes):
+    soup = BeautifulSoup(content.decode('utf-8', errors='replace'), 'html.parser')
+    addresses = [" ".join(address.text.split()) for address in soup.find_all('address')]
+    links = [link.get('href') for link in soup.find_all('a') if link.get('href') and link.get('href').startswith('http')]
+    return addresses, links
+
+
+# A large page like a store locator: lots of markup and links, the addresses in a mix of address tags, JSON-LD and plain text
+def syntheticPage(index: int, stores: int = 200):
+    parts = ['<html><head><title>Stores</title><style>.store{margin:0}</style>']
+    parts.append('<script type="application/ld+json">{"@context": "https://schema.org", "@type": "Organization", "name": "Shop", '
+                 f'"address": {{"@type": "PostalAddress", "streetAddress": "{index} Bell Street", "addressLocality": "Dundee", "postalCode": "DD1 1HG", "addressCountry": "UK"}}}}</script>')
+    parts.append('<script>var analytics = {"page": "stores"};</script></head><body><nav>')
+    parts.extend(f'<a href="https://example.com/section/{i}">Section {i}</a>' for i in range(50))
+    parts.append('</nav><main>')
+    for store in range(stores):
+        parts.append(f'<div class="store"><h2>Store {store}</h2><p>Open <b>9am</b> to <i>5pm</i>, <a href="/stores/{store}">details</a></p>')
+        if store % 3 == 0:
+            parts.append(f'<address>{store} High Street<br>London SW1A {store % 10}AA</address>')
+        elif store % 3 == 1:
+            parts.append(f'<p>{store} Market St, San Francisco, CA 94{store % 1000:03d}</p>')
+        else:
+            parts.append(f'<p>Call us on 01382 {store:06d} for directions</p>')
+        parts.append('</div>')
+    parts.append('</main><footer><a href="https://example.com/contact">Contact</a></footer></body></html>')
+    return "".join(parts).encode('utf-8')
+
+
+def loadPages(args):
+    if args.pages:
+        pages = []
+        for file in sorted(os.listdir(args.pages)):
+            with open(os.path.join(args.pages, file), 'rb') as f:
+                pages.append(f.read())
+        return pages, args.pages
+    if args.crawl_cache:
+        cache = CrawlCache(args.crawl_cache)
+        urls = [row[0] for row in cache.db.execute('SELECT url FROM pages')]
+        pages = [body for body in (cache.getBody(url) for url in urls) if body]
+        cache.close()
+        return pages, args.crawl_cache
+    return [syntheticPage(index) for index in range(args.synthetic)], 'synthetic store locator pages'
+
+
+def benchmark(parse, pages: list, repeat: int):
+    timings = []
+    for _ in range(repeat):
+        startTime = time.perf_counter()
+        results = [parse(page) for page in pages]
+        timings.append(time.perf_counter() - startTime)
+    addresses = sum(len(found) for found, links in results)
+    links = sum(len(links) for found, links in results)
+    return min(timings) / len(pages) * 1000, addresses, links
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the html parsing used to find the addresses')
+    parser.add_argument('--pages', help='A folder of saved html pages')
+    parser.add_argument('--crawl-cache', help='Use the page bodies stored in a crawl cache')
+    parser.add_argument('--synthetic', help='Number of synthetic pages when no pages are given', type=int, default=20)
+    parser.add_argument('--repeat', help='Number of timed passes over the pages, the fastest is reported', type=int, default=3)
+    args = parser.parse_args()
+
+    pages, source = loadPages(args)
+    if not pages:
+        sys.exit(f'No pages found in {source}')
+    parsers = [('soup html.parser', fullSoupParse), ('extractPage', addressExtractor.extractPage)]
+
+    # The lxml parser and the bs4 fallback have to find the same addresses and links, or the scan depends on what is installed
+    if addressExtractor.etree is not None:
+        different = [index for index, page in enumerate(pages) if addressExtractor.parseTargetTagsLxml(page) != addressExtractor.parseTargetTagsSoup(page)]
+        if different:
+            sys.exit(f'lxml and the bs4 fallback disagree on {len(different)} of {len(pages)} pages, eg: page {different[0]}')
+        print(f'lxml and the bs4 fallback agree on all {len(pages)} pages')
+
+    print(f'{len(pages)} pages ({sum(len(page) for page in pages) / 1024 / len(pages):.0f}KB avg) from {source}, extractPage is using {"lxml" if addressExtractor.etree is not None else "the bs4 fallback"}\n')
+    print(f'{"parser":<18} {"ms/page":>10} {"addresses":>10} {"links":>8}')
+    baseline = None
+    for name, parse in parsers:
+        msPerPage, addresses, links = benchmark(parse, pages, args.repeat)
+        baseline = baseline or msPerPage
+        print(f'{name:<18} {msPerPage:>10.2f} {addresses:>10} {links:>8}   {baseline / msPerPage:.1f}x')
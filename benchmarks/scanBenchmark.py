@@ -0,0 +1,139 @@
+# End to end benchmark of a scan with no network or api key: the crawl runs against a local synthetic website,
+# google maps is a fake client with injected latency and the image search is answered with the images in testing/ and traing_data/
+# Run from the root of the repo: python benchmarks/scanBenchmark.py --pages 500 --depth 3 --maps-latency 0.05
+import argparse
+import contextlib
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import main
+from metrics import metrics
+from yoloDetector import BACKENDS, YoloDetector, createDetector
+from detectionService import DetectionService
+from fixtures import SyntheticSite, FakeMapsClient, FixtureFetcher, loadFixtureImages
+
+# The spans reported per part of the scan, in the order they happen
+REPORTED_SPANS = [
+    ('findLocationFromURLs', ['crawl', 'fetch', 'parse']),
+    ('AddressHandler', ['locations', 'stage geocode', 'geocode', 'stage imagery', 'static_map', 'places', 'stage render', 'map render']),
+    ('ImageVulnProcessor', ['stage detection', 'image search', 'image download', 'detect', 'inference']),
+    ('report', ['report'])
+]
+
+
+# Stands in for the YOLO model when no backend can be loaded, so the rest of the pipeline can still be measured
+class NullDetector():
+    backend = "none"
+    weights = "none"
+    def detect(self, images: list):
+        return [np.zeros((0, 6), dtype=np.float32) for image in images]
+
+
+# The scan with the stand-ins swapped in for google maps and the image search
+class BenchmarkScan(main.OpenSourceLocationFingerPrint):
+    site = None
+    mapsClient = None
+    model = None
+
+    def setUpGoogleMapsAPI(self):
+        self.googleMapsClient = self.mapsClient
+        return True
+
+    def setUpFetcher(self):
+        super().setUpFetcher()
+        self.fetcher = FixtureFetcher(self.fetcher, self.site)
+        return True
+
+    def setUpDetector(self):
+        self.detectionService = DetectionService(self.model, self.logger, batchSize=self.args.batch_size, deadline=self.args.batch_deadline / 1000)
+        self.detector = self.detectionService
+        return True
+
+
+def loadModel(args):
+    if args.detector == 'none':
+        return NullDetector()
+    try:
+        return createDetector(args.detector, os.path.abspath(args.weights), confidence=0.6, threads=args.detector_threads)
+    except Exception as e:
+        print(f'Could not load the {args.detector} detector ({e}), measuring with no detector')
+        return NullDetector()
+
+
+def runScan(site: SyntheticSite, mapsClient: FakeMapsClient, model, args):
+    scanArgs = ['-u', f'{site.url}/0.html', '-d', str(args.depth), '-t', str(args.threads), '--engine', args.engine,
+                '--no-crawl-cache', '--no-maps-cache', '--no-hash-cache', '-sl', str(args.scanlimit)]
+    if args.no_vuln:
+        scanArgs.append('--no-vuln')
+    main.args = main.parseArguments(scanArgs)
+    BenchmarkScan.site, BenchmarkScan.mapsClient, BenchmarkScan.model = site, mapsClient, model
+    metrics.reset()
+    startTime = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()): # The report and the logs are not part of the numbers
+        scan = BenchmarkScan()
+    elapsed = time.perf_counter() - startTime
+    return elapsed, metrics.profile(), len(scan.addressSet), len(scan.knownLocations)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark a whole scan offline against a synthetic website and a fake google maps client')
+    parser.add_argument('--pages', help='Number of pages in the synthetic website', type=int, default=200)
+    parser.add_argument('--depth', help='Depth of the website and of the crawl', type=int, default=3)
+    parser.add_argument('--address-density', help='Fraction of the pages with an address on them', type=float, default=0.3)
+    parser.add_argument('--sites', help='Number of different physical addresses across the website', type=int, default=10)
+    parser.add_argument('--media-links', help='Number of links per page to images that are not pages', type=int, default=0)
+    parser.add_argument('--site-latency', help='Seconds added to every response of the website', type=float, default=0.0)
+    parser.add_argument('--maps-latency', help='Seconds added to every fake google maps request', type=float, default=0.05)
+    parser.add_argument('--threads', help='Crawl workers', type=int, default=10)
+    parser.add_argument('--engine', choices=['thread', 'async'], default='thread')
+    parser.add_argument('--scanlimit', help='Images per location sent to detection', type=int, default=10)
+    parser.add_argument('--detector', choices=BACKENDS + ['none'], default='none')
+    parser.add_argument('--weights', default=YoloDetector.weights)
+    parser.add_argument('--detector-threads', type=int, default=0)
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--no-vuln', help='Skip the vulnerability scan', action='store_true')
+    parser.add_argument('--repeat', help='Number of scans, the fastest is reported', type=int, default=1)
+    parser.add_argument('--json', help='Also write the profile of the fastest scan to this file')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    images = loadFixtureImages()
+    site = SyntheticSite(args.pages, args.depth, args.address_density, args.sites, latency=args.site_latency, images=images, seed=args.seed, mediaLinks=args.media_links).start()
+    model = None if args.no_vuln else loadModel(args)
+    workingFolder = tempfile.mkdtemp(prefix='oslfp-benchmark-')
+    rootFolder = os.getcwd()
+    os.chdir(workingFolder) # The scan folders are written here instead of ./scans
+    try:
+        runs = []
+        for _ in range(args.repeat):
+            mapsClient = FakeMapsClient(args.maps_latency, images=images)
+            runs.append(runScan(site, mapsClient, model, args) + (dict(mapsClient.calls),))
+    finally:
+        os.chdir(rootFolder)
+        shutil.rmtree(workingFolder, ignore_errors=True)
+        site.stop()
+
+    elapsed, profile, addresses, locations, calls = min(runs, key=lambda run: run[0])
+    counters = profile['counters']
+    print(f'{args.pages} pages, depth {args.depth}, {args.sites} sites, maps latency {args.maps_latency * 1000:.0f}ms, '
+          f'{args.engine} engine, detector {getattr(model, "backend", "off")}, {len(images)} fixture images\n')
+    print(f'End to end: {elapsed:.2f}s, {counters.get("pages", 0)} pages ({counters.get("pages", 0) / elapsed:.1f} pages/sec), '
+          f'{counters.get("skipped pages", 0)} non html skipped, {addresses} addresses -> {locations} locations, {counters.get("images", 0)} images, {counters.get("detections", 0)} detections')
+    print(f'Google maps calls: {", ".join(f"{kind} {count}" for kind, count in calls.items())}\n')
+    print(f'{"span":<22} {"count":>6} {"total (s)":>10} {"mean ms":>9} {"p50 ms":>9} {"p90 ms":>9} {"max ms":>9}')
+    for part, spans in REPORTED_SPANS:
+        print(part)
+        for name in spans:
+            span = profile['spans'].get(name)
+            if span:
+                print(f'  {name:<20} {span["count"]:>6} {span["totalSeconds"]:>10.2f} {span["meanMs"]:>9.1f} {span["p50Ms"]:>9.1f} {span["p90Ms"]:>9.1f} {span["maxMs"]:>9.1f}')
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'elapsedSeconds': elapsed, 'mapsCalls': calls, 'addresses': addresses, 'locations': locations, **profile}, f, indent=2)
@@ -0,0 +1,109 @@
+import cv2
+import numpy as np
+
+# The HSV ranges of the satellite images (OpenCV hues are 0-179), from the buildings research notebook
+ROOF_RANGES = [
+    ((0, 0, 90), (179, 60, 250)), # Grey, white and dark roofs (low saturation)
+    ((0, 28, 70), (27, 255, 255)), # Red, brown and orange tiled roofs
+    ((160, 28, 70), (179, 255, 255)) # The reds that wrap around the hue circle
+]
+VEGETATION_RANGE = ((35, 40, 30), (90, 255, 255)) # Grass and trees are never a roof
+
+
+# Building footprints and perimeter barriers (walls, fences, hedges) from satellite images with OpenCV and numpy only,
+# at a few milliseconds per image so it can run on every location before the YOLO pass. The images of a batch are stacked
+# into one tall image (padded to the same width with blank rows between them) so every OpenCV call runs once per batch,
+# and the components, contours and line segments are sorted back to their image by their rows.
+# Has the same detect interface as the detectors (so the DetectionService can batch it), the results are in pixels
+class FootprintExtractor():
+    minArea = 40 # The min pixels of a footprint
+    maxArea = 0.5 # The max fraction of its image a footprint can cover, bigger ones are a field or car park
+    minFill = 0.45 # The min fraction of its bounding box a footprint fills, roads and shadows fill less
+    maxElongation = 6.0 # The max length / width of a footprint, roads are longer
+    minBarrierLength = 25 # The min pixels of a straight edge that counts as a barrier
+    gap = 16 # The blank rows between two images of a batch, more than any kernel reaches
+    def __init__(self, minArea: int = 40, minBarrierLength: int = 25):
+        self.minArea = minArea
+        self.minBarrierLength = minBarrierLength
+
+    # Stack the images into one tall image. Returns the stack, the mask of the real pixels and the first row of each image
+    def stack(self, images: list):
+        width = max(image.shape[1] for image in images)
+        heights = np.array([image.shape[0] for image in images])
+        offsets = np.concatenate([[0], np.cumsum(heights + self.gap)[:-1]])
+        tall = np.zeros((int(heights.sum() + self.gap * len(images)), width, 3), dtype=np.uint8)
+        valid = np.zeros(tall.shape[:2], dtype=np.uint8)
+        for image, offset in zip(images, offsets):
+            height, imageWidth = image.shape[:2]
+            tall[offset:offset + height, :imageWidth] = image if image.ndim == 3 else cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
+            valid[offset:offset + height, :imageWidth] = 255
+        return tall, valid, offsets
+
+    # Roof coloured pixels that are not vegetation, cleaned of speckle and with the small holes closed
+    def roofMask(self, tall: np.ndarray, valid: np.ndarray):
+        hsv = cv2.cvtColor(tall, cv2.COLOR_BGR2HSV)
+        roofs = np.zeros(valid.shape, dtype=np.uint8)
+        for low, high in ROOF_RANGES:
+            roofs |= cv2.inRange(hsv, low, high)
+        roofs &= ~cv2.inRange(hsv, *VEGETATION_RANGE) & valid
+        roofs = cv2.morphologyEx(roofs, cv2.MORPH_OPEN, np.ones((3, 3), dtype=np.uint8))
+        return cv2.morphologyEx(roofs, cv2.MORPH_CLOSE, cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (5, 5)))
+
+    # Keep the roof components shaped like a building, judged on the component stats of the whole batch at once
+    def footprintMask(self, roofs: np.ndarray, offsets: np.ndarray, imageAreas: np.ndarray):
+        count, labels, stats, centroids = cv2.connectedComponentsWithStats(roofs, connectivity=4)
+        area = stats[:, cv2.CC_STAT_AREA]
+        width, height = stats[:, cv2.CC_STAT_WIDTH], stats[:, cv2.CC_STAT_HEIGHT]
+        owner = np.searchsorted(offsets, stats[:, cv2.CC_STAT_TOP], side='right') - 1
+        keep = ((area >= self.minArea) & (area <= imageAreas[owner] * self.maxArea) & (area / (width * height) >= self.minFill)
+                & (np.maximum(width, height) <= np.minimum(width, height) * self.maxElongation))
+        keep[0] = False # The background
+        return keep.astype(np.uint8)[labels] * 255
+
+    # The straight edges outside the footprints long enough to be a wall, fence or hedge line: [x1, y1, x2, y2] rows
+    def barrierLines(self, tall: np.ndarray, valid: np.ndarray, footprints: np.ndarray):
+        edges = cv2.Canny(cv2.GaussianBlur(cv2.cvtColor(tall, cv2.COLOR_BGR2GRAY), (3, 3), 0), 60, 160)
+        edges &= cv2.erode(valid, np.ones((5, 5), dtype=np.uint8)) # The edges of the padding are not in the image
+        edges &= ~cv2.dilate(footprints, np.ones((7, 7), dtype=np.uint8)) # The outlines of the buildings are not barriers
+        lines = cv2.HoughLinesP(edges, 1, np.pi / 180, threshold=30, minLineLength=self.minBarrierLength, maxLineGap=3)
+        return np.zeros((0, 4), dtype=np.int64) if lines is None else lines.reshape(-1, 4).astype(np.int64)
+
+    # One result per image: the footprint polygons ([[x, y], ...] pixel corners), their areas and perimeters, the barrier
+    # segments and their total length (pixels) and the fraction of the image that is built on
+    def detect(self, images: list):
+        if not images:
+            return []
+        tall, valid, offsets = self.stack(images)
+        heights = np.array([image.shape[0] for image in images])
+        imageAreas = heights * np.array([image.shape[1] for image in images])
+        footprints = self.footprintMask(self.roofMask(tall, valid), offsets, imageAreas)
+        results = [{'footprints': [], 'areas': [], 'perimeters': [], 'barriers': [], 'barrierLength': 0.0, 'builtFraction': 0.0} for _ in images]
+
+        # The built fraction of every image from the footprint pixels of each row
+        rowCounts = np.count_nonzero(footprints, axis=1)
+        built = np.add.reduceat(rowCounts, offsets)
+        for result, pixels, area in zip(results, built, imageAreas):
+            result['builtFraction'] = round(float(pixels / area), 4)
+
+        contours, hierarchy = cv2.findContours(footprints, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        if contours:
+            owners = np.searchsorted(offsets, [contour[0, 0, 1] for contour in contours], side='right') - 1
+            for contour, owner in zip(contours, owners):
+                polygon = cv2.approxPolyDP(contour, 0.02 * cv2.arcLength(contour, True), True).reshape(-1, 2)
+                polygon[:, 1] -= offsets[owner]
+                results[owner]['footprints'].append(polygon.tolist())
+                results[owner]['areas'].append(float(cv2.contourArea(polygon)))
+                results[owner]['perimeters'].append(float(cv2.arcLength(polygon, True)))
+
+        lines = self.barrierLines(tall, valid, footprints)
+        if len(lines):
+            owners = np.searchsorted(offsets, lines[:, 1], side='right') - 1
+            inside = owners == np.searchsorted(offsets, lines[:, 3], side='right') - 1
+            lines, owners = lines[inside], owners[inside]
+            lines[:, [1, 3]] -= offsets[owners][:, None]
+            lengths = np.hypot(lines[:, 2] - lines[:, 0], lines[:, 3] - lines[:, 1])
+            totals = np.bincount(owners, weights=lengths, minlength=len(images))
+            for index, result in enumerate(results):
+                result['barriers'] = lines[owners == index].tolist()
+                result['barrierLength'] = round(float(totals[index]), 1)
+        return results
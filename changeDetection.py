@@ -0,0 +1,110 @@
+import glob # For finding the earlier scans of a place
+import os
+import cv2
+import numpy as np
+
+# Custom imports
+from tiledInference import mergeBoxes
+
+IMAGERY_FILE = "imagery.npz" # The hashes and detections of the images of a location, the baseline of the next scan
+
+
+# The folder of the latest earlier scan of a place (./scans/<scanID>/<placeId>) that has fileName to compare with,
+# or the folder of baselineScan when it is given. None when the place was never scanned before
+def findPreviousLocation(placeId: str, currentFolder: str, fileName: str, baselineScan: str = None, scansFolder: str = "./scans"):
+    if baselineScan:
+        folder = f'{scansFolder}/{baselineScan}/{placeId}'
+        return folder if os.path.exists(f'{folder}/{fileName}') else None
+    current = os.path.normpath(currentFolder)
+    candidates = [os.path.dirname(path) for path in glob.glob(f'{scansFolder}/*/{glob.escape(placeId)}/{fileName}')]
+    candidates = [folder for folder in candidates if os.path.normpath(folder) != current]
+    if not candidates:
+        return None
+    return max(candidates, key=lambda folder: os.path.getmtime(f'{folder}/{fileName}'))
+
+
+# The previous images of a location: their hashes, sources and detections (one array per image), None if there are none
+def loadImagery(folder: str):
+    path = f'{folder}/{IMAGERY_FILE}'
+    if not folder or not os.path.exists(path):
+        return None
+    arrays = np.load(path)
+    rows = arrays['boxes']
+    return {
+        'hashes': arrays['hashes'].astype(np.uint64),
+        'sources': arrays['sources'].tolist(),
+        'boxes': [rows[rows[:, 0] == index, 1:] for index in range(len(arrays['hashes']))]
+    }
+
+
+# Save the hashes, sources and detections of the images of a location for the next scan to compare with
+def saveImagery(folder: str, hashes: np.ndarray, sources: list, detections: list):
+    if not os.path.exists(folder):
+        os.makedirs(folder)
+    rows = [np.column_stack([np.full(len(boxes), index, dtype=np.float32), boxes]) for index, boxes in enumerate(detections) if len(boxes)]
+    np.savez_compressed(f'{folder}/{IMAGERY_FILE}', hashes=np.asarray(hashes, dtype=np.uint64), sources=np.array(sources, dtype=str),
+                        boxes=np.concatenate(rows).astype(np.float32) if rows else np.zeros((0, 7), dtype=np.float32))
+
+
+# Align the previous image onto the current one (translation by phase correlation) and mark the pixels that changed.
+# Returns the changed mask (uint8 0/255, the size of current) and the fraction of the image that changed
+def changedMask(previous: np.ndarray, current: np.ndarray, threshold: int = 30, blur: int = 5):
+    height, width = current.shape[:2]
+    if previous.shape[:2] != (height, width):
+        previous = cv2.resize(previous, (width, height), interpolation=cv2.INTER_AREA)
+    previousGrey = cv2.GaussianBlur(cv2.cvtColor(previous, cv2.COLOR_BGR2GRAY), (blur, blur), 0).astype(np.float32)
+    currentGrey = cv2.GaussianBlur(cv2.cvtColor(current, cv2.COLOR_BGR2GRAY), (blur, blur), 0).astype(np.float32)
+    (shiftX, shiftY), response = cv2.phaseCorrelate(previousGrey, currentGrey)
+    if response > 0.1 and (abs(shiftX) > 0.5 or abs(shiftY) > 0.5):
+        previousGrey = cv2.warpAffine(previousGrey, np.float32([[1, 0, shiftX], [0, 1, shiftY]]), (width, height), borderMode=cv2.BORDER_REPLICATE)
+    # Match the brightness of the two images so a change of light or season is not read as a change
+    previousGrey = (previousGrey - previousGrey.mean()) / (previousGrey.std() + 1e-6) * currentGrey.std() + currentGrey.mean()
+    difference = np.abs(currentGrey - previousGrey)
+    mask = (difference > threshold).astype(np.uint8) * 255
+    kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (5, 5))
+    mask = cv2.morphologyEx(cv2.morphologyEx(mask, cv2.MORPH_OPEN, kernel), cv2.MORPH_CLOSE, kernel)
+    return mask, float(np.count_nonzero(mask)) / mask.size
+
+
+# The boxes [x, y, width, height] around the changed regions of a mask, padded and at least minSize per side
+def changedRegions(mask: np.ndarray, padding: int = 32, minSize: int = 64, minArea: int = 16):
+    count, labels, stats, centroids = cv2.connectedComponentsWithStats(mask, connectivity=8)
+    stats = stats[1:][stats[1:, cv2.CC_STAT_AREA] >= minArea] # Row 0 is the background
+    if len(stats) == 0:
+        return np.zeros((0, 4), dtype=np.int64)
+    height, width = mask.shape[:2]
+    x1 = np.clip(stats[:, 0] - padding, 0, width)
+    y1 = np.clip(stats[:, 1] - padding, 0, height)
+    x2 = np.clip(np.maximum(stats[:, 0] + stats[:, 2] + padding, x1 + minSize), 0, width)
+    y2 = np.clip(np.maximum(stats[:, 1] + stats[:, 3] + padding, y1 + minSize), 0, height)
+    return np.stack([x1, y1, x2 - x1, y2 - y1], axis=1)
+
+
+# The detections of a crop mapped back to the image it was cut from, boxes rows are [class id, confidence, x centre, y centre, width, height]
+def cropToImage(boxes: np.ndarray, region, shape: tuple):
+    x, y, regionWidth, regionHeight = region
+    height, width = shape[:2]
+    mapped = boxes.copy()
+    mapped[:, 2] = (x + boxes[:, 2] * regionWidth) / width
+    mapped[:, 3] = (y + boxes[:, 3] * regionHeight) / height
+    mapped[:, 4] = boxes[:, 4] * regionWidth / width
+    mapped[:, 5] = boxes[:, 5] * regionHeight / height
+    return mapped
+
+
+# The detections whose centre is outside the changed mask, they still hold for the current image
+def unchangedBoxes(boxes: np.ndarray, mask: np.ndarray):
+    if len(boxes) == 0:
+        return boxes
+    height, width = mask.shape[:2]
+    columns = np.clip((boxes[:, 2] * width).astype(np.int64), 0, width - 1)
+    rows = np.clip((boxes[:, 3] * height).astype(np.int64), 0, height - 1)
+    return boxes[mask[rows, columns] == 0]
+
+
+# Merge the carried and the new detections of an image that are the same object, rows as in cropToImage
+def mergeDetections(boxes: np.ndarray, iou: float = 0.3, containment: float = 0.7):
+    if len(boxes) < 2:
+        return boxes
+    corners = np.column_stack([boxes[:, 2] - boxes[:, 4] / 2, boxes[:, 3] - boxes[:, 5] / 2, boxes[:, 2] + boxes[:, 4] / 2, boxes[:, 3] + boxes[:, 5] / 2])
+    return boxes[mergeBoxes(corners, boxes[:, 1], boxes[:, 0], iou, containment)]
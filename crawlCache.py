@@ -0,0 +1,179 @@
+import hashlib # For the body fingerprint
+import json # For storing the extracted addresses and links
+import os # For creating the scans folder
+import sqlite3 # For the on disk cache
+import threading # For sharing the connection between the crawl workers
+import time # For the last access time used by the eviction
+import zlib # Fallback compression when zstandard is not installed
+from urllib.parse import urlsplit, urlunsplit # For the canonical url
+
+try:
+    import zstandard # Optional: smaller and faster compression of the page bodies
+except ImportError:
+    zstandard = None
+
+
+# Canonical form of a url so that trivial variants share a cache entry
+def canonicalUrl(url: str):
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or '').lower()
+    port = parts.port
+    if port and not ((scheme == 'http' and port == 80) or (scheme == 'https' and port == 443)):
+        host = f'{host}:{port}'
+    return urlunsplit((scheme, host, parts.path or '/', parts.query, '')) # The fragment is never sent to the server
+
+
+# Persistent crawl cache under ./scans, keeps the validators, the compressed body and what was extracted from each page
+class CrawlCache():
+    path = "./scans/crawlCache.sqlite"
+    maxBytes = 512 * 1024 * 1024 # The max size of the stored bodies before the least recently used pages are evicted
+    totalBytes = 0
+    hits = 0 # Pages that were unchanged since the last scan (304 or the same body)
+    misses = 0 # Pages that had to be parsed
+    revalidated = 0 # Pages the server confirmed as unchanged with a 304
+    evicted = 0
+    def __init__(self, path: str = None, maxBytes: int = None):
+        if path:
+            self.path = path
+        if maxBytes:
+            self.maxBytes = maxBytes
+        folder = os.path.dirname(self.path)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder)
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+        self.db.execute('PRAGMA journal_mode=WAL') # The processes of a batch scan read and write the cache at the same time
+        self.db.execute('''CREATE TABLE IF NOT EXISTS pages (
+            url TEXT PRIMARY KEY,
+            etag TEXT,
+            lastModified TEXT,
+            fingerprint TEXT,
+            codec TEXT,
+            body BLOB,
+            size INTEGER,
+            addresses TEXT,
+            links TEXT,
+            lastAccess REAL
+        )''')
+        self.db.execute('CREATE INDEX IF NOT EXISTS pagesLastAccess ON pages (lastAccess)')
+        self.db.commit()
+        self.totalBytes = self.db.execute('SELECT COALESCE(SUM(size), 0) FROM pages').fetchone()[0]
+
+    def compress(self, body: bytes):
+        if zstandard:
+            return 'zstd', zstandard.ZstdCompressor().compress(body)
+        return 'zlib', zlib.compress(body)
+
+    def decompress(self, codec: str, blob: bytes):
+        if codec == 'zstd':
+            if not zstandard:
+                return None
+            return zstandard.ZstdDecompressor().decompress(blob)
+        return zlib.decompress(blob)
+
+    # Get the cached entry of a url or None
+    def get(self, url: str):
+        with self.lock:
+            row = self.db.execute('SELECT etag, lastModified, fingerprint, addresses, links FROM pages WHERE url = ?', (canonicalUrl(url),)).fetchone()
+        if not row:
+            return None
+        return {
+            'etag': row[0],
+            'lastModified': row[1],
+            'fingerprint': row[2],
+            'addresses': json.loads(row[3]),
+            'links': json.loads(row[4])
+        }
+
+    # Get the stored body of a url, None if it is not cached or the codec is not installed
+    def getBody(self, url: str):
+        with self.lock:
+            row = self.db.execute('SELECT codec, body FROM pages WHERE url = ?', (canonicalUrl(url),)).fetchone()
+        if not row:
+            return None
+        return self.decompress(row[0], row[1])
+
+    # The headers to revalidate a cached entry with the server
+    def conditionalHeaders(self, entry: dict):
+        headers = {}
+        if entry:
+            if entry['etag']:
+                headers['If-None-Match'] = entry['etag']
+            if entry['lastModified']:
+                headers['If-Modified-Since'] = entry['lastModified']
+        return headers
+
+    def fingerprint(self, body: bytes):
+        return hashlib.sha1(body).hexdigest()
+
+    # Check if a response can reuse the cached entry, counts the hit or the miss
+    def isUnchanged(self, entry: dict, res):
+        unchanged = False
+        if entry:
+            if res.status_code == 304:
+                unchanged = True
+                with self.lock:
+                    self.revalidated += 1
+            elif res.status_code == 200 and entry['fingerprint'] == self.fingerprint(res.content):
+                unchanged = True # The server does not send validators but the body has not changed
+        with self.lock:
+            if unchanged:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return unchanged
+
+    # Mark a cached entry as used so it is evicted last
+    def touch(self, url: str):
+        with self.lock:
+            self.db.execute('UPDATE pages SET lastAccess = ? WHERE url = ?', (time.time(), canonicalUrl(url)))
+            self.db.commit()
+
+    # Store a fetched page with the addresses and links that were extracted from it. A body cut short at the size cap is
+    # not stored, a later crawl would reuse the partial page and its addresses as if it were the whole page
+    def store(self, url: str, res, addresses: list, links: list):
+        if getattr(res, 'truncated', False):
+            return
+        codec, blob = self.compress(res.content)
+        row = (
+            canonicalUrl(url),
+            res.headers.get('ETag'),
+            res.headers.get('Last-Modified'),
+            self.fingerprint(res.content),
+            codec,
+            blob,
+            len(blob),
+            json.dumps(addresses),
+            json.dumps(links),
+            time.time()
+        )
+        with self.lock:
+            previous = self.db.execute('SELECT size FROM pages WHERE url = ?', (row[0],)).fetchone()
+            if previous:
+                self.totalBytes -= previous[0]
+            self.db.execute('INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', row)
+            self.totalBytes += len(blob)
+            self.evict()
+            self.db.commit()
+
+    # Drop the least recently used pages until the cache fits in maxBytes (called with the lock held)
+    def evict(self):
+        if self.totalBytes <= self.maxBytes:
+            return
+        for url, size in self.db.execute('SELECT url, size FROM pages ORDER BY lastAccess').fetchall():
+            if self.totalBytes <= self.maxBytes:
+                break
+            self.db.execute('DELETE FROM pages WHERE url = ?', (url,))
+            self.totalBytes -= size
+            self.evicted += 1
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        hitRate = self.hits / lookups * 100 if lookups else 0
+        return f'{self.hits} hits, {self.misses} misses ({hitRate:.1f}% hit rate), {self.revalidated} revalidated with a 304, {self.evicted} evicted, {self.totalBytes / (1024 * 1024):.1f}MB stored'
+
+    def close(self):
+        with self.lock:
+            self.db.commit()
+            self.db.close()
@@ -0,0 +1,146 @@
+import heapq # For the best first queue
+import itertools # For the insertion order of the queued urls
+import re # For the link hints
+import threading # For the frontier lock
+from urllib.parse import urlsplit # For the extension and the domain of a url
+
+# The extensions of the links that are never html pages (documents, media, archives, assets), they are not crawled
+SKIPPED_EXTENSIONS = {
+    'pdf', 'doc', 'docx', 'xls', 'xlsx', 'ppt', 'pptx', 'odt', 'ods', 'csv', 'rtf', 'txt',
+    'jpg', 'jpeg', 'png', 'gif', 'svg', 'webp', 'bmp', 'tif', 'tiff', 'ico', 'heic',
+    'mp4', 'mov', 'avi', 'mkv', 'webm', 'wmv', 'flv', 'm4v', 'mp3', 'wav', 'ogg', 'm4a', 'flac',
+    'zip', 'gz', 'tgz', 'tar', 'rar', '7z', 'bz2', 'xz', 'exe', 'msi', 'dmg', 'iso', 'apk', 'bin',
+    'css', 'js', 'json', 'woff', 'woff2', 'ttf', 'otf', 'eot', 'map'
+}
+
+
+# The words in the path or the anchor text of a link and how much they say the page has an address on it,
+# the negative ones are the pages that rarely do (posts, listings, shop and account pages)
+LINK_HINTS = [
+    (re.compile(r'contact|get-?in-?touch|reach-?us'), 10),
+    (re.compile(r'locations?\b|offices?\b|branch(es)?\b|stores?\b|store-?locator|find-?us|directions|visit-?us|where-?we-?are'), 8),
+    (re.compile(r'imprint|impressum|legal|about|who-?we-?are|our-?company'), 5),
+    (re.compile(r'blog|news|articles?\b|posts?\b|press|events?\b|tags?\b|categor(y|ies)|archive|careers|jobs'), -6),
+    (re.compile(r'products?\b|shop|cart|basket|checkout|login|sign-?in|register|account|search'), -4),
+    (re.compile(r'/(19|20)\d\d/|[?&]page=|/page/\d+'), -4) # Dated posts and paginated listings
+]
+
+
+# How likely the page of a link is to have an address on it, from its path, query and anchor text
+def linkScore(url: str, text: str = ''):
+    parts = urlsplit(url)
+    target = f'{parts.path}?{parts.query} {text}'.lower()
+    return sum(weight for pattern, weight in LINK_HINTS if pattern.search(target))
+
+
+# If a url looks like an html page from the extension of its path
+def looksLikePage(url: str):
+    path = urlsplit(url).path
+    name = path.rsplit('/', 1)[-1]
+    return '.' not in name or name.rsplit('.', 1)[-1].lower() not in SKIPPED_EXTENSIONS
+
+
+# Thread safe crawl frontier that the crawl workers pull urls from. Best first: the url with the highest link score
+# minus its level is fetched next (the contact and locations pages before the blog), breadth first in the order the urls
+# were added otherwise. A domain is stopped once maxDomainAddresses distinct addresses were found on it, or once
+# stalePages pages in a row found no new address after the first one, its queued urls are dropped
+class CrawlFrontier():
+    maxDepth = 1 # The depth of the search (inclusive)
+    bestFirst = True # Order the urls by their link score, breadth first when False
+    maxDomainAddresses = 0 # Stop a domain after this many distinct addresses, 0 never stops
+    stalePages = 0 # Stop a domain after this many pages in a row without a new address, 0 never stops
+    queue = None # The urls waiting to be fetched, a heap of (priority, order, entry point)
+    seen = None # The set of urls that have been added to the frontier
+    domains = None # The pages, addresses and stop reason of each domain crawled
+    inFlight = 0 # The number of urls a worker is currently processing
+    pagesDone = 0 # The number of urls that have been processed
+    def __init__(self, maxDepth: int, bestFirst: bool = True, maxDomainAddresses: int = 0, stalePages: int = 0):
+        self.maxDepth = maxDepth
+        self.bestFirst = bestFirst
+        self.maxDomainAddresses = maxDomainAddresses
+        self.stalePages = stalePages
+        self.queue = []
+        self.order = itertools.count()
+        self.seen = set()
+        self.domains = {}
+        self.condition = threading.Condition()
+
+    def withinDepth(self, level: int):
+        return level <= self.maxDepth
+
+    def domain(self, url: str):
+        domain = urlsplit(url).netloc.lower()
+        if domain not in self.domains:
+            self.domains[domain] = {'pages': 0, 'addresses': 0, 'stale': 0, 'stopped': None}
+        return self.domains[domain]
+
+    # Add a url to the frontier, returns False if the url is too deep, has already been added or its domain was stopped
+    def add(self, url: str, level: int, score: float = 0):
+        if not self.withinDepth(level):
+            return False
+        with self.condition:
+            if url in self.seen or self.domain(url)['stopped']:
+                return False
+            self.seen.add(url)
+            priority = level - score if self.bestFirst else 0
+            heapq.heappush(self.queue, (priority, next(self.order), {"url": url, "level": level, "score": score, "scanned": False}))
+            self.condition.notify()
+        return True
+
+    # Add back a url from the checkpoint of a scan, urls that were already crawled are only marked as seen
+    def restore(self, url: str, level: int, done: bool, score: float = 0):
+        if done:
+            with self.condition:
+                self.seen.add(url)
+            return False
+        return self.add(url, level, score)
+
+    # Count the new addresses a page of a domain found. Returns why the domain was stopped when this page stopped it
+    def recordPage(self, url: str, newAddresses: int):
+        with self.condition:
+            domain = self.domain(url)
+            domain['pages'] += 1
+            domain['addresses'] += newAddresses
+            domain['stale'] = 0 if newAddresses else domain['stale'] + 1
+            if domain['stopped']:
+                return None
+            if self.maxDomainAddresses and domain['addresses'] >= self.maxDomainAddresses:
+                domain['stopped'] = f'{domain["addresses"]} addresses found'
+            elif self.stalePages and domain['addresses'] and domain['stale'] >= self.stalePages:
+                domain['stopped'] = f'no new address in the last {domain["stale"]} pages'
+            else:
+                return None
+            name = urlsplit(url).netloc.lower()
+            self.queue = [item for item in self.queue if urlsplit(item[2]['url']).netloc.lower() != name]
+            heapq.heapify(self.queue)
+            self.condition.notify_all()
+            return domain['stopped']
+
+    # Get the next url to fetch, blocks while other workers may still add urls.
+    # Returns None once the queue is empty and no worker is processing a url (the crawl has drained)
+    # or straight away when the queue is empty and block is False
+    def get(self, block: bool = True):
+        with self.condition:
+            while not self.queue:
+                if self.inFlight == 0 or not block:
+                    return None
+                self.condition.wait()
+            self.inFlight += 1
+            return heapq.heappop(self.queue)[2]
+
+    # Mark a url returned by get as processed
+    def done(self, entryPoint: dict):
+        with self.condition:
+            entryPoint['scanned'] = True
+            self.inFlight -= 1
+            self.pagesDone += 1
+            # Wake every waiting worker so they can exit if the crawl has drained
+            self.condition.notify_all()
+
+    def drained(self):
+        with self.condition:
+            return not self.queue and self.inFlight == 0
+
+    def __len__(self):
+        with self.condition:
+            return len(self.queue)
@@ -0,0 +1,103 @@
+import queue # For the shared image queue
+import threading # For the batching worker
+from collections import deque # For the recent queue waits
+import time # For the deadline and the stats
+from concurrent.futures import Future # For routing the results back to the caller
+import numpy as np
+
+# Custom imports
+from logger import Logger, logTypes
+from metrics import metrics
+
+STOP = object() # Put on the queue to stop the worker
+
+
+# Collects the images from every location in the scan into one queue and runs them through the detector
+# in batches of up to batchSize images, or whatever has arrived by the deadline. Has the same detect
+# interface as the detector so the ImageVulnProcessors can use either
+class DetectionService():
+    detector = None
+    logger = None
+    batchSize = 32 # The max number of images in a batch
+    deadline = 0.05 # Seconds to wait for a batch to fill after its first image arrives
+    metricName = 'inference' # The run profile name of the batches, the footprint extractor is batched the same way
+    waitSamples = 10000 # The number of recent queue waits kept for the mean and p95
+    images = 0
+    batches = 0
+    inferenceTime = 0.0
+    maxWait = 0.0
+    def __init__(self, detector, logger: Logger, batchSize: int = 32, deadline: float = 0.05, metricName: str = 'inference'):
+        self.detector = detector
+        self.logger = logger
+        self.batchSize = max(1, batchSize)
+        self.deadline = deadline
+        self.metricName = metricName
+        self.queue = queue.Queue()
+        self.queueWaits = deque(maxlen=self.waitSamples)
+        self.startTime = time.perf_counter()
+        self.worker = threading.Thread(target=self.batchWorker, name='oslfp-detection', daemon=True)
+        self.worker.start()
+
+    # Queue the images and wait for their detections, one array per image (see YoloDetector.detect)
+    def detect(self, images: list):
+        futures = []
+        for image in images:
+            future = Future()
+            self.queue.put((image, future, time.perf_counter()))
+            futures.append(future)
+        return [future.result() for future in futures]
+
+    def batchWorker(self):
+        stopping = False
+        while not stopping:
+            item = self.queue.get()
+            if item is STOP:
+                break
+            batch = [item]
+            deadline = time.perf_counter() + self.deadline
+            while len(batch) < self.batchSize:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self.queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is STOP:
+                    stopping = True # Finish the batch we have before stopping
+                    break
+                batch.append(item)
+            self.runBatch(batch)
+
+    def runBatch(self, batch: list):
+        startTime = time.perf_counter()
+        waits = [startTime - queued for image, future, queued in batch]
+        self.queueWaits.extend(waits)
+        self.maxWait = max(self.maxWait, max(waits))
+        try:
+            results = self.detector.detect([image for image, future, queued in batch])
+            for (image, future, queued), boxes in zip(batch, results):
+                future.set_result(boxes)
+        except Exception as e:
+            for image, future, queued in batch:
+                future.set_exception(e)
+        elapsed = time.perf_counter() - startTime
+        self.inferenceTime += elapsed
+        self.images += len(batch)
+        self.batches += 1
+        metrics.observe(self.metricName, elapsed)
+        metrics.count(f'{self.metricName} images', len(batch))
+        self.logger.vprint(logTypes.DEBUG, 'Batch of {} images for {} took {:.3f}s', len(batch), self.metricName, elapsed)
+
+    def stats(self):
+        if not self.images:
+            return 'no images detected'
+        elapsed = time.perf_counter() - self.startTime
+        waits = np.array(self.queueWaits) * 1000
+        return (f'{self.images} images in {self.batches} batches (mean batch {self.images / self.batches:.1f}), '
+                f'{self.images / self.inferenceTime:.1f} images/sec during inference, {self.images / elapsed:.1f} images/sec overall, '
+                f'queue wait mean {waits.mean():.1f}ms p95 {np.percentile(waits, 95):.1f}ms max {self.maxWait * 1000:.1f}ms')
+
+    def close(self):
+        self.queue.put(STOP)
+        self.worker.join()
@@ -0,0 +1,152 @@
+import threading # For the location workers adding at the same time
+import numpy as np
+
+
+# The indices of each location in a column of location indices, grouped with one sort instead of a scan per location
+def groupByLocation(locations: np.ndarray):
+    order = np.argsort(locations, kind='stable')
+    values, starts = np.unique(locations[order], return_index=True)
+    return {int(location): group for location, group in zip(values, np.split(order, starts[1:]))}
+
+
+# Columnar store of the detections of every location in a scan. One row per detection in growable NumPy columns
+# instead of a dict and a path string per box, so thousands of locations fit in memory
+class DetectionStore():
+    size = 0 # The number of detections stored
+    capacity = 0
+    indexed = 0 # The number of rows in the location index
+    def __init__(self, capacity: int = 1024):
+        self.lock = threading.RLock()
+        self.capacity = max(1, capacity)
+        self.classIds = np.zeros(self.capacity, dtype=np.int16)
+        self.confidences = np.zeros(self.capacity, dtype=np.float32)
+        self.boxes = np.zeros((self.capacity, 4), dtype=np.float32) # [x centre, y centre, width, height] normalised
+        self.imageIndices = np.zeros(self.capacity, dtype=np.int32)
+        self.locationIndices = np.zeros(self.capacity, dtype=np.int32)
+        self.imageSources = [] # The saved path or url of each image, index = image index
+        self.imageLocations = [] # The location of each image, index = image index
+        self.order = np.zeros(0, dtype=np.int64) # The rows sorted by location, so a location never scans every row
+        self.sortedLocations = np.zeros(0, dtype=np.int32) # The location index of each row of order
+        self.locationImages = {} # location index -> its image indices
+
+    # Register an image of a location and get its image index
+    def addImage(self, locationIndex: int, source: str):
+        with self.lock:
+            self.imageSources.append(source)
+            self.imageLocations.append(locationIndex)
+            self.locationImages.setdefault(locationIndex, []).append(len(self.imageSources) - 1)
+            return len(self.imageSources) - 1
+
+    def grow(self, needed: int):
+        capacity = self.capacity
+        while capacity < needed:
+            capacity *= 2
+        if capacity == self.capacity:
+            return
+        for name in ['classIds', 'confidences', 'boxes', 'imageIndices', 'locationIndices']:
+            column = getattr(self, name)
+            grown = np.zeros((capacity,) + column.shape[1:], dtype=column.dtype)
+            grown[:self.size] = column[:self.size]
+            setattr(self, name, grown)
+        self.capacity = capacity
+
+    # Add the detections of an image, boxes rows are [class id, confidence, x centre, y centre, width, height]
+    def add(self, locationIndex: int, imageIndex: int, boxes: np.ndarray):
+        if len(boxes) == 0:
+            return
+        with self.lock:
+            start, end = self.size, self.size + len(boxes)
+            self.grow(end)
+            self.classIds[start:end] = boxes[:, 0]
+            self.confidences[start:end] = boxes[:, 1]
+            self.boxes[start:end] = boxes[:, 2:6]
+            self.imageIndices[start:end] = imageIndex
+            self.locationIndices[start:end] = locationIndex
+            self.size = end
+
+    # Merge the rows added since the last call into the location index. The new rows are sorted on their own and inserted
+    # after the rows of the same location, so the rows of a location stay in the order they were added
+    def index(self):
+        if self.indexed == self.size:
+            return
+        new = np.arange(self.indexed, self.size)
+        new = new[np.argsort(self.locationIndices[new], kind='stable')]
+        self.order = np.insert(self.order, np.searchsorted(self.sortedLocations, self.locationIndices[new], side='right'), new)
+        self.sortedLocations = self.locationIndices[self.order]
+        self.indexed = self.size
+
+    # The rows of a location (or every location)
+    def rows(self, locationIndex: int = None):
+        if locationIndex is None:
+            return np.arange(self.size)
+        with self.lock:
+            self.index()
+            start, end = np.searchsorted(self.sortedLocations, [locationIndex, locationIndex + 1])
+            return self.order[start:end]
+
+    # The number of detections of each class
+    def classCounts(self, locationIndex: int = None, classes: int = 2):
+        return np.bincount(self.classIds[self.rows(locationIndex)], minlength=classes)
+
+    # The image indices that have at least one detection of the class
+    def imagesWithClass(self, classId: int, locationIndex: int = None):
+        rows = self.rows(locationIndex)
+        return np.unique(self.imageIndices[rows][self.classIds[rows] == classId])
+
+    # The per class totals and images of a location, in the securityDetected layout used by the report
+    def summary(self, locationIndex: int, classNames: list):
+        with self.lock:
+            counts = self.classCounts(locationIndex, len(classNames))
+            return {
+                name: {
+                    "total": int(counts[classId]),
+                    "locations": [self.imageSources[imageIndex] for imageIndex in self.imagesWithClass(classId, locationIndex)]
+                }
+                for classId, name in enumerate(classNames)
+            }
+
+    # The images and detections of a location as plain lists, for the scan checkpoint
+    def exportLocation(self, locationIndex: int):
+        with self.lock:
+            images = self.locationImages.get(locationIndex, [])
+            rows = self.rows(locationIndex)
+            boxes = np.column_stack([self.imageIndices[rows], self.classIds[rows], self.confidences[rows], self.boxes[rows]])
+            return {
+                'images': [[imageIndex, self.imageSources[imageIndex]] for imageIndex in images],
+                'boxes': boxes.tolist()
+            }
+
+    # Add back the images and detections of a location exported by exportLocation, the image indices are renumbered
+    def importLocation(self, locationIndex: int, exported: dict):
+        imageIndices = {oldIndex: self.addImage(locationIndex, source) for oldIndex, source in exported['images']}
+        rows = np.array(exported['boxes'], dtype=np.float32).reshape(-1, 7)
+        for oldIndex, imageIndex in imageIndices.items():
+            self.add(locationIndex, imageIndex, rows[rows[:, 0] == oldIndex, 1:])
+
+    def toArrays(self):
+        with self.lock:
+            return {
+                'classIds': self.classIds[:self.size].copy(),
+                'confidences': self.confidences[:self.size].copy(),
+                'boxes': self.boxes[:self.size].copy(),
+                'imageIndices': self.imageIndices[:self.size].copy(),
+                'locationIndices': self.locationIndices[:self.size].copy(),
+                'imageSources': np.array(self.imageSources, dtype=str),
+                'imageLocations': np.array(self.imageLocations, dtype=np.int32)
+            }
+
+    def save(self, path: str):
+        np.savez_compressed(path, **self.toArrays())
+
+    @classmethod
+    def load(cls, path: str):
+        arrays = np.load(path)
+        size = len(arrays['classIds'])
+        store = cls(capacity=size)
+        for name in ['classIds', 'confidences', 'boxes', 'imageIndices', 'locationIndices']:
+            getattr(store, name)[:size] = arrays[name]
+        store.size = size
+        store.imageSources = arrays['imageSources'].tolist()
+        store.imageLocations = arrays['imageLocations'].tolist()
+        store.locationImages = {location: images.tolist() for location, images in groupByLocation(arrays['imageLocations']).items()}
+        return store
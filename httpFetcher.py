@@ -0,0 +1,185 @@
+import asyncio # For the async engine event loop
+import concurrent.futures # For the threaded fetchMany
+import threading # For the per host limits and the event loop thread
+from urllib.parse import urlsplit # For finding the host of a url
+import requests # For the threaded engine
+from requests.adapters import HTTPAdapter # For sizing the keep-alive connection pool
+
+try:
+    import aiohttp # Optional: only needed for --engine async
+except ImportError:
+    aiohttp = None
+
+HTML_CONTENT_TYPES = ('text/html', 'application/xhtml+xml') # The content types of the pages the crawl parses
+
+
+# The response returned by both of the engines, mirrors the parts of requests.Response that we use
+class FetchResponse():
+    url = ""
+    status_code = 0
+    headers = None
+    content = b""
+    encoding = None
+    truncated = False # The body was bigger than the maxBytes of the request and was cut short
+    skipped = False # The body was not one of the contentTypes of the request and was not read
+    def __init__(self, url: str, status_code: int, headers, content: bytes, encoding: str = None, truncated: bool = False, skipped: bool = False):
+        self.url = url
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+        self.encoding = encoding
+        self.truncated = truncated
+        self.skipped = skipped
+
+    @property
+    def text(self):
+        return self.content.decode(self.encoding or 'utf-8', errors='replace')
+
+
+# If the Content-Type header of a response is one of contentTypes, None when the server did not send one
+def acceptedContentType(headers, contentTypes: tuple):
+    contentType = headers.get('Content-Type')
+    if not contentType:
+        return None
+    return contentType.split(';')[0].strip().lower() in contentTypes
+
+
+# Guess if a body with no Content-Type is html from its first chunk: markup and no binary bytes
+def looksLikeHtml(chunk: bytes):
+    head = chunk[:1024]
+    return b'\x00' not in head and head.lstrip(b'\xef\xbb\xbf \t\r\n').startswith(b'<')
+
+
+# Read the chunks of a streamed body until maxBytes (None reads all of it), returns the body and if it was cut short.
+# sniff is given the first chunk and can reject the body, then the body is None
+def readLimited(chunks, maxBytes: int = None, sniff=None):
+    body = bytearray()
+    for chunk in chunks:
+        if sniff and not body and not sniff(chunk):
+            return None, False
+        body += chunk
+        if maxBytes is not None and len(body) > maxBytes:
+            return bytes(body[:maxBytes]), True
+    return bytes(body), False
+
+
+# Threaded engine: one shared requests session so the connections are kept alive between requests
+class HttpFetcher():
+    engine = "thread"
+    timeout = 10 # Seconds before a request is given up on
+    maxConnections = 100 # The max number of requests in flight overall
+    perHostLimit = 8 # The max number of requests in flight to a single host
+    def __init__(self, maxConnections: int = 100, perHostLimit: int = 8, timeout: float = 10):
+        self.maxConnections = maxConnections
+        self.perHostLimit = perHostLimit
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=maxConnections, pool_maxsize=maxConnections)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.globalSlots = threading.BoundedSemaphore(maxConnections)
+        self.hostSlots = {}
+        self.hostLock = threading.Lock()
+
+    def hostSlot(self, url: str):
+        host = urlsplit(url).netloc
+        with self.hostLock:
+            if host not in self.hostSlots:
+                self.hostSlots[host] = threading.BoundedSemaphore(self.perHostLimit)
+            return self.hostSlots[host]
+
+    # maxBytes streams the body and stops reading once it is reached. contentTypes skips the body of a successful
+    # response that is not one of them, from its headers or from its first chunk when it has no Content-Type
+    def fetch(self, url: str, headers: dict = None, maxBytes: int = None, contentTypes: tuple = None):
+        stream = maxBytes is not None or contentTypes is not None
+        with self.globalSlots, self.hostSlot(url):
+            with self.session.get(url, headers=headers, timeout=self.timeout, stream=stream) as res:
+                accepted = acceptedContentType(res.headers, contentTypes) if contentTypes and res.status_code == 200 else True
+                if accepted is False:
+                    return FetchResponse(res.url, res.status_code, res.headers, b"", res.encoding, skipped=True)
+                if not stream:
+                    content, truncated = res.content, False
+                else:
+                    content, truncated = readLimited(res.iter_content(64 * 1024), maxBytes, sniff=looksLikeHtml if accepted is None else None)
+        if content is None:
+            return FetchResponse(res.url, res.status_code, res.headers, b"", res.encoding, skipped=True)
+        return FetchResponse(res.url, res.status_code, res.headers, content, res.encoding, truncated)
+
+    # Fetch the urls concurrently, a failed fetch is None in the returned list
+    def fetchMany(self, urls: list, headers: dict = None, maxBytes: int = None):
+        if not urls:
+            return []
+        def fetchOrNone(url):
+            try:
+                return self.fetch(url, headers=headers, maxBytes=maxBytes)
+            except Exception:
+                return None
+        with concurrent.futures.ThreadPoolExecutor(min(len(urls), self.maxConnections)) as executor:
+            return list(executor.map(fetchOrNone, urls))
+
+    def close(self):
+        self.session.close()
+
+
+# Async engine: a single aiohttp connection pool driven by an event loop on its own thread.
+# The sync fetch keeps the call sites the same, the crawl can schedule coroutines on the loop with run
+class AsyncHttpFetcher():
+    engine = "async"
+    timeout = 10 # Seconds before a request is given up on
+    maxConnections = 100 # The max number of requests in flight overall
+    perHostLimit = 8 # The max number of requests in flight to a single host
+    def __init__(self, maxConnections: int = 100, perHostLimit: int = 8, timeout: float = 10):
+        if aiohttp is None:
+            raise ImportError('aiohttp is required for the async engine, install it with: pip install aiohttp')
+        self.maxConnections = maxConnections
+        self.perHostLimit = perHostLimit
+        self.timeout = timeout
+        self.loop = asyncio.new_event_loop()
+        self.loopThread = threading.Thread(target=self.loop.run_forever, name='oslfp-fetch-loop', daemon=True)
+        self.loopThread.start()
+        self.session = self.run(self.createSession())
+
+    async def createSession(self):
+        # The connector caps the in flight requests overall and per host and keeps the connections alive
+        connector = aiohttp.TCPConnector(limit=self.maxConnections, limit_per_host=self.perHostLimit)
+        return aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=self.timeout))
+
+    # Run a coroutine on the engine loop and wait for the result
+    def run(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+    # The same maxBytes and contentTypes rules as HttpFetcher.fetch
+    async def fetchAsync(self, url: str, headers: dict = None, maxBytes: int = None, contentTypes: tuple = None):
+        async with self.session.get(url, headers=headers) as res:
+            accepted = acceptedContentType(res.headers, contentTypes) if contentTypes and res.status == 200 else True
+            if accepted is False:
+                return FetchResponse(str(res.url), res.status, res.headers, b"", res.charset, skipped=True)
+            truncated = False
+            if maxBytes is None and accepted:
+                content = await res.read()
+            else:
+                body = bytearray()
+                async for chunk in res.content.iter_chunked(64 * 1024):
+                    if accepted is None and not body and not looksLikeHtml(chunk):
+                        return FetchResponse(str(res.url), res.status, res.headers, b"", res.charset, skipped=True)
+                    body += chunk
+                    if maxBytes is not None and len(body) > maxBytes:
+                        truncated = True
+                        break
+                content = bytes(body[:maxBytes])
+            return FetchResponse(str(res.url), res.status, res.headers, content, res.charset, truncated)
+
+    def fetch(self, url: str, headers: dict = None, maxBytes: int = None, contentTypes: tuple = None):
+        return self.run(self.fetchAsync(url, headers=headers, maxBytes=maxBytes, contentTypes=contentTypes))
+
+    # Fetch the urls concurrently, a failed fetch is None in the returned list
+    def fetchMany(self, urls: list, headers: dict = None, maxBytes: int = None):
+        async def fetchAll():
+            results = await asyncio.gather(*[self.fetchAsync(url, headers=headers, maxBytes=maxBytes) for url in urls], return_exceptions=True)
+            return [None if isinstance(result, BaseException) else result for result in results]
+        return self.run(fetchAll())
+
+    def close(self):
+        self.run(self.session.close())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.loopThread.join()
@@ -0,0 +1,187 @@
+import os # For creating the scans folder
+import sqlite3 # For the on disk detection cache
+import threading # For sharing the cache between the location workers
+import time # For the created time of the cached detections
+import cv2
+import numpy as np
+
+HASH_SIZE = 8 # 8x8 = 64 bit hashes
+DCT_SIZE = 32 # The pHash is taken from the low frequencies of a 32x32 DCT
+
+# The orthonormal DCT-II matrix, the DCT of every image in the batch is then two matrix multiplications
+_dctIndex = np.arange(DCT_SIZE)
+DCT_MATRIX = np.sqrt(2 / DCT_SIZE) * np.cos(np.pi * (2 * _dctIndex[None, :] + 1) * _dctIndex[:, None] / (2 * DCT_SIZE))
+DCT_MATRIX[0] /= np.sqrt(2)
+BIT_COUNTS = np.array([bin(byte).count('1') for byte in range(256)], dtype=np.uint8) # Popcount of every byte
+
+
+# Shrink every image to a size x size grey thumbnail, stacked into one (n, size, size) array
+def thumbnails(images: list, size: int):
+    return np.stack([cv2.resize(cv2.cvtColor(image, cv2.COLOR_BGR2GRAY), (size, size), interpolation=cv2.INTER_AREA) for image in images]).astype(np.float32)
+
+
+# Pack an (n, 64) boolean array into one uint64 hash per row
+def packHashes(bits: np.ndarray):
+    return np.packbits(bits.reshape(len(bits), -1), axis=1).view('>u8').astype(np.uint64).ravel()
+
+
+# pHash of a batch of BGR images: the signs of the low frequency DCT coefficients against their median
+def pHashBatch(images: list):
+    if not images:
+        return np.zeros(0, dtype=np.uint64)
+    pixels = thumbnails(images, DCT_SIZE)
+    dct = DCT_MATRIX @ pixels @ DCT_MATRIX.T # (n, 32, 32), one DCT per image
+    lowFrequencies = dct[:, :HASH_SIZE, :HASH_SIZE].reshape(len(images), -1)
+    medians = np.median(lowFrequencies[:, 1:], axis=1, keepdims=True) # The DC term would skew the median
+    return packHashes(lowFrequencies > medians)
+
+
+# The hamming distance between every hash in a and every hash in b, (len(a), len(b))
+def hammingDistances(a: np.ndarray, b: np.ndarray):
+    different = np.bitwise_xor(a[:, None], b[None, :])
+    return BIT_COUNTS[different.view(np.uint8)].reshape(len(a), len(b), 8).sum(axis=2)
+
+
+# Collapse the images whose hashes are within maxDistance of an earlier image.
+# Returns the indices of the images that are kept (the first of each group)
+def collapseNearDuplicates(hashes: np.ndarray, maxDistance: int):
+    if len(hashes) == 0:
+        return []
+    near = hammingDistances(hashes, hashes) <= maxDistance
+    kept = []
+    collapsed = np.zeros(len(hashes), dtype=bool)
+    for i in range(len(hashes)):
+        if collapsed[i]:
+            continue
+        kept.append(i)
+        collapsed |= near[i]
+    return kept
+
+
+# Cache of the detections by image pHash in front of a detector, shared by every location and kept on disk
+# between scans so only genuinely new imagery is sent to the detector. Has the same detect interface as the detector
+class HashCachedDetector():
+    path = "./scans/imageHashes.sqlite"
+    detector = None
+    model = "" # The weights and the confidence, detections from a different model are never reused
+    maxDistance = 4 # Images within this hamming distance of a cached hash reuse its detections
+    maxEntries = 50000 # The max number of cached images before the least recently used are evicted
+    evictFraction = 0.1 # The fraction of maxEntries freed at once, so a full cache is not evicted on every store
+    entries = 0 # The running count of the cached images, only recounted when it goes over maxEntries
+    hits = 0
+    misses = 0
+    evicted = 0
+    def __init__(self, detector, model: str, maxDistance: int = 4, path: str = None, maxEntries: int = None):
+        self.detector = detector
+        self.model = model
+        self.maxDistance = maxDistance
+        if maxEntries:
+            self.maxEntries = maxEntries
+        if path:
+            self.path = path
+        folder = os.path.dirname(self.path)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder)
+        self.lock = threading.Lock()
+        self.touched = {} # hash -> the last time it was reused, written to the cache with the next store or on close
+        self.db = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+        self.db.execute('PRAGMA journal_mode=WAL') # The processes of a batch scan read and write the cache at the same time
+        self.db.execute('''CREATE TABLE IF NOT EXISTS detections (
+            model TEXT,
+            hash INTEGER,
+            boxes BLOB,
+            created REAL,
+            lastAccess REAL,
+            PRIMARY KEY (model, hash)
+        )''')
+        # The caches written before the LRU bound have no lastAccess, their images count as used when they were created
+        if 'lastAccess' not in [column[1] for column in self.db.execute('PRAGMA table_info(detections)')]:
+            self.db.execute('ALTER TABLE detections ADD COLUMN lastAccess REAL')
+            self.db.execute('UPDATE detections SET lastAccess = created')
+        self.db.execute('CREATE INDEX IF NOT EXISTS detectionsLastAccess ON detections (lastAccess)')
+        self.db.commit()
+        self.entries = self.db.execute('SELECT COUNT(*) FROM detections').fetchone()[0]
+        self.loadKnown()
+
+    # Load the known hashes of this model into memory so the near lookups are one vectorised comparison
+    def loadKnown(self):
+        rows = self.db.execute('SELECT hash, boxes FROM detections WHERE model = ?', (self.model,)).fetchall()
+        self.knownHashes = np.array([row[0] for row in rows], dtype=np.int64).view(np.uint64)
+        self.knownBoxes = [np.frombuffer(row[1], dtype=np.float32).reshape(-1, 6) for row in rows]
+
+    # Find the cached detections of each hash, None when there is no cached hash close enough
+    def lookup(self, hashes: np.ndarray):
+        with self.lock:
+            if len(self.knownHashes) == 0:
+                return [None] * len(hashes)
+            distances = hammingDistances(hashes, self.knownHashes)
+            nearest = distances.argmin(axis=1)
+            found = distances[np.arange(len(hashes)), nearest] <= self.maxDistance
+            # Mark the reused images as recently used so they are the last to be evicted, the write waits for the next store
+            now = time.time()
+            self.touched.update((int(imageHash), now) for imageHash in self.knownHashes[nearest[found]].view(np.int64))
+            return [self.knownBoxes[index] if matched else None for index, matched in zip(nearest, found)]
+
+    # Write the last use of the reused images (called with the lock held)
+    def flushTouched(self):
+        if not self.touched:
+            return
+        self.db.executemany('UPDATE detections SET lastAccess = ? WHERE model = ? AND hash = ?', [(used, self.model, imageHash) for imageHash, used in self.touched.items()])
+        self.touched = {}
+
+    # Store the detections of the hashes that are not cached yet, the first of any repeated hash
+    def store(self, hashes: np.ndarray, detections: list):
+        now = time.time()
+        hashes = hashes.astype(np.uint64)
+        with self.lock:
+            unique = np.unique(hashes, return_index=True)[1]
+            new = np.sort(unique[~np.isin(hashes[unique], self.knownHashes)])
+            rows = [(self.model, int(hashes[i].view(np.int64)), detections[i].astype(np.float32).tobytes(), now, now) for i in new]
+            self.flushTouched()
+            # Another process of a batch can have stored the same hash, only the rows actually inserted are counted
+            self.entries += self.db.executemany('INSERT OR IGNORE INTO detections (model, hash, boxes, created, lastAccess) VALUES (?, ?, ?, ?, ?)', rows).rowcount
+            self.knownHashes = np.concatenate([self.knownHashes, hashes[new]])
+            self.knownBoxes.extend(detections[i].astype(np.float32) for i in new)
+            self.evict()
+            self.db.commit()
+
+    # Drop the least recently used images until the cache fits in maxEntries (called with the lock held). The table is only
+    # counted once the running count goes over, then the known hashes are reloaded without the evicted images
+    def evict(self):
+        if self.entries <= self.maxEntries:
+            return
+        self.entries = self.db.execute('SELECT COUNT(*) FROM detections').fetchone()[0]
+        if self.entries <= self.maxEntries:
+            return
+        overflow = self.entries - int(self.maxEntries * (1 - self.evictFraction))
+        self.db.execute('DELETE FROM detections WHERE rowid IN (SELECT rowid FROM detections ORDER BY lastAccess LIMIT ?)', (overflow,))
+        self.entries -= overflow
+        self.evicted += overflow
+        self.loadKnown()
+
+    def detect(self, images: list):
+        if not images:
+            return []
+        hashes = pHashBatch(images)
+        detections = self.lookup(hashes)
+        missing = [i for i, boxes in enumerate(detections) if boxes is None]
+        with self.lock:
+            self.hits += len(images) - len(missing)
+            self.misses += len(missing)
+        if missing:
+            results = self.detector.detect([images[i] for i in missing])
+            for i, boxes in zip(missing, results):
+                detections[i] = boxes
+            self.store(hashes[missing], results)
+        return detections
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        hitRate = self.hits / lookups * 100 if lookups else 0
+        return f'{self.hits} images reused cached detections, {self.misses} sent to the detector ({hitRate:.1f}% hit rate), {self.evicted} evicted'
+
+    def close(self):
+        with self.lock:
+            self.flushTouched()
+            self.db.commit()
+            self.db.close()
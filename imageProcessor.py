@@ -1,12 +1,17 @@
 import os
+import hashlib # For dropping the byte identical images
 import cv2
 import numpy as np
 from bs4 import BeautifulSoup # For parsing the html
-import subprocess
-import requests
 
 # Custom imports
 from logger import Logger, logTypes
+from httpFetcher import HttpFetcher
+from yoloDetector import YoloDetector
+from imageHash import pHashBatch, collapseNearDuplicates, hammingDistances
+from changeDetection import findPreviousLocation, loadImagery, saveImagery, changedMask, changedRegions, cropToImage, unchangedBoxes, mergeDetections, IMAGERY_FILE
+from detectionStore import DetectionStore
+from metrics import metrics
 
 
 class ImageVulnProcessor():
@@ -14,195 +19,208 @@ class ImageVulnProcessor():
     path = ""
     geocode = None
     address = ""
-    securityDetected = {
-        "cameras": {
-            "total": 0,
-            "locations":[] # List of tuples containing the lat and long of the camera
-        },
-        "fences": {
-            "total": 0,
-            "locations":[] # List of tuples containing the lat and long of the feces
-        }
-    }
+    securityDetected = None # The per class totals and the images they were found in, built from the detection store
+    securityClasses = ["fences", "cameras"] # The securityDetected key of each model class id (the model calls fences gates)
+    detectionStore = None # The columnar store of the detections, shared by every location in the scan
+    locationIndex = 0 # The index of this location in the detection store
     imagesPath = "/areaImages"
     detectPath = "/detect/oslfp"
     aiMetaData = None # The meta data for the ai vuln scan tuple[scanlimit, min-confidence]
     yoloWeights = "./yolov5/runs/train/exp6/weights/best.pt"
-    yoloConfig = "./yolov5x.cfg"
-    def __init__(self, path: str, geocode, address: str, logger: Logger, aiMetaData):
+    fetcher = None # The http engine used to download the images
+    detector = None # The in process YOLO detector, shared by every location in the scan
+    images = None # The decoded area images: list of (name, source, image), source is the saved path or the url
+    saveImages = False # Write the area images to disk for the report
+    maxImageBytes = 5 * 1024 * 1024 # Images bigger than this are skipped
+    nearDuplicateDistance = 6 # Images whose pHashes are within this hamming distance are collapsed, -1 turns it off
+    incremental = False # Compare with the previous scan of the location and keep the imagery for the next one
+    previous = None # The hashes, sources and detections of the images of this location in the previous scan (incremental scans)
+    matchDistance = 10 # An image whose pHash is within this hamming distance of a previous image is the same view of the location
+    changeThreshold = 30 # The grey level difference above which a pixel has changed since the previous scan
+    maxChanged = 0.5 # An image with more than this fraction changed is detected whole instead of by region
+    def __init__(self, path: str, geocode, address: str, logger: Logger, aiMetaData, fetcher=None, detector: YoloDetector = None, saveImages: bool = False, maxImageBytes: int = None, nearDuplicateDistance: int = None, detectionStore: DetectionStore = None, locationIndex: int = 0, incremental: bool = False, baselineScan: str = None, changeThreshold: int = None, maxChanged: float = None):
         self.logger = logger
+        self.detectionStore = detectionStore if detectionStore else DetectionStore()
+        self.locationIndex = locationIndex
+        self.images = []
+        self.saveImages = saveImages
+        if maxImageBytes:
+            self.maxImageBytes = maxImageBytes
+        if nearDuplicateDistance is not None:
+            self.nearDuplicateDistance = nearDuplicateDistance
+        self.fetcher = fetcher if fetcher else HttpFetcher()
+        self.detector = detector if detector else YoloDetector(self.yoloWeights, confidence=aiMetaData[1])
         self.path = path
         lat, lng = geocode.values()
         self.geocode =(lat, lng)
         self.address = address
         self.aiMetaData = aiMetaData
+        if changeThreshold is not None:
+            self.changeThreshold = changeThreshold
+        if maxChanged is not None:
+            self.maxChanged = maxChanged
+        self.incremental = incremental
+        if incremental:
+            previousFolder = findPreviousLocation(os.path.basename(path), path, IMAGERY_FILE, baselineScan, os.path.dirname(os.path.dirname(path)))
+            self.previous = loadImagery(previousFolder)
+            if self.previous:
+                self.logger.vprint(logTypes.INFO, 'ImageVulnProcessor: Comparing with the {} images of: {}', len(self.previous["hashes"]), previousFolder)
         self.getImageofLocation(self.geocode[0], self.geocode[1])
         self.processImage()
 
     def getImageofLocation(self, lat: float, long: float):
-        # Get the image of the location from google maps and save it to the path specified
+        # Get the image of the location from google maps, decode it in memory and optionally save it to the path specified
         # due to the nature of the project, you may need permission from the target for the image processing
 
         # Check if the folder image already exists if not create it
         workingPath = f"{self.path}{self.imagesPath}"
-        if not os.path.exists(workingPath):
+        if self.saveImages and not os.path.exists(workingPath):
             os.makedirs(workingPath)
-            self.logger.vprint(logTypes.DEBUG, f'Created folder: {workingPath}')
+            self.logger.vprint(logTypes.DEBUG, 'Created folder: {}', workingPath)
 
         # fetch with request images from google maps at geocode and place it in the created folder
         if self.aiMetaData[0] == 0:
             self.logger.vprint(logTypes.WARNING, f'ImageVulnProcessor: Scan limit is 0, skipping image processing')
             return
         else:
-            self.logger.vprint(logTypes.INFO, f'ImageVulnProcessor: Scan limit is {self.aiMetaData[0]}')
-            self.logger.vprint(logTypes.INFO, f'ImageVulnProcessor: Min confidence is {self.aiMetaData[1]}')
+            self.logger.vprint(logTypes.INFO, 'ImageVulnProcessor: Scan limit is {}', self.aiMetaData[0])
+            self.logger.vprint(logTypes.INFO, 'ImageVulnProcessor: Min confidence is {}', self.aiMetaData[1])
             self.logger.vprint(logTypes.INFO, f'ImageVulnProcessor: Fetching image from google maps')
             # Fetch the image from google maps with google dorking - f"https://www.google.com/search?q=near:+{self.address}"
             url = f"https://www.google.com/search?q=near:+{self.address}&tbm=isch&sa=X&ved=2ahUKEwjOud2b3Jz_AhXMS0EAHTzyAK8Q0pQJegQIShAB&biw=832&bih=855" # May need to change the url session
-            search = requests.get(url)
+            with metrics.span('image search'):
+                search = self.fetcher.fetch(url)
             soup = BeautifulSoup(search.text, 'html.parser')
             soupimages = soup.find_all('img')
-            for i, img in enumerate(soupimages):
-                if i > self.aiMetaData[0]: break
-                img_url = img['src']
-                try:
-                    self.logger.vprint(logTypes.INFO, f'ImageVulnProcessor: Fetching image: {img_url}')
-                    img_data = requests.get(img_url).content
-                    with open(f'{workingPath}/{i}.jpeg', 'wb') as handler:
-                        handler.write(img_data)
-                    
-                except:
-                    self.logger.vprint(logTypes.WARNING, f'ImageVulnProcessor: Failed to fetch image: {img_url}')
+            imageUrls = [(i, img.get('src')) for i, img in enumerate(soupimages[:self.aiMetaData[0] + 1]) if img.get('src', '').startswith('http')]
+            self.logger.vprint(logTypes.INFO, 'ImageVulnProcessor: Fetching {} images', len(imageUrls))
+            # Download the images concurrently and keep them in memory
+            with metrics.span('image download'):
+                responses = self.fetcher.fetchMany([img_url for i, img_url in imageUrls], maxBytes=self.maxImageBytes)
+            metrics.count('image bytes', sum(len(res.content) for res in responses if res is not None))
+            seenHashes = set()
+            for (i, img_url), res in zip(imageUrls, responses):
+                if res is None or res.status_code != 200:
+                    self.logger.vprint(logTypes.WARNING, 'ImageVulnProcessor: Failed to fetch image: {}', img_url)
                     continue
+                if res.truncated:
+                    self.logger.vprint(logTypes.WARNING, 'ImageVulnProcessor: Image is bigger than {} bytes, skipping: {}', self.maxImageBytes, img_url)
+                    continue
+                # Drop the byte identical images before they reach detection
+                contentHash = hashlib.sha1(res.content).digest()
+                if contentHash in seenHashes:
+                    self.logger.vprint(logTypes.DEBUG, 'ImageVulnProcessor: Duplicate image, skipping: {}', img_url)
+                    continue
+                seenHashes.add(contentHash)
+                image = cv2.imdecode(np.frombuffer(res.content, np.uint8), cv2.IMREAD_COLOR)
+                if image is None:
+                    self.logger.vprint(logTypes.WARNING, 'ImageVulnProcessor: Could not decode image: {}', img_url)
+                    continue
+                source = img_url
+                if self.saveImages:
+                    source = f'{workingPath}/{i}.jpeg'
+                    with open(source, 'wb') as handler:
+                        handler.write(res.content)
+                self.images.append((str(i), source, image))
+            metrics.count('images', len(self.images))
 
 
 
     def processImage(self):
         # Process the image and check for any security in place
-        # This will be done by using opencv to detect the objects with the YOLO model that we made
+        # This will be done by using the detector backend (torch, opencv dnn or onnxruntime) to detect the objects with the YOLO model that we made
         #Reference: https://medium.com/@MrBam44/yolo-object-detection-using-opencv-with-python-b6386c3d6fc1#:~:text=YOLO%20algorithm%20employs%20convolutional%20neural,in%20a%20single%20algorithm%20run.
-        # net = cv2.dnn.readNetFromDarknet(self.yoloConfig, self.yoloWeights) # readNetFromDarknet(self.yoloConfig, ) # Not working cause no .cfg file generataed
-        classes = ["gate", "camera"]
-
-        # layer_names = net.getLayerNames()
-        # output_layers = [layer_names[i[0] - 1] for i in net.getUnconnectedOutLayers()]
-        # colours = np.random.uniform(0, 255, size=(len(classes), 3))
-
-        # get the images from the folder
-        imagePathScan = f"{self.path}{self.imagesPath}"
-        images = os.listdir(imagePathScan)
-        if len(images) == 0:
-            self.logger.vprint(logTypes.WARNING, f'No images found in: {self.path + self.imagesPath}')
-            return
-        
-        # get the detcted objects from the images
-        self.detectObjects(imagePathScan)
 
-        # get the labels from the detect folder
-        labels = os.listdir(f"{self.path}{self.detectPath}/labels")
-        if len(labels) == 0:
-            self.logger.vprint(logTypes.WARNING, f'No labels found in: {self.path + self.detectPath}')
+        self.securityDetected = self.detectionStore.summary(self.locationIndex, self.securityClasses)
+
+        # the images were decoded in memory when they were downloaded
+        if len(self.images) == 0:
+            self.logger.vprint(logTypes.WARNING, 'No images found for: {}', self.address)
             return
-        
-        for label in labels:
-            if label.endswith(".txt"):
-                self.logger.vprint(logTypes.INFO, f'Processing label: {label}')
-                labelPath = f"{self.path}{self.detectPath}/labels/{label}"
-                with open(labelPath, "r") as f:
-                    lines = f.readlines()
-                    for line in lines:
-                        line = line.split()
-                        if line[0] == "0":
-                            self.securityDetected["fences"]["total"] += 1
-                            if self.securityDetected["fences"]["locations"].count(f"{imagePathScan}/{label.split('.')[0]}") == 0: # Check if the image is already in the list
-                                self.securityDetected["fences"]["locations"].append(f"{imagePathScan}/{label.split('.')[0]}")
-                        elif line[0] == "1":
-                            self.securityDetected["cameras"]["total"] += 1
-                            if self.securityDetected["cameras"]["locations"].count(f"{imagePathScan}/{label.split('.')[0]}") == 0:
-                                self.securityDetected["cameras"]["locations"].append(f"{imagePathScan}/{label.split('.')[0]}")
-                        else:
-                            self.logger.vprint(logTypes.WARNING, f'Invalid label: {label}')
-                            continue
-        # for file in images:
-            # if file.endswith(".png") or file.endswith(".jpeg"):
-            #     self.logger.vprint(logTypes.INFO, f'Processing image: {file}')
-            #     imagePath = self.path + self.imagesPath + "/" + file
-            #     self.detectObjects(imagePath)
-                # image = cv2.imread(imagePath)
-                # image = cv2.resize(image, None, fx=0.4, fy=0.4)
-                # height, width, channels = image.shape
-
-                # # Detecting objects
-                # blob = cv2.dnn.blobFromImage(image, 0.00392, (416, 416), (0, 0, 0), True, crop=False)
-                # net.setInput(blob)
-                # outs = net.forward(output_layers)
-
-                # if (len(out[0]) == 0) and (len(out[1]) == 0):
-                #     self.logger.vprint(logTypes.INFO, f'No objects detected in image: {file}')
-                #     # delete image 
-                #     os.remove(imagePath)
-                #     continue
-                # # Showing informations on the screen
-                # class_ids = []
-                # confidences = []
-                # boxes = []
-                # for out in outs:
-                    
-                #     for detection in out:
-                #         scores = detection[5:]
-                #         class_id = np.argmax(scores)
-                #         confidence = scores[class_id]
-                #         if confidence > self.aiMetaData[1]:
-                #             # Object detected
-                #             center_x = int(detection[0] * width)
-                #             center_y = int(detection[1] * height)
-                #             w = int(detection[2] * width)
-                #             h = int(detection[3] * height)
-
-                #             # Rectangle coordinates
-                #             x = int(center_x - w / 2)
-                #             y = int(center_y - h / 2)
-
-                #             boxes.append([x, y, w, h])
-                #             confidences.append(float(confidence))
-                #             class_ids.append(class_id)
-                
-                # indexes = cv2.dnn.NMSBoxes(boxes, confidences, self.aiMetaData[1], self.aiMetaData[0])
-                # font = cv2.FONT_HERSHEY_PLAIN
-                # for i in range(len(boxes)):
-                #     if i in indexes:
-                #         x, y, w, h = boxes[i]
-                #         label = str(classes[class_ids[i]])
-                #         color = colours[i]
-                #         cv2.rectangle(image, (x, y), (x + w, y + h), color, 2)
-                #         cv2.putText(image, label, (x, y + 30), font, 3, color, 3)
-                #         if label == "camera":
-                #             self.securityDetected["cameras"]["total"] += 1
-                #             self.securityDetected["cameras"]["locations"].append(imagePath)
-                #         elif label == "gate":
-                #             self.securityDetected["fences"]["total"] += 1
-                #             self.securityDetected["fences"]["locations"].append(imagePath)
-                # cv2.imshow("Image", image)
-                # cv2.waitKey(0)
-                # cv2.destroyAllWindows()
-
-                # gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-                # cv2.imshow("Image", gray)
-                # cv2.waitKey(0)
-                # cv2.destroyAllWindows()
-                # cv2.imwrite(self.path + self.imagesPath + "/" + file, gray)
-                # print(file)
-        pass
-
-    def detectObjects(self, source: str):
-        # run the yolo detect script on the image
-        cmd = f"python3 ./yolov5/detect.py --weights {self.yoloWeights} --name oslfp --img 416 --conf-thres {self.aiMetaData[1]} --iou-thres 0.3 --source {source} --project {self.path}/detect --exist-ok --save-txt"
-        returned_value = subprocess.call(cmd, shell=True)  # returns the exit code in unix
-        if (returned_value == 0): 
-            self.logger.vprint(logTypes.SUCCESS, f'Yolo detect script returned: {returned_value}, Success')
+
+        # collapse the near duplicate crops and re-encodes of the same image so they are only detected once
+        hashes = pHashBatch([image for name, source, image in self.images])
+        if self.nearDuplicateDistance >= 0:
+            kept = collapseNearDuplicates(hashes, self.nearDuplicateDistance)
+            if len(kept) < len(self.images):
+                self.logger.vprint(logTypes.DEBUG, 'Collapsed {} near duplicate images for: {}', len(self.images) - len(kept), self.address)
+            self.images = [self.images[i] for i in kept]
+            hashes = hashes[kept]
+
+        # get the detcted objects from the images, only the parts that changed since the previous scan when there is one
+        if self.previous:
+            detections = self.detectChanges([image for name, source, image in self.images], hashes)
         else:
-            self.logger.vprint(logTypes.ERROR, f'Yolo detect script returned: {returned_value}, Error')
-        
+            detections = self.detectObjects([image for name, source, image in self.images])
+
+        for (name, source, image), boxes in zip(self.images, detections):
+            self.logger.vprint(logTypes.INFO, 'Processing detections: {}, {} objects', name, len(boxes))
+            valid = (boxes[:, 0] >= 0) & (boxes[:, 0] < len(self.securityClasses))
+            if not valid.all():
+                self.logger.vprint(logTypes.WARNING, 'Invalid classes: {} in image: {}', boxes[~valid, 0].astype(int).tolist(), name)
+            imageIndex = self.detectionStore.addImage(self.locationIndex, source)
+            self.detectionStore.add(self.locationIndex, imageIndex, boxes[valid])
+        # Writing to disk is opt in, the next incremental scan compares with this one
+        if self.incremental or self.saveImages:
+            saveImagery(self.path, hashes, [source for name, source, image in self.images], detections)
+        self.securityDetected = self.detectionStore.summary(self.locationIndex, self.securityClasses)
+
+    def detectObjects(self, images: list):
+        # run the shared yolo model on the images
+        with metrics.span('detect'):
+            detections = self.detector.detect(images)
+        metrics.count('detections', sum(len(boxes) for boxes in detections))
+        self.logger.vprint(logTypes.SUCCESS, 'Yolo detected {} objects in {} images', sum(len(boxes) for boxes in detections), len(images))
+        return detections
+
+    # Match each image to the same view in the previous scan by pHash and only run the model on what changed: an unchanged image
+    # keeps its previous detections, a partly changed one keeps the detections outside the changed regions and the regions are
+    # detected, a new or mostly changed image is detected whole. Every crop of every image goes to the model in one batch
+    def detectChanges(self, images: list, hashes: np.ndarray):
+        detections = [None] * len(images)
+        crops = [] # The images and the changed regions sent to the model
+        owners = [] # (image index, region) of each crop, region is None for a whole image
+        distances = hammingDistances(hashes, self.previous['hashes'])
+        for index, image in enumerate(images):
+            match = int(distances[index].argmin()) if distances.shape[1] else -1
+            if match < 0 or distances[index, match] > self.matchDistance:
+                crops.append(image)
+                owners.append((index, None))
+                continue
+            previousBoxes = self.previous['boxes'][match]
+            previousImage = cv2.imread(self.previous['sources'][match]) if os.path.exists(self.previous['sources'][match]) else None
+            if previousImage is None: # Only the hash was kept (the images were not saved), the same view keeps its detections
+                detections[index] = previousBoxes
+                metrics.count('unchanged images')
+                continue
+            mask, changed = changedMask(previousImage, image, self.changeThreshold)
+            if changed == 0:
+                detections[index] = previousBoxes
+                metrics.count('unchanged images')
+            elif changed > self.maxChanged:
+                crops.append(image)
+                owners.append((index, None))
+                metrics.count('changed images')
+            else:
+                detections[index] = unchangedBoxes(previousBoxes, mask)
+                regions = changedRegions(mask)
+                for x, y, width, height in regions:
+                    crops.append(image[y:y + height, x:x + width])
+                    owners.append((index, (x, y, width, height)))
+                metrics.count('changed images')
+                metrics.count('changed regions', len(regions))
+        self.logger.vprint(logTypes.INFO, 'ImageVulnProcessor: {} of {} images seen in the previous scan, {} crops to detect', sum(boxes is not None for boxes in detections), len(images), len(crops))
+
+        found = self.detectObjects(crops) if crops else []
+        for (index, region), boxes in zip(owners, found):
+            if region is None:
+                detections[index] = boxes
+                continue
+            boxes = cropToImage(boxes, region, images[index].shape)
+            detections[index] = mergeDetections(np.concatenate([detections[index], boxes]).astype(np.float32))
+        return detections
+
+
 
 
 if __name__ == "__main__":
@@ -0,0 +1,96 @@
+import queue # For the bounded queues between the stages
+import threading # For the stage workers
+import time # For the stage timings
+
+# Custom imports
+from logger import Logger, logTypes
+from metrics import metrics
+
+STOP = object() # Put on a stage queue once the stage before it has finished
+
+
+# Runs the locations through a chain of stages (geocode -> imagery -> detection -> render).
+# Each stage has its own workers and a bounded queue in front of it, so location N+1 can be
+# geocoding while location N is in detection
+class LocationPipeline():
+    logger = None
+    queueSize = 8 # The max number of locations waiting in front of a stage
+    stages = None
+    def __init__(self, logger: Logger, queueSize: int = 8):
+        self.logger = logger
+        self.queueSize = queueSize
+        self.stages = []
+
+    # A stage runs task on each location, the location is dropped if the task raises or returns False
+    def addStage(self, name: str, task, workers: int = 1):
+        self.stages.append({
+            'name': name,
+            'task': task,
+            'workers': max(1, workers),
+            'queue': queue.Queue(maxsize=self.queueSize),
+            'running': 0,
+            'processed': 0,
+            'busyTime': 0.0,
+            'lock': threading.Lock()
+        })
+
+    def stageWorker(self, index: int):
+        stage = self.stages[index]
+        nextStage = self.stages[index + 1] if index + 1 < len(self.stages) else None
+        while True:
+            item = stage['queue'].get()
+            if item is STOP:
+                break
+            order, location = item
+            startTime = time.perf_counter()
+            try:
+                keep = stage['task'](location) is not False
+            except Exception as e:
+                self.logger.vprint(logTypes.ERROR, 'Pipeline stage {} failed for: {}, Error: {}', stage["name"], location.address["address"], e)
+                keep = False
+            elapsed = time.perf_counter() - startTime
+            metrics.observe(f'stage {stage["name"]}', elapsed)
+            with stage['lock']:
+                stage['processed'] += 1
+                stage['busyTime'] += elapsed
+            if not keep:
+                continue
+            if nextStage:
+                nextStage['queue'].put(item) # Blocks while the next stage is full
+            else:
+                with self.resultsLock:
+                    self.results.append(item)
+        # The last worker of the stage to finish tells the workers of the next stage to stop
+        with stage['lock']:
+            stage['running'] -= 1
+            finished = stage['running'] == 0
+        if finished and nextStage:
+            for _ in range(nextStage['workers']):
+                nextStage['queue'].put(STOP)
+
+    # Run the locations through the stages and return the ones that made it through, in their original order
+    def run(self, locations):
+        self.results = []
+        self.resultsLock = threading.Lock()
+        if not self.stages:
+            return list(locations)
+        threads = []
+        for index, stage in enumerate(self.stages):
+            stage['running'] = stage['workers']
+            for worker in range(stage['workers']):
+                thread = threading.Thread(target=self.stageWorker, args=(index,), name=f'oslfp-{stage["name"]}-{worker}', daemon=True)
+                thread.start()
+                threads.append(thread)
+        startTime = time.perf_counter()
+        firstStage = self.stages[0]
+        for order, location in enumerate(locations):
+            firstStage['queue'].put((order, location))
+        for _ in range(firstStage['workers']):
+            firstStage['queue'].put(STOP)
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - startTime
+        for stage in self.stages:
+            self.logger.vprint(logTypes.DEBUG, 'Pipeline stage {}: {} locations, {:.2f}s busy across {} workers', stage["name"], stage["processed"], stage["busyTime"], stage["workers"])
+        self.logger.vprint(logTypes.INFO, f'Pipeline processed {len(self.results)} locations in {elapsed:.2f}s')
+        return [location for order, location in sorted(self.results, key=lambda item: item[0])]
@@ -9,8 +9,15 @@ class Logger:
     def __init__(self, verbose:bool):
         self.verbose = verbose
         
-    def vprint(self, type: logTypes, message: str):
-        if self.verbose or type == logTypes.ERROR or type == logTypes.SUCCESS  : # Only print if verbose is enabled or if its an error message
+    def enabled(self, type: logTypes):
+        return self.verbose or type == logTypes.ERROR or type == logTypes.SUCCESS
+
+    # The message is only formatted with the args (str.format) when it is printed,
+    # so the hot loops don't pay for building the debug messages when verbose is off
+    def vprint(self, type: logTypes, message: str, *args):
+        if self.enabled(type)  : # Only print if verbose is enabled or if its an error message
+            if args:
+                message = message.format(*args)
             resetColour = '\033[0m'
             logColour = ''
             typeName = type.name
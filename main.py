@@ -1,17 +1,37 @@
 # Imports 
 import argparse
 import os # For parsing the arguments and File System Directory management
-import requests # For making the requests
-from bs4 import BeautifulSoup # For parsing the html
 import re # For the regex
 import googlemaps # For the google maps api
 from decouple import config # for .env file and environment variables
 import uuid # For generating a unique id for each scan
+import asyncio # For the async crawl engine
 import concurrent.futures # For multi threading
+import threading # For the shared state locks
+import time # For the crawl timings
 from multiprocessing import Pool
 
 # Custom imports
 from addressHandler import AddressHandler
+from imageProcessor import ImageVulnProcessor
+from crawlFrontier import CrawlFrontier, looksLikePage, linkScore
+from sitemaps import sitemapUrls
+from httpFetcher import HttpFetcher, AsyncHttpFetcher, HTML_CONTENT_TYPES
+from crawlCache import CrawlCache
+from addressExtractor import extractPage
+from addressIndex import AddressIndex
+from osmPlaces import OsmPlaces
+from satelliteTiles import TileLayer
+from scanCheckpoint import ScanCheckpoint
+from metrics import metrics
+from mapsCache import CachedMapsClient, MapsCacheMiss
+from locationPipeline import LocationPipeline
+from yoloDetector import YoloDetector, BACKENDS, createDetector
+from detectionService import DetectionService
+from imageHash import HashCachedDetector
+from tiledInference import TiledDetector
+from buildingFootprints import FootprintExtractor
+from detectionStore import DetectionStore
 
 # LOGGING
 from logger import Logger, logTypes
@@ -35,189 +55,515 @@ class OpenSourceLocationFingerPrint():
     # self.scanID = # Generate a unique id for the scan
 
     # Web Scraping Vars
-    entryUrl = [] # The url's to start the search from
+    frontier = None # The crawl frontier that holds the url's to search
     searchUrlSet = set() # The set of urls that have been searched
     depth = 3 # The depth of the search
+    crawlThreads = 10 # The number of crawl workers
+    fetcher = None # The http engine shared by the crawl and the image downloads
+    crawlCache = None # The on disk cache of the pages crawled by the previous scans
+    checkpoint = None # The journal of the scan state in ./scans/<scanID>, used to --resume a scan
+    finishedStages = {} # The pipeline stages each location finished before the scan was resumed
     sameDomain = True # Only search the same domain
     vulnScan = True # Scan the location for security vulnerabilities
     placeslimit = 5 # The number of places to search for
 
     # AiVulnScan Vars
     aiMetaData = None # The meta data for the ai vuln scan tuple[scanlimit, min-confidence]
+    detector = None # The detector used by every location: the hash cache in front of the detection service
+    detectionService = None # Batches the images in front of the YOLO model, loaded once and shared by every location
+    tiledDetector = None # Cuts the big images into windows at the inference size (--tiled-inference)
+    footprintService = None # Batches the satellite images of every location through the footprint extractor (--footprints)
+    imageOptions = None # How the area images are downloaded: saveImages, maxImageBytes
+    detectionStore = None # The detections of every location in the scan
     # Address Vars
     addressSet = set() # List of known address Set
+    addressLock = None # Guards the addressSet while the crawl workers add to it
+    addressIndex = None # Merges the variants of the same site so each site is geocoded and scanned once
     knownLocations = [] # List of known locations with Address handler
 
     # Google Maps Vars
     googleMapsAPIKey = None # The google maps api key
     googleMapsClient = None # The google maps client
-
-    def __init__(self):
-        self.logger = Logger(args.verbose)
-        self.depth = args.depth
-        self.sameDomain = args.no_relm
-        self.vulnScan = args.no_vuln
-        self.placeslimit = args.placeslimit
-        self.setUpGoogleMapsAPI() # Get the google maps api key
-        
-        self.aiMetaData = (args.scanlimit, args.confidence)
+    placesClient = None # The local OSM extract used for the nearby places instead of the google places api
+    tileLayer = None # Stitches the satellite images together from the shared tile cache (--imagery tiles)
+
+    # run=False only sets the scan up, the benchmarks swap in their stand-ins before calling run.
+    # scanArgs are the parsed arguments of this scan, the command line arguments by default
+    def __init__(self, run: bool = True, scanArgs: argparse.Namespace = None):
+        self.args = scanArgs or args
+        self.setUp()
+        if run:
+            self.run()
+
+    def setUp(self):
+        self.logger = Logger(self.args.verbose)
+        # The state of this scan, so more than one scan can run in the same process (see batchScan.py)
+        self.scanID = uuid.uuid4()
+        self.addressSet = set()
+        self.knownLocations = []
+        self.finishedStages = {}
+        self.depth = self.args.depth
+        self.crawlThreads = max(1, self.args.threads)
+        self.frontier = CrawlFrontier(self.depth, bestFirst=self.args.crawl_order == 'best-first', maxDomainAddresses=self.args.domain_addresses, stalePages=self.args.stale_pages)
+        self.searchUrlSet = self.frontier.seen
+        self.addressLock = threading.Lock()
+        self.addressIndex = AddressIndex(similarity=self.args.address_similarity)
+        self.sameDomain = self.args.no_relm
+        self.vulnScan = self.args.no_vuln
+        self.placeslimit = self.args.placeslimit
+        self.aiMetaData = (self.args.scanlimit, self.args.confidence)
+        self.detectionStore = DetectionStore()
+        self.imageOptions = {'saveImages': self.args.save_images, 'maxImageBytes': self.args.max_image_bytes, 'nearDuplicateDistance': self.args.near_duplicate_distance,
+                             'incremental': self.args.incremental, 'baselineScan': self.args.baseline_scan, 'changeThreshold': self.args.change_threshold, 'maxChanged': self.args.max_changed}
+        self.setUpResources()
+
+        if self.args.resume:
+            self.resumeScan(self.args.resume)
+        else:
+            self.checkpoint = ScanCheckpoint(f'./scans/{self.scanID}')
+            self.checkpoint.record('scan', scanID=self.scanID, depth=self.depth, sameDomain=self.sameDomain)
 
         self.logger.vprint(logTypes.INFO, 'Starting Open Source Location FingerPrint: scanID: {}'.format(self.scanID))
+        if self.args.live_stats:
+            metrics.startLiveSummary(self.logger, self.args.live_stats)
 
+    # The clients, engines and caches the scan uses, the batch and daemon modes keep them warm between scans
+    def setUpResources(self):
+        self.setUpGoogleMapsAPI() # Get the google maps api key
+        if self.args.osm_extract:
+            self.setUpOsmPlaces()
+        self.setUpFetcher() # Create the shared http engine
+        if self.args.crawl_cache:
+            self.setUpCrawlCache()
+        if self.args.imagery == 'tiles':
+            self.setUpTileLayer()
+        if self.args.footprints or self.args.footprint_gate:
+            self.setUpFootprints()
+        if self.vulnScan:
+            self.setUpDetector() # Load the YOLO weights once for the whole scan
+        return True
+
+    def run(self):
         # Get the Url from the user if its supplies as an argument and strip the quotes if they are there
-        if args.url:
-            for url in args.url:
+        entryUrls = []
+        if self.args.url:
+            for url in self.args.url:
 
-                entryPoint = {"url": f"{url}".strip("'"), "level": 0, "scanned": False}
+                entryUrl = f"{url}".strip("'")
                 # Check if the url is valid
-                if not re.match(r'^https?://', entryPoint['url']):
+                if not re.match(r'^https?://', entryUrl):
                     self.logger.vprint(logTypes.WARNING, f'{url}: is not a valid url, you must include http(s)://.. skipping')
                     continue
                 # Check if the url has already been added
-                if entryPoint['url'] not in self.searchUrlSet:
+                if self.frontier.add(entryUrl, 0):
+                    entryUrls.append(entryUrl)
+                    self.checkpoint.record('url', url=entryUrl, level=0)
                     self.logger.vprint(logTypes.SUCCESS, f'Adding url: {url} to the list of entry points')
-                    self.searchUrlSet.add(entryPoint['url'])
-                    self.entryUrl.append(entryPoint)
+            if entryUrls and self.args.sitemaps:
+                with metrics.span('sitemaps'):
+                    self.seedFromSitemaps(entryUrls)
         else:
             self.logger.vprint(logTypes.WARNING, 'No url was specified, you can specify a url using the -u or --url argument')
 
         # Get the address from the user if its supplies as an argument and strip the quotes if they are there
-        if args.address:
-            for address in args.address:
+        if self.args.address:
+            for address in self.args.address:
+                address = address.strip("'")
                 if address not in self.addressSet:
                     self.logger.vprint(logTypes.SUCCESS, f'Adding address: {address} to the list of known locations')
-                    self.addressSet.add(address.strip("'"))
+                    self.addressSet.add(address)
+                    self.addressIndex.add(address)
+                    self.checkpoint.record('address', address=address)
              
         
-        if not self.entryUrl and not self.addressSet:
+        if not self.searchUrlSet and not self.addressSet:
             self.logger.vprint(logTypes.ERROR, 'No url entry point or known location were specified, please specify either a --url or a --address')
             exit(1)
 
         # Find the locations from the url and add them to the list of known locations - This will also scan nested urls (depth)
-        if not self.entryUrl:
+        if not self.searchUrlSet:
             self.logger.vprint(logTypes.INFO, 'No url entry point was specified, skipping url search')
         else:
-            self.findLocationFromURLs()
+            with metrics.span('crawl'):
+                self.findLocationFromURLs()
 
         if not self.addressSet:
             self.logger.vprint(logTypes.ERROR, 'No known locations were specified or found, please specify either a --url or a --address')
             exit(1)
         else :
-            self.findLocationFromAddress()
-
-        # Scan the locations for vulnerabilities
-        self.scanLocationForVulnerabilities()
+            # Find the locations from the address and scan them for vulnerabilities
+            with metrics.span('locations'):
+                self.findLocationFromAddress()
 
         # Generate a report
-        self.generateReport()
+        with metrics.span('report'):
+            self.generateReport()
+
+        self.logger.vprint(logTypes.SUCCESS, f'Addresses: {self.addressIndex.stats()}')
+        self.tearDown()
 
         # Done 
         self.logger.vprint(logTypes.SUCCESS, f'All Done!')
 
+    # Close the checkpoint and the shared engines and caches, then save the run profile
+    def tearDown(self):
+        self.checkpoint.close()
+        self.fetcher.close()
+        if isinstance(self.detector, HashCachedDetector):
+            self.logger.vprint(logTypes.SUCCESS, f'Detection cache: {self.detector.stats()}')
+            self.detector.close()
+        if self.tiledDetector:
+            self.logger.vprint(logTypes.SUCCESS, f'Tiled inference: {self.tiledDetector.stats()}')
+        if self.detectionService:
+            self.detectionService.close()
+            self.logger.vprint(logTypes.SUCCESS, f'Detection: {self.detectionService.stats()}')
+        if self.crawlCache:
+            self.logger.vprint(logTypes.SUCCESS, f'Crawl cache: {self.crawlCache.stats()}')
+            self.crawlCache.close()
+        if isinstance(self.googleMapsClient, CachedMapsClient):
+            self.logger.vprint(logTypes.SUCCESS, f'Google maps cache: {self.googleMapsClient.stats()}')
+            self.googleMapsClient.close()
+        if self.tileLayer:
+            self.logger.vprint(logTypes.SUCCESS, f'Satellite tiles: {self.tileLayer.stats()}')
+        if self.footprintService:
+            self.footprintService.close()
+            self.logger.vprint(logTypes.SUCCESS, f'Footprints: {self.footprintService.stats()}')
+        self.saveProfile()
+
 
     def findLocationFromURLs(self):
-        # Loop through the entry points
-        def processUrl(entryPoint):
-            # for entryPoint in self.entryUrl:
-            if entryPoint['scanned']:
-                self.logger.vprint(logTypes.DEBUG, f'Url: {entryPoint["url"]} has already been scanned, skipping')
-                return
+        # Get the cached entry of a url from the previous scans and the headers to revalidate it with
+        def cachedEntry(entryPoint):
+            if not self.crawlCache:
+                return None, None
+            cached = self.crawlCache.get(entryPoint['url'])
+            return cached, self.crawlCache.conditionalHeaders(cached)
+
+        # Handle the response of a single entry point from the frontier
+        def processResponse(entryPoint, res, cached=None):
             # Check if we need to keep track of the same root level domain (relm)
             rootDomain = None
             if self.sameDomain:
                 rootDomain = entryPoint['url'].split('/')[2]
-                self.logger.vprint(logTypes.INFO, f'Root level domain: {rootDomain}')
-            # Check if the depth has been reached
-            if entryPoint['level'] <= self.depth:
-                self.logger.vprint(logTypes.INFO, f'Finding locations from the following url: {entryPoint["url"]}')
-                # Make the request
-                res = requests.get(entryPoint['url'])
-                # res = requests.get("https://www.abertay.ac.uk")
-                # Check if the request was successful
-                if res.status_code == 200:
-                    self.logger.vprint(logTypes.INFO, f'Successfully found the following url: {entryPoint["url"]}')
-                    # Parse the html
-                    soup = BeautifulSoup(res.text, 'html.parser')
-                    self.findLocationAddressFromSite(soup)
-                    # Find all the a tags
-                    for link in soup.find_all('a'):
-                        # Check if the link is a valid url
-                        if link.get('href') and link.get('href').startswith('http'):
-                            # Add the url to the list of entry points
-                            self.addNewEntryPoint(link.get('href'), entryPoint['level'] + 1, relm=rootDomain)
-                    # Mark the url as scanned
-                    entryPoint['scanned'] = True
-                else:
-                    self.logger.vprint(logTypes.ERROR, f'Failed to find the following url: {entryPoint["url"]}')           
+                self.logger.vprint(logTypes.INFO, 'Root level domain: {}', rootDomain)
+            # Check if the body was skipped for not being html
+            if res.skipped:
+                metrics.count('skipped pages')
+                self.logger.vprint(logTypes.DEBUG, 'Url: {} is not an html page ({}), skipping', entryPoint['url'], res.headers.get('Content-Type', 'no content type'))
+                return
+            metrics.count('pages')
+            metrics.count('bytes', len(res.content))
+            if res.truncated:
+                metrics.count('truncated pages')
+                self.logger.vprint(logTypes.DEBUG, 'Url: {} is bigger than {} bytes, only the start of it is parsed', entryPoint['url'], self.args.max_page_bytes)
+            # Check if the page has changed since the last scan, if not reuse what was extracted from it
+            if self.crawlCache and self.crawlCache.isUnchanged(cached, res):
+                self.logger.vprint(logTypes.DEBUG, 'Url: {} is unchanged since the last scan, using the cached addresses', entryPoint['url'])
+                self.crawlCache.touch(entryPoint['url'])
+                newSites = self.addKnownAddresses(cached['addresses'])
+                links = cached['links']
+            # Check if the request was successful
+            elif res.status_code == 200:
+                self.logger.vprint(logTypes.INFO, 'Successfully found the following url: {}', entryPoint['url'])
+                # Parse only the tags we need: the addresses and the a tags that are a valid url
+                with metrics.span('parse'):
+                    addresses, links = extractPage(res.content)
+                newSites = self.findLocationAddressFromSite(addresses)
+                if self.crawlCache:
+                    self.crawlCache.store(entryPoint['url'], res, addresses, links)
             else:
-                self.logger.vprint(logTypes.DEBUG, f'Depth limit reached, skipping url: {entryPoint["url"]}')
-
-        # use a thread pool to process the urls
-        executor = concurrent.futures.ThreadPoolExecutor(10)  # Thread pool of 10
-        futures = [executor.submit(processUrl, entryPoint) for entryPoint in self.entryUrl] # Start the load operations and mark each future with its URL
-        concurrent.futures.wait(futures) # Wait for all the futures to finish
+                self.logger.vprint(logTypes.ERROR, 'Failed to find the following url: {}', entryPoint['url'])
+                return
+            # Stop the domain once it has given enough addresses or stopped giving new ones
+            stopped = self.frontier.recordPage(entryPoint['url'], newSites)
+            if stopped:
+                metrics.count('domains stopped')
+                self.logger.vprint(logTypes.SUCCESS, 'Stopping the crawl of: {}, {}', entryPoint['url'].split('/')[2], stopped)
+                return
+            for link in links:
+                # Add the url to the frontier, the pages cached by older scans only have the url of their links
+                url, text = (link, '') if isinstance(link, str) else link
+                self.addNewEntryPoint(url, entryPoint['level'] + 1, relm=rootDomain, anchorText=text)
+
+        # Stream the pages and stop reading them at the cap, the bodies that are not html are never read
+        maxPageBytes = self.args.max_page_bytes or None
+
+        # Each worker keeps pulling from the frontier until the crawl has drained
+        def crawlWorker():
+            while True:
+                entryPoint = self.frontier.get()
+                if entryPoint is None:
+                    return
+                try:
+                    self.logger.vprint(logTypes.INFO, 'Finding locations from the following url: {}', entryPoint['url'])
+                    cached, headers = cachedEntry(entryPoint)
+                    with metrics.span('fetch'):
+                        res = self.fetcher.fetch(entryPoint['url'], headers=headers, maxBytes=maxPageBytes, contentTypes=HTML_CONTENT_TYPES)
+                    processResponse(entryPoint, res, cached)
+                except Exception as e:
+                    self.logger.vprint(logTypes.ERROR, 'Failed to process url: {}, Error: {}', entryPoint['url'], e)
+                finally:
+                    self.frontier.done(entryPoint)
+                    self.checkpoint.record('urlDone', url=entryPoint['url'])
+
+        # Async workers share the frontier without blocking the event loop
+        async def crawlWorkerAsync():
+            while True:
+                entryPoint = self.frontier.get(block=False)
+                if entryPoint is None:
+                    if self.frontier.drained():
+                        return
+                    await asyncio.sleep(0.01) # Other workers may still add urls
+                    continue
+                try:
+                    self.logger.vprint(logTypes.INFO, 'Finding locations from the following url: {}', entryPoint['url'])
+                    cached, headers = cachedEntry(entryPoint)
+                    with metrics.span('fetch'):
+                        res = await self.fetcher.fetchAsync(entryPoint['url'], headers=headers, maxBytes=maxPageBytes, contentTypes=HTML_CONTENT_TYPES)
+                    processResponse(entryPoint, res, cached)
+                except Exception as e:
+                    self.logger.vprint(logTypes.ERROR, 'Failed to process url: {}, Error: {}', entryPoint['url'], e)
+                finally:
+                    self.frontier.done(entryPoint)
+                    self.checkpoint.record('urlDone', url=entryPoint['url'])
+
+        async def crawlAsync():
+            await asyncio.gather(*[crawlWorkerAsync() for _ in range(self.fetcher.maxConnections)])
+
+        startTime = time.perf_counter()
+        if self.fetcher.engine == 'async':
+            # run the workers as coroutines on the fetch engine loop, capped by the connection pool
+            self.fetcher.run(crawlAsync())
+        else:
+            # use a bounded pool of workers that share the frontier
+            with concurrent.futures.ThreadPoolExecutor(self.crawlThreads) as executor:
+                workers = [executor.submit(crawlWorker) for _ in range(self.crawlThreads)]
+                concurrent.futures.wait(workers) # Wait for the frontier to drain
+        elapsed = time.perf_counter() - startTime
+        pagesPerSecond = self.frontier.pagesDone / elapsed if elapsed > 0 else 0
+        self.logger.vprint(logTypes.SUCCESS, 'Crawled {} pages in {:.2f}s ({:.2f} pages/sec)', self.frontier.pagesDone, elapsed, pagesPerSecond)
 
 
     def findLocationFromAddress(self):
           self.logger.vprint(logTypes.INFO, f'Finding locations from the following address: {self.addressSet}')
+          self.logger.vprint(logTypes.INFO, f'{len(self.addressSet)} addresses are {len(self.addressIndex)} sites after merging the variants of the same site')
           # pass the address to the address handler that will get information such as geocode from the address and satalite image
-          for address in self.addressSet:
-              self.knownLocations.append(AddressHandler(address, self.googleMapsClient, self.logger, self.aiMetaData, nearbyPlacesLimit=self.placeslimit, scanid=self.scanID))
-              pass
+          # the handlers run through a pipeline so the network bound stages of different locations overlap
+          locations = (self.createLocation(i, address) for i, address in enumerate(self.addressIndex.addresses()))
+          pipeline = LocationPipeline(self.logger, queueSize=self.args.pipeline_queue)
+          if self.placesClient:
+              # The OSM index finds the nearby places of every location in one query, so every location is geocoded first
+              geocoder = LocationPipeline(self.logger, queueSize=self.args.pipeline_queue)
+              geocoder.addStage('geocode', self.checkpointedStage('geocode', self.geocodeLocation), workers=self.args.geocode_workers)
+              locations = geocoder.run(locations)
+              self.findNearbyPlaces(locations)
+          else:
+              pipeline.addStage('geocode', self.checkpointedStage('geocode', self.geocodeLocation), workers=self.args.geocode_workers)
+          pipeline.addStage('imagery', self.checkpointedStage('imagery', self.imageryLocation), workers=self.args.imagery_workers)
+          if self.footprintService:
+              pipeline.addStage('footprints', self.checkpointedStage('footprints', lambda location: location.findFootprints(self.footprintService)), workers=self.args.footprint_workers)
+          if self.vulnScan:
+              pipeline.addStage('detection', self.checkpointedStage('detection', self.scanLocationForVulnerabilities), workers=self.args.detect_workers)
+          else:
+              self.logger.vprint(logTypes.WARNING, 'Skipping location scans for vulnerabilities')
+          pipeline.addStage('render', self.checkpointedStage('render', lambda location: location.getTopDownImageOfLocationForProcessing()), workers=self.args.render_workers)
+          self.knownLocations = pipeline.run(locations)
+          if self.vulnScan:
+              self.saveDetections()
+
+    def createLocation(self, locationIndex: int, address: str):
+        location = AddressHandler(address, self.googleMapsClient, self.logger, self.aiMetaData, nearbyPlacesLimit=self.placeslimit, scanid=self.scanID, fetcher=self.fetcher, detector=self.detector, imageOptions=self.imageOptions, detectionStore=self.detectionStore, locationIndex=locationIndex, placesClient=self.placesClient, tileLayer=self.tileLayer, initialise=False)
+        # Put back what the location found in the stages it finished before the scan was resumed
+        finished = self.finishedStages.get(locationIndex)
+        if finished and finished['state']:
+            location.address = finished['state']['address']
+            location.nearBy = finished['state']['nearBy']
+            location.securityDetected = finished['state']['securityDetected']
+        return location
+
+    # The nearby places of the geocoded locations from one query of the OSM index, the locations that finished the
+    # imagery stage before the scan was resumed already have theirs
+    def findNearbyPlaces(self, locations: list):
+        pending = [location for location in locations if 'imagery' not in self.finishedStages.get(location.locationIndex, {}).get('stages', [])]
+        if not pending:
+            return
+        with metrics.span('places'):
+            places = self.placesClient.nearbyBatch([tuple(location.address['geocode']['location'].values()) for location in pending], radius=100)
+        for location, found in zip(pending, places):
+            location.addNearbyPlaces(found)
+
+    # Wrap a pipeline stage so it is skipped for the locations that finished it before the scan was resumed,
+    # and so each location that finishes it is written to the checkpoint
+    def checkpointedStage(self, name: str, task):
+        def runStage(location: AddressHandler):
+            finished = self.finishedStages.get(location.locationIndex)
+            if finished and name in finished['stages']:
+                self.logger.vprint(logTypes.DEBUG, 'Location: {} finished the {} stage before the scan was resumed, skipping', location.address["address"], name)
+                return not (finished['dropped'] and finished['stages'][-1] == name)
+            keep = task(location) is not False
+            state = {'address': location.address, 'nearBy': location.nearBy, 'securityDetected': location.securityDetected}
+            self.checkpoint.record('stage', location=location.locationIndex, address=self.addressIndex.addresses()[location.locationIndex], stage=name, keep=keep, state=state)
+            if name == 'detection' and keep:
+                self.checkpoint.record('detections', location=location.locationIndex, **self.detectionStore.exportLocation(location.locationIndex))
+            return keep
+        return runStage
+
+    # Load the state of a scan from its checkpoint and carry on from where it stopped: the urls that were crawled
+    # are not fetched again and the locations skip the pipeline stages they finished (no repeat google or detector calls)
+    def resumeScan(self, scanID: str):
+        scanFolder = f'./scans/{scanID}'
+        if not os.path.exists(f'{scanFolder}/checkpoint.jsonl'):
+            self.logger.vprint(logTypes.ERROR, f'No checkpoint was found for the scan: {scanID} in {scanFolder}')
+            exit(1)
+        self.scanID = scanID
+        self.checkpoint = ScanCheckpoint(scanFolder)
+        state = self.checkpoint.load()
+        # The crawl carries on with the depth and domain rules the scan was started with
+        self.depth = self.frontier.maxDepth = state['scan'].get('depth', self.depth)
+        self.sameDomain = state['scan'].get('sameDomain', self.sameDomain)
+        for url, level in state['urls'].items():
+            self.frontier.restore(url, level, url in state['doneUrls'], linkScore(url))
+        for address in state['addresses']:
+            self.addressSet.add(address)
+            self.addressIndex.add(address)
+        sites = self.addressIndex.addresses()
+        self.finishedStages = {}
+        for locationIndex, finished in state['locations'].items():
+            # The locations are numbered in the order their addresses were found, skip any that do not line up
+            if locationIndex >= len(sites) or sites[locationIndex] != finished['address']:
+                continue
+            self.finishedStages[locationIndex] = finished
+            if 'geocode' in finished['stages'] and finished['state'] and not (finished['dropped'] and finished['stages'][-1] == 'geocode'):
+                self.addressIndex.addPlace(finished['state']['address']['id'], locationIndex)
+            if locationIndex in state['detections']:
+                self.detectionStore.importLocation(locationIndex, state['detections'][locationIndex])
+        self.logger.vprint(logTypes.SUCCESS, f'Resuming scan: {scanID}, {len(state["doneUrls"])} urls already crawled, {len(self.frontier)} left, {len(sites)} locations, {len(self.finishedStages)} with finished stages')
+
+    # Save where the time of the scan went (spans, latency histograms and counters) next to the location folders
+    def saveProfile(self):
+        metrics.stopLiveSummary()
+        if self.crawlCache:
+            metrics.count('crawl cache hits', self.crawlCache.hits)
+        if isinstance(self.googleMapsClient, CachedMapsClient):
+            metrics.count('maps cache hits', self.googleMapsClient.hits)
+        if isinstance(self.detector, HashCachedDetector):
+            metrics.count('hash cache hits', self.detector.hits)
+        metrics.save(f'./scans/{self.scanID}/profile.json')
+        self.logger.vprint(logTypes.SUCCESS, 'Profile: {}', metrics.summary())
+        self.logger.vprint(logTypes.INFO, 'Saved the run profile to: ./scans/{}/profile.json', self.scanID)
+
+    # Save the detections of the scan next to the location folders
+    def saveDetections(self):
+        scanFolder = f'./scans/{self.scanID}'
+        if not os.path.exists(scanFolder):
+            os.makedirs(scanFolder)
+        self.detectionStore.save(f'{scanFolder}/detections.npz')
+        self.logger.vprint(logTypes.DEBUG, f'Saved {self.detectionStore.size} detections to: {scanFolder}/detections.npz')
+
+    def geocodeLocation(self, location: AddressHandler):
+        try:
+            location.findLocationGeoCodeFromAddress()
+        except MapsCacheMiss as e:
+            self.logger.vprint(logTypes.WARNING, 'Skipping address: {}, {}', location.address["address"], e)
+            return False
+        # Different addresses can still geocode to the same place, only the first one is scanned
+        if not self.addressIndex.addPlace(location.address['id'], location.locationIndex):
+            self.logger.vprint(logTypes.DEBUG, 'Location: {} has the same place_id as a known location, merging', location.address["address"])
+            return False
+        return True
+
+    # The satellite image and the nearby places of a location (unless the OSM index found them already). In cache only mode
+    # a location without a cached image is skipped and one without cached places is kept without them
+    def imageryLocation(self, location: AddressHandler):
+        try:
+            if location.getTopDownImageOfLocation() is False:
+                return False # No area to make a satellite image of
+        except MapsCacheMiss as e:
+            self.logger.vprint(logTypes.WARNING, 'Skipping address: {}, {}', location.address["address"], e)
+            return False
+        if self.placesClient:
+            return True
+        try:
+            location.findNearbyBuildings()
+        except MapsCacheMiss as e:
+            self.logger.vprint(logTypes.WARNING, 'No nearby places for: {}, {}', location.address["address"], e)
+        return True
 
-    def addNewEntryPoint(self, url: str, level: int, relm: str = None):
+    def addNewEntryPoint(self, url: str, level: int, relm: str = None, anchorText: str = ''):
         # Check if the url is in the same relm
         if self.sameDomain:
             if relm:
                 if relm not in url:
-                    self.logger.vprint(logTypes.DEBUG, f'Url: {url} is not in the same relm, skipping')
+                    self.logger.vprint(logTypes.DEBUG, 'Url: {} is not in the same relm, skipping', url)
                     return False
             else:
                 self.logger.vprint(logTypes.WARNING, 'No relm was specified, skipping')
                 return False
-        if url in self.searchUrlSet:
-            self.logger.vprint(logTypes.DEBUG, f'Url: {url} has already been added, skipping')
+        # Check if the url is a document, media file or archive instead of a page
+        if not looksLikePage(url):
+            self.logger.vprint(logTypes.DEBUG, 'Url: {} is not an html page, skipping', url)
+            return False
+        # Check if the depth has been reached
+        if not self.frontier.withinDepth(level):
+            self.logger.vprint(logTypes.DEBUG, 'Depth limit reached, skipping url: {}', url)
+            return False
+        score = linkScore(url, anchorText)
+        if not self.frontier.add(url, level, score):
+            self.logger.vprint(logTypes.DEBUG, 'Url: {} has already been added or its domain was stopped, skipping', url)
             return False
-        newEntryPoint = {"url": url, "level": level, "scanned": False}
-        self.searchUrlSet.add(url)
-        self.entryUrl.append(newEntryPoint)   
-        self.logger.vprint(logTypes.INFO, f'Adding nested url: {url} to the list of entry points. Level: {level}')
+        self.checkpoint.record('url', url=url, level=level)
+        self.logger.vprint(logTypes.INFO, 'Adding nested url: {} to the list of entry points. Level: {}, score: {}', url, level, score)
         return True
+
+    # Add the pages listed in the sitemaps of the entry points that look like they have an address on them (contact,
+    # locations, offices, about) as level 1 urls, so they are fetched before the crawl reaches them through the links
+    def seedFromSitemaps(self, entryUrls: list):
+        origins = list(dict.fromkeys('/'.join(url.split('/')[:3]) for url in entryUrls))
+        for origin in origins:
+            urls, sitemaps = sitemapUrls(self.fetcher, origin, maxUrls=self.args.sitemap_limit)
+            seeds = sorted((url for url in urls if linkScore(url) > 0), key=linkScore, reverse=True)
+            added = sum(self.addNewEntryPoint(url, 1, relm=origin.split('/')[2] if self.sameDomain else None) for url in seeds)
+            metrics.count('sitemap seeds', added)
+            self.logger.vprint(logTypes.SUCCESS, 'Seeded {} urls from the {} in {} sitemaps of: {}', added, len(urls), sitemaps, origin)
     
-    def findLocationAddressFromSite(self, soup: BeautifulSoup):
-        # Find all address tags in the html
-        addressFound = []
-        # Via the address tag
-        addressTags = soup.find_all('address')
-        if len(addressTags) == 0:
-            self.logger.vprint(logTypes.WARNING, 'No address tags were found in the html')
-        
-        else: 
-            for address in addressTags:
-                #  Format the address found
-                addressFound.append(" ".join(address.text.split()))
+    # The addresses are extracted by addressExtractor: the address tags, schema.org JSON-LD and postcode / ZIP lines
+    def findLocationAddressFromSite(self, addressFound: list):
+        if len(addressFound) == 0:
+            self.logger.vprint(logTypes.WARNING, 'No addresses were found in the html')
 
         # TODO: Find other ways to find the address on the site
         # DNS Recon SOA records?
         # Whois?
         # Maltego?
         
+        return self.addKnownAddresses(addressFound)
+
+    # Returns the number of new sites among the addresses
+    def addKnownAddresses(self, addressFound: list):
+        newSites = 0
         for address in addressFound:
             # Check if the address is in the list of known locations
-            if address not in self.addressSet:
-                self.logger.vprint(logTypes.SUCCESS, f'Found new location: {address}')
-                self.addressSet.add(address)
+            with self.addressLock:
+                isNew = address not in self.addressSet
+                if isNew:
+                    self.addressSet.add(address)
+            if not isNew:
+                self.logger.vprint(logTypes.DEBUG, 'Location: {} has already been added, skipping', address)
+                continue
+            self.checkpoint.record('address', address=address)
+            if self.addressIndex.add(address):
+                newSites += 1
+                metrics.count('addresses')
+                self.logger.vprint(logTypes.SUCCESS, 'Found new location: {}', address)
             else:
-                self.logger.vprint(logTypes.DEBUG, f'Location: {address} has already been added, skipping')
+                self.logger.vprint(logTypes.DEBUG, 'Location: {} is a variant of a known location, merging', address)
+        return newSites
 
        
 
     # Scan the locations for vulnerabilities 
-    def scanLocationForVulnerabilities(self):
-        if not self.vulnScan:
-            self.logger.vprint(logTypes.WARNING, 'Skipping location scans for vulnerabilities')
-            return False
-        self.logger.vprint(logTypes.INFO, 'Starting location scan for vulnerabilities')
+    def scanLocationForVulnerabilities(self, location: AddressHandler):
+        self.logger.vprint(logTypes.INFO, 'Starting location scan for vulnerabilities: {}', location.address["address"])
         '''
         Each of the vulnerabilities will be checked for by default, but can be specified by the user
         Vulnerabilities to check for:
@@ -226,14 +572,25 @@ class OpenSourceLocationFingerPrint():
         - Hotspots in the area (juctions that are likely to have a lot of traffic)
         - fences that could be climbed (AI to find the fence and check for any gaps)
         '''
-        for location in self.knownLocations:
-            location.runVulnerabilityScan()
-            pass
+        # The footprint pre-pass found no building or barrier in the satellite image, so there is nothing for the model to protect
+        if self.args.footprint_gate and not location.hasStructures(self.args.footprint_min_barrier):
+            self.logger.vprint(logTypes.INFO, 'No buildings or perimeter barriers at: {}, skipping the YOLO pass', location.address["address"])
+            metrics.count('locations gated')
+            # Nothing was detected at a gated location, the report and the results still get its (empty) per class totals
+            location.securityDetected = self.detectionStore.summary(location.locationIndex, ImageVulnProcessor.securityClasses)
+            return True
+        location.runVulnerabilityScan()
+        return True
 
 
     # SETUP: if you dont have your own google map API key you can find out how to get one here https://arc.net/e/2C6BA2AB-400E-4544-9C56-0653DABC446E
     def setUpGoogleMapsAPI(self):
-        self.googleMapsAPIKey = args.gauth_api_key
+        # In cache only mode every request is answered from the maps cache so no api key is needed
+        if self.args.maps_cache_only:
+            self.googleMapsClient = CachedMapsClient(None, maxEntries=self.args.maps_cache_size, offline=True)
+            self.logger.vprint(logTypes.WARNING, 'Google maps cache only mode, locations that are not cached will be skipped')
+            return True
+        self.googleMapsAPIKey = self.args.gauth_api_key
         # Check if the google maps api key is set
         if self.googleMapsAPIKey == None:
             #  get the GOOGLE_MAP_API_KEY from the environment variables
@@ -251,6 +608,77 @@ class OpenSourceLocationFingerPrint():
         except:
             self.logger.vprint(logTypes.ERROR, 'Google maps api key is invalid')
             exit(1)
+        if self.args.maps_cache:
+            # Put the persistent cache in front of the client to save on latency and quota
+            self.googleMapsClient = CachedMapsClient(self.googleMapsClient, maxEntries=self.args.maps_cache_size)
+        return True
+
+
+    # Load the nearby places from a local OpenStreetMap extract (GeoJSON or .osm.pbf) once for the whole scan
+    def setUpOsmPlaces(self):
+        startTime = time.perf_counter()
+        try:
+            self.placesClient = OsmPlaces(self.args.osm_extract)
+        except Exception as e:
+            self.logger.vprint(logTypes.ERROR, f'Failed to load the OSM extract: {self.args.osm_extract}, Error: {e}')
+            exit(1)
+        self.logger.vprint(logTypes.SUCCESS, f'Loaded {len(self.placesClient)} places from the OSM extract: {self.args.osm_extract} in {time.perf_counter() - startTime:.2f}s')
+        return True
+
+
+    # Load the YOLO model in process, this is the slow part of the start up so it is only done once per scan
+    def setUpDetector(self):
+        try:
+            model = createDetector(self.args.detector, self.args.weights, confidence=self.args.confidence, threads=self.args.detector_threads)
+        except Exception as e:
+            self.logger.vprint(logTypes.ERROR, f'Failed to load the YOLO weights: {self.args.weights} with the {self.args.detector} backend, Error: {e}')
+            exit(1)
+        self.logger.vprint(logTypes.SUCCESS, f'Loaded the YOLO weights: {model.weights} with the {model.backend} backend')
+        # Batch the images of every location together to make better use of the CPU
+        self.detectionService = DetectionService(model, self.logger, batchSize=self.args.batch_size, deadline=self.args.batch_deadline / 1000)
+        self.detector = self.detectionService
+        modelKey = f'{model.weights}|{self.args.confidence}'
+        if self.args.tiled_inference:
+            # Run the big images as windows at full resolution so the small objects are not downscaled away
+            self.tiledDetector = self.detector = TiledDetector(self.detector, window=self.args.inference_window, overlap=self.args.inference_overlap, minDetail=self.args.inference_min_detail)
+            modelKey += f'|tiled {self.args.inference_window}'
+        if self.args.hash_cache:
+            # Reuse the detections of images seen by earlier locations and scans
+            self.detector = HashCachedDetector(self.detector, modelKey, maxDistance=self.args.hash_cache_distance, maxEntries=self.args.hash_cache_size)
+        return True
+
+
+    # The building footprint and perimeter barrier extractor, the satellite images of the locations are batched together like the detections
+    def setUpFootprints(self):
+        self.footprintService = DetectionService(FootprintExtractor(minArea=self.args.footprint_min_area), self.logger, batchSize=self.args.batch_size, deadline=self.args.batch_deadline / 1000, metricName='footprints')
+        return True
+
+
+    # The on disk cache of the pages crawled by the previous scans
+    def setUpCrawlCache(self):
+        self.crawlCache = CrawlCache(maxBytes=self.args.crawl_cache_size * 1024 * 1024)
+        return True
+
+
+    # The satellite images are stitched together from z/x/y tiles shared by every location and scan
+    def setUpTileLayer(self):
+        self.tileLayer = TileLayer(fetcher=self.fetcher, mapsClient=self.googleMapsClient, urlTemplate=self.args.tile_url, maxZoom=self.args.tile_zoom, maxSize=self.args.tile_max_size)
+        self.logger.vprint(logTypes.INFO, f'Using satellite tiles from {"the tile server: " + self.args.tile_url if self.args.tile_url else "google static maps"}, max zoom {self.args.tile_zoom}')
+        return True
+
+
+    # Create the http engine, the async engine keeps hundreds of requests in flight on one thread
+    def setUpFetcher(self):
+        if self.args.engine == 'async':
+            try:
+                self.fetcher = AsyncHttpFetcher(maxConnections=self.args.concurrency, perHostLimit=self.args.per_host, timeout=self.args.timeout)
+            except ImportError as e:
+                self.logger.vprint(logTypes.ERROR, f'{e}')
+                exit(1)
+        else:
+            # The connection pool needs to be at least as big as the number of crawl workers
+            self.fetcher = HttpFetcher(maxConnections=max(self.args.concurrency, self.crawlThreads), perHostLimit=self.args.per_host, timeout=self.args.timeout)
+        self.logger.vprint(logTypes.INFO, f'Using the {self.fetcher.engine} http engine')
         return True
 
 
@@ -279,13 +707,32 @@ class OpenSourceLocationFingerPrint():
 
             print(f'\n\t###\n')
 
+    # The findings of the scan as plain data, the batch mode writes them as one JSON line per target
+    def results(self):
+        locations = []
+        for location in self.knownLocations:
+            result = {
+                'address': location.address['address'],
+                'placeId': location.address['id'],
+                'geocode': location.address['geocode']['location'],
+                'topDownImagePath': location.address['topDownImagePath'],
+                'topDownImagePathProcess': location.address['topDownImagePathProcess'],
+                'imageryChange': location.address.get('imageryChange'),
+                'footprints': location.address.get('footprints'),
+                'nearBy': [{'name': place['name'], 'placeId': place['place_id'], 'types': place['types'], 'location': place['geometry']['location']} for place in location.nearBy]
+            }
+            if self.vulnScan:
+                result['securityDetected'] = location.securityDetected
+            locations.append(result)
+        return {'scanID': str(self.scanID), 'addresses': sorted(self.addressSet), 'sites': len(self.addressIndex), 'locations': locations}
+
         
     
 
 
 
 
-if __name__ == '__main__':
+def parseArguments(argv: list = None):
     parser = argparse.ArgumentParser(
                     prog = 'Open Source Loacation Fingerprinting',
                     description = "Takes in a site and finds all of the mentioned physical locations - These locations will then be analysed for any security systems in place or barrier etc",
@@ -294,15 +741,72 @@ if __name__ == '__main__':
     parser.add_argument('-a',  '--address', action="extend", nargs="+",help='Specify an address/location to analyse, eg: --address "Bell St, Dundee DD11HG"', type=ascii)
     parser.add_argument('-u', '--url', action="extend", nargs="+", help='Specify a url to analyse. Include protocal http(s)://, eg: --url "http://www.abertay.com"', type=ascii)
     parser.add_argument('-d', '--depth', help='Specify the depth of the search (inclusive), eg: --depth 3', type=int, default=1)
+    parser.add_argument('-t', '--threads', help='Specify the number of crawl workers, eg: --threads 10', type=int, default=10)
+    parser.add_argument('--engine', help='Specify the http engine used for the crawl and image downloads, eg: --engine async', choices=['thread', 'async'], default='thread')
+    parser.add_argument('--concurrency', help='Specify the max number of requests in flight overall', type=int, default=100)
+    parser.add_argument('--per-host', help='Specify the max number of requests in flight to a single host', type=int, default=8)
+    parser.add_argument('--timeout', help='Specify the request timeout in seconds', type=float, default=10)
+    parser.add_argument('--crawl-order', help='Specify the order the pages are crawled in: best-first fetches the links that look like contact, locations or about pages first, bfs level by level', choices=['best-first', 'bfs'], default='best-first')
+    parser.add_argument('--no-sitemaps', dest='sitemaps', help='Do not seed the crawl with the contact and location pages listed in the robots.txt / sitemap.xml of the entry points', action='store_false')
+    parser.add_argument('--sitemap-limit', help='Specify the max number of sitemap urls read per site', type=int, default=5000)
+    parser.add_argument('--domain-addresses', help='Stop crawling a domain once this many distinct addresses were found on it, 0 never stops', type=int, default=0)
+    parser.add_argument('--stale-pages', help='Stop crawling a domain after this many pages in a row without a new address (once it has one), 0 never stops', type=int, default=0)
+    parser.add_argument('--max-page-bytes', help='Specify the max size in bytes of a crawled page, bigger pages are only parsed up to it (0 = no cap)', type=int, default=2 * 1024 * 1024)
+    parser.add_argument('--no-crawl-cache', dest='crawl_cache', help='If the crawl should not use or update the page cache in ./scans', action='store_false')
+    parser.add_argument('--crawl-cache-size', help='Specify the max size of the page cache in MB before the least recently used pages are evicted', type=int, default=512)
+    parser.add_argument('--no-maps-cache', dest='maps_cache', help='If the google maps requests should not use or update the cache in ./scans', action='store_false')
+    parser.add_argument('--maps-cache-only', help='Only answer the google maps requests from the cache (offline), locations that are not cached are skipped', action='store_true')
+    parser.add_argument('--maps-cache-size', help='Specify the max number of cached google maps results before the least recently used are evicted', type=int, default=20000)
+    parser.add_argument('--address-similarity', help='Specify the min token similarity (0-1) of two addresses with the same postcode to be merged as one site', type=float, default=0.6)
+    parser.add_argument('--osm-extract', help='Find the nearby places in a local OpenStreetMap extract (GeoJSON or .osm.pbf) instead of the google places api', type=str)
+    parser.add_argument('--imagery', help='Specify how the satellite image of a location is made: one static map, or a mosaic of the cached z/x/y tiles covering its bounds', choices=['static', 'tiles'], default='static')
+    parser.add_argument('--tile-url', help='Specify an XYZ tile server for --imagery tiles, eg: "https://tiles.example.com/{z}/{x}/{y}.jpg", google static maps are used without one', type=str)
+    parser.add_argument('--tile-zoom', help='Specify the max zoom of the satellite tiles, the zoom is lowered for areas bigger than --tile-max-size', type=int, default=18)
+    parser.add_argument('--tile-max-size', help='Specify the max pixels per side of a satellite mosaic', type=int, default=1280)
+    parser.add_argument('--footprints', help='Find the building footprints and perimeter barriers (walls, fences) in the satellite image of each location', action='store_true')
+    parser.add_argument('--footprint-gate', help='Only run the YOLO pass on the locations whose satellite image has a building or a perimeter barrier (implies --footprints)', action='store_true')
+    parser.add_argument('--footprint-min-area', help='Specify the min pixels of a building footprint', type=int, default=40)
+    parser.add_argument('--footprint-min-barrier', help='Specify the min metres of perimeter barrier that get a location without buildings through --footprint-gate', type=float, default=100)
+    parser.add_argument('--geocode-workers', help='Specify the number of locations geocoded at the same time', type=int, default=4)
+    parser.add_argument('--imagery-workers', help='Specify the number of locations fetching satellite images and nearby places at the same time', type=int, default=4)
+    parser.add_argument('--detect-workers', help='Specify the number of locations running the vulnerability scan at the same time, their images are batched together', type=int, default=4)
+    parser.add_argument('--footprint-workers', help='Specify the number of locations finding building footprints at the same time, their satellite images are batched together', type=int, default=4)
+    parser.add_argument('--render-workers', help='Specify the number of location maps rendered at the same time', type=int, default=2)
+    parser.add_argument('--pipeline-queue', help='Specify the max number of locations waiting in front of each pipeline stage', type=int, default=8)
     parser.add_argument('-sl', '--scanlimit', help='Specify the number of images to perfrom the AI detection on"', type=int, default=10)
     parser.add_argument('-pl', '--placeslimit', help='Specify the number of places to find within 100m of the location"', type=int, default=5)
+    parser.add_argument('-w', '--weights', help='Specify the YOLO weights used by the vulnerability scan', type=str, default=YoloDetector.weights)
+    parser.add_argument('--save-images', help='Save the downloaded area images to the scan folder for the report', action='store_true')
+    parser.add_argument('--max-image-bytes', help='Specify the max size in bytes of a downloaded area image, bigger images are skipped', type=int, default=5 * 1024 * 1024)
+    parser.add_argument('--near-duplicate-distance', help='Specify the pHash hamming distance (0-64) within which the area images of a location are collapsed, -1 turns it off', type=int, default=6)
+    parser.add_argument('--incremental', help='Only re-detect what changed since the previous scan of each location: unchanged images keep their detections and the satellite image is diffed', action='store_true')
+    parser.add_argument('--baseline-scan', help='Specify the scanID an incremental scan compares with (default: the latest earlier scan of each location)', type=str, default=None)
+    parser.add_argument('--change-threshold', help='Specify the grey level difference (0-255) above which a pixel counts as changed in an incremental scan', type=int, default=30)
+    parser.add_argument('--max-changed', help='Specify the fraction of an image that can change before it is detected whole instead of by region', type=float, default=0.5)
+    parser.add_argument('--no-hash-cache', dest='hash_cache', help='If the detections should not be reused from images seen in earlier locations and scans', action='store_false')
+    parser.add_argument('--hash-cache-size', help='Specify the max number of images in the detection cache before the least recently used are evicted', type=int, default=50000)
+    parser.add_argument('--hash-cache-distance', help='Specify the pHash hamming distance within which an image reuses cached detections', type=int, default=4)
+    parser.add_argument('--detector', help='Specify the detector backend, opencv and onnxruntime run the onnx export of the weights on the CPU', choices=BACKENDS, default='torch')
+    parser.add_argument('--detector-threads', help='Specify the number of CPU threads used for detection (0 = library default)', type=int, default=0)
+    parser.add_argument('--batch-size', help='Specify the max number of images in a detection batch', type=int, default=32)
+    parser.add_argument('--batch-deadline', help='Specify how long in ms a detection batch waits to fill before it is run', type=float, default=50)
+    parser.add_argument('--tiled-inference', help='Cut the images bigger than the inference window into overlapping windows at full resolution, the empty looking windows are skipped', action='store_true')
+    parser.add_argument('--inference-window', help='Specify the pixels per side of a tiled inference window', type=int, default=416)
+    parser.add_argument('--inference-overlap', help='Specify the fraction (0-0.9) of a tiled inference window shared with its neighbours', type=float, default=0.2)
+    parser.add_argument('--inference-min-detail', help='Specify the min mean edge strength (0-255) of a window worth running the model on, 0 runs every window', type=float, default=4.0)
     parser.add_argument('-c', '--confidence', help='Specify the AI detection confidence percentage (eg 0.3 = 30%) ', type=float, default=0.6)
     parser.add_argument('--no-relm', help='If the nested urls to scan are allowed to be outbound of the root domain', action='store_false')
     parser.add_argument('--no-vuln', help='If the script should not run physical security scan', action='store_false')
     parser.add_argument('-gak', '--gauth-api-key', help='Add you google maps auth key. or use .env file for GOOGLE_MAP_API_KEY', type=ascii)
+    parser.add_argument('--live-stats', help='Print a summary of the scan metrics every n seconds, eg: --live-stats 5', type=float, default=0)
+    parser.add_argument('--resume', help='Specify the scanID of a scan that stopped midway to carry on from its checkpoint in ./scans/<scanID>', type=str)
     parser.add_argument('-v',  '--verbose', help='Verbose output', action='store_true')
 
-    args = parser.parse_args()
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    args = parseArguments()
     print(args)
     print(f'{LOGO_OSLFP: ^80}')
     OSLFP = OpenSourceLocationFingerPrint()
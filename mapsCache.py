@@ -0,0 +1,138 @@
+import json # For storing the geocode and places results
+import os # For creating the scans folder
+import sqlite3 # For the on disk cache
+import threading # For sharing the connection between the address handlers
+import time # For the ttl and the last access time used by the eviction
+
+DAY = 24 * 60 * 60
+
+
+# Raised in cache only (offline) mode when a request is not in the cache
+class MapsCacheMiss(Exception):
+    pass
+
+
+# Normalise an address so that case, comma and whitespace variants share a geocode entry
+def normaliseAddress(address: str):
+    return " ".join(address.lower().replace(',', ' ').split())
+
+
+# Persistent cache in front of the googlemaps.Client for the geocode, places_nearby and static_map requests.
+# Used in place of the client, any other request is passed straight through to the client
+class CachedMapsClient():
+    path = "./scans/mapsCache.sqlite"
+    client = None # The googlemaps.Client, None in cache only mode
+    offline = False # Only answer from the cache, never call the api
+    maxEntries = 20000 # The max number of cached results before the least recently used are evicted
+    ttl = {
+        'geocode': 90 * DAY, # Addresses rarely move
+        'places': 7 * DAY, # Businesses open and close
+        'static_map': 30 * DAY # Imagery is only updated every few months
+    }
+    hits = 0
+    misses = 0
+    expired = 0
+    evicted = 0
+    evictFraction = 0.1 # The fraction of maxEntries freed at once, so a full cache is not counted and evicted on every put
+    entries = 0 # The running count of the cached results, only recounted when it goes over maxEntries
+    def __init__(self, client, path: str = None, maxEntries: int = None, ttl: dict = None, offline: bool = False):
+        self.client = client
+        self.offline = offline
+        if path:
+            self.path = path
+        if maxEntries:
+            self.maxEntries = maxEntries
+        self.ttl = {**self.ttl, **(ttl or {})}
+        folder = os.path.dirname(self.path)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder)
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+        self.db.execute('PRAGMA journal_mode=WAL') # The processes of a batch scan read and write the cache at the same time
+        self.db.execute('''CREATE TABLE IF NOT EXISTS results (
+            kind TEXT,
+            key TEXT,
+            value BLOB,
+            created REAL,
+            lastAccess REAL,
+            PRIMARY KEY (kind, key)
+        )''')
+        self.db.execute('CREATE INDEX IF NOT EXISTS resultsLastAccess ON results (lastAccess)')
+        self.db.commit()
+        self.entries = self.db.execute('SELECT COUNT(*) FROM results').fetchone()[0]
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+    # Get a cached result, None if it is missing or older than the ttl of its kind
+    def get(self, kind: str, key: str):
+        with self.lock:
+            row = self.db.execute('SELECT value, created FROM results WHERE kind = ? AND key = ?', (kind, key)).fetchone()
+            if row and time.time() - row[1] > self.ttl[kind]:
+                self.expired += 1
+                row = None
+            if row:
+                self.hits += 1
+                self.db.execute('UPDATE results SET lastAccess = ? WHERE kind = ? AND key = ?', (time.time(), kind, key))
+                self.db.commit()
+            else:
+                self.misses += 1
+        return row[0] if row else None
+
+    def put(self, kind: str, key: str, value: bytes):
+        now = time.time()
+        with self.lock:
+            if self.db.execute('SELECT 1 FROM results WHERE kind = ? AND key = ?', (kind, key)).fetchone() is None:
+                self.entries += 1
+            self.db.execute('INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?)', (kind, key, value, now, now))
+            self.evict()
+            self.db.commit()
+
+    # Drop the least recently used results until the cache fits in maxEntries (called with the lock held).
+    # The table is only counted once the running count goes over, the other processes of a batch add to it too
+    def evict(self):
+        if self.entries <= self.maxEntries:
+            return
+        self.entries = self.db.execute('SELECT COUNT(*) FROM results').fetchone()[0]
+        if self.entries <= self.maxEntries:
+            return
+        overflow = self.entries - int(self.maxEntries * (1 - self.evictFraction))
+        self.db.execute('DELETE FROM results WHERE rowid IN (SELECT rowid FROM results ORDER BY lastAccess LIMIT ?)', (overflow,))
+        self.entries -= overflow
+        self.evicted += overflow
+
+    # Get a result from the cache or fetch it from the api with request
+    def cached(self, kind: str, key: str, request, encode, decode):
+        value = self.get(kind, key)
+        if value is not None:
+            return decode(value)
+        if self.offline or self.client is None:
+            raise MapsCacheMiss(f'No cached {kind} result for: {key}')
+        result = request()
+        self.put(kind, key, encode(result))
+        return result
+
+    def geocode(self, address: str, **kwargs):
+        key = json.dumps([normaliseAddress(address), sorted(kwargs.items())])
+        return self.cached('geocode', key, lambda: self.client.geocode(address, **kwargs), json.dumps, json.loads)
+
+    def places_nearby(self, location=None, radius=None, **kwargs):
+        lat, lng = location
+        key = json.dumps([round(lat, 6), round(lng, 6), radius, sorted(kwargs.items())])
+        return self.cached('places', key, lambda: self.client.places_nearby(location=location, radius=radius, **kwargs), json.dumps, json.loads)
+
+    # The client streams the image in chunks, the cache returns the whole image as a single chunk
+    def static_map(self, size, center=None, zoom=None, maptype=None, **kwargs):
+        key = json.dumps([list(center) if center else None, zoom, list(size), maptype, sorted(kwargs.items())])
+        request = lambda: b"".join(chunk for chunk in self.client.static_map(size=size, center=center, zoom=zoom, maptype=maptype, **kwargs) if chunk)
+        return [self.cached('static_map', key, request, lambda image: image, lambda image: image)]
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        hitRate = self.hits / lookups * 100 if lookups else 0
+        return f'{self.hits} hits, {self.misses} misses ({hitRate:.1f}% hit rate), {self.expired} expired, {self.evicted} evicted'
+
+    def close(self):
+        with self.lock:
+            self.db.commit()
+            self.db.close()
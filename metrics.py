@@ -0,0 +1,95 @@
+import json # For the run profile
+import threading # For the workers recording at the same time and the live summary
+import time # For the span timings
+from contextlib import contextmanager # For the timed spans
+import numpy as np
+
+# Custom imports
+from logger import Logger, logTypes
+
+# The upper bounds in ms of the latency histogram buckets, the last bucket is everything slower
+BUCKETS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000]
+
+
+# Lightweight instrumentation of a scan: timed spans with latency histograms and counters.
+# One instance (metrics below) is shared by every module, it is cheap enough to leave on in the hot loops
+class Metrics():
+    startTime = 0.0
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.startTime = time.perf_counter()
+            self.counters = {} # name -> value
+            self.latencies = {} # span name -> [seconds]
+        self.liveStop = None
+
+    def count(self, name: str, value: int = 1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe(self, name: str, seconds: float):
+        with self.lock:
+            self.latencies.setdefault(name, []).append(seconds)
+
+    # Time the block under the span name: with metrics.span('fetch'): ...
+    @contextmanager
+    def span(self, name: str):
+        startTime = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - startTime)
+
+    def spanSummary(self, seconds: list):
+        ms = np.array(seconds) * 1000
+        counts = np.bincount(np.searchsorted(BUCKETS, ms), minlength=len(BUCKETS) + 1)
+        return {
+            'count': len(ms),
+            'totalSeconds': round(float(ms.sum()) / 1000, 4),
+            'meanMs': round(float(ms.mean()), 3),
+            'p50Ms': round(float(np.percentile(ms, 50)), 3),
+            'p90Ms': round(float(np.percentile(ms, 90)), 3),
+            'p99Ms': round(float(np.percentile(ms, 99)), 3),
+            'maxMs': round(float(ms.max()), 3),
+            'histogram': {f'<={bound}ms': int(count) for bound, count in zip(BUCKETS, counts)} | {f'>{BUCKETS[-1]}ms': int(counts[-1])}
+        }
+
+    # The machine readable profile of the run so far
+    def profile(self):
+        with self.lock:
+            counters = dict(self.counters)
+            latencies = {name: list(seconds) for name, seconds in self.latencies.items()}
+        return {
+            'elapsedSeconds': round(time.perf_counter() - self.startTime, 4),
+            'counters': counters,
+            'spans': {name: self.spanSummary(seconds) for name, seconds in sorted(latencies.items()) if seconds}
+        }
+
+    def save(self, path: str):
+        with open(path, 'w') as f:
+            json.dump(self.profile(), f, indent=2)
+
+    # One line summary: the counters then the count and p50 of each span
+    def summary(self):
+        profile = self.profile()
+        counters = ", ".join(f'{name}: {value}' for name, value in sorted(profile['counters'].items()))
+        spans = ", ".join(f'{name}: {span["count"]}x p50 {span["p50Ms"]:.0f}ms' for name, span in profile['spans'].items())
+        return f'{profile["elapsedSeconds"]:.0f}s | {counters} | {spans}'
+
+    # Print the summary every interval seconds until stopLiveSummary is called
+    def startLiveSummary(self, logger: Logger, interval: float):
+        self.liveStop = threading.Event()
+        def printSummary(stop):
+            while not stop.wait(interval):
+                logger.vprint(logTypes.SUCCESS, 'Stats: {}', self.summary())
+        threading.Thread(target=printSummary, args=(self.liveStop,), name='oslfp-live-stats', daemon=True).start()
+
+    def stopLiveSummary(self):
+        if self.liveStop:
+            self.liveStop.set()
+
+
+metrics = Metrics()
@@ -0,0 +1,167 @@
+import json # For the GeoJSON extracts
+import numpy as np
+
+try:
+    from scipy.spatial import cKDTree # Optional: KD-tree index, the numpy latitude band index is used without it
+except ImportError:
+    cKDTree = None
+
+try:
+    import osmium # Optional: only needed to load .osm.pbf extracts
+except ImportError:
+    osmium = None
+
+EARTH_RADIUS = 6371008.8 # Mean earth radius in metres
+GRID_CELL = 0.005 # The size in degrees of the cells of the numpy grid index (about 550m of latitude)
+# The OSM tags that make a node or way a place worth listing, in the order they are used for its type
+PLACE_TAGS = ['amenity', 'shop', 'office', 'tourism', 'leisure', 'public_transport', 'railway', 'building']
+
+
+# The great circle distance in metres, vectorised: any of the arguments can be numpy arrays that broadcast together
+def haversine(lat1, lng1, lat2, lng2):
+    lat1, lng1, lat2, lng2 = (np.radians(value) for value in (lat1, lng1, lat2, lng2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+# Points on the unit sphere, the straight line distance between two of them only grows with their great circle distance
+def toUnitSphere(lats: np.ndarray, lngs: np.ndarray):
+    lats, lngs = np.radians(lats), np.radians(lngs)
+    return np.column_stack([np.cos(lats) * np.cos(lngs), np.cos(lats) * np.sin(lngs), np.sin(lats)])
+
+
+def placeTypes(tags: dict):
+    return [f'{key}:{tags[key]}' if tags[key] not in ('yes', key) else key for key in PLACE_TAGS if key in tags]
+
+
+# The mean of the outer ring of a GeoJSON geometry, close enough to the centroid for a building footprint
+def geometryCentre(geometry: dict):
+    kind, coordinates = geometry.get('type'), geometry.get('coordinates')
+    if kind == 'Point':
+        return coordinates[1], coordinates[0]
+    if kind == 'Polygon':
+        ring = np.array(coordinates[0], dtype=np.float64)
+    elif kind == 'MultiPolygon':
+        ring = np.array(coordinates[0][0], dtype=np.float64)
+    elif kind == 'LineString':
+        ring = np.array(coordinates, dtype=np.float64)
+    else:
+        return None
+    return float(ring[:, 1].mean()), float(ring[:, 0].mean())
+
+
+# Nearby places from a local OpenStreetMap extract instead of the google places api.
+# The POIs and building footprints are loaded once into a spatial index and every radius query is answered from memory,
+# the results are ranked by distance. Has the same places_nearby interface as the googlemaps.Client
+class OsmPlaces():
+    path = ""
+    places = None # The place of each indexed point in the results layout of places_nearby
+    def __init__(self, path: str):
+        self.path = path
+        if path.endswith('.pbf'):
+            places = self.loadPbf(path)
+        else:
+            places = self.loadGeoJson(path)
+        self.places = [place for place, lat, lng in places]
+        self.lats = np.array([lat for place, lat, lng in places], dtype=np.float64)
+        self.lngs = np.array([lng for place, lat, lng in places], dtype=np.float64)
+        self.buildIndex()
+
+    def loadGeoJson(self, path: str):
+        with open(path, encoding='utf-8') as f:
+            collection = json.load(f)
+        places = []
+        for i, feature in enumerate(collection.get('features', [])):
+            tags = feature.get('properties') or {}
+            types = placeTypes(tags)
+            centre = geometryCentre(feature.get('geometry') or {})
+            if not types or centre is None:
+                continue
+            places.append((self.place(tags, types, feature.get('id', i), *centre), *centre))
+        return places
+
+    def loadPbf(self, path: str):
+        if osmium is None:
+            raise ImportError('osmium is required to load .osm.pbf extracts, install it with: pip install osmium (or convert the extract to GeoJSON)')
+        places = []
+        owner = self
+        class PlaceHandler(osmium.SimpleHandler):
+            def node(self, node):
+                tags = dict(node.tags)
+                types = placeTypes(tags)
+                if types and node.location.valid():
+                    places.append((owner.place(tags, types, f'node/{node.id}', node.location.lat, node.location.lon), node.location.lat, node.location.lon))
+
+            def way(self, way):
+                tags = dict(way.tags)
+                types = placeTypes(tags)
+                if not types:
+                    return
+                points = [(node.lat, node.lon) for node in way.nodes if node.location.valid()]
+                if points:
+                    lat, lng = np.mean(points, axis=0)
+                    places.append((owner.place(tags, types, f'way/{way.id}', float(lat), float(lng)), float(lat), float(lng)))
+        PlaceHandler().apply_file(path, locations=True)
+        return places
+
+    # A place in the same layout as the google places results
+    def place(self, tags: dict, types: list, osmId, lat: float, lng: float):
+        street = " ".join(part for part in [tags.get('addr:housenumber'), tags.get('addr:street')] if part)
+        return {
+            'name': tags.get('name') or tags.get('brand') or types[0],
+            'place_id': f'osm/{osmId}',
+            'types': types,
+            'geometry': {'location': {'lat': lat, 'lng': lng}},
+            'vicinity': ", ".join(part for part in [street, tags.get('addr:city')] if part)
+        }
+
+    def buildIndex(self):
+        if cKDTree is not None:
+            self.tree = cKDTree(toUnitSphere(self.lats, self.lngs)) if len(self.places) else None
+            return
+        # Without scipy the points are bucketed into a grid of GRID_CELL degree cells so a query only looks at the cells around it
+        self.tree = None
+        cells = np.column_stack([np.floor(self.lats / GRID_CELL), np.floor(self.lngs / GRID_CELL)]).astype(np.int64)
+        keys, inverse = np.unique(cells, axis=0, return_inverse=True)
+        order = np.argsort(inverse.ravel(), kind='stable')
+        bounds = np.searchsorted(inverse.ravel()[order], np.arange(len(keys) + 1))
+        self.grid = {(int(lat), int(lng)): order[bounds[i]:bounds[i + 1]] for i, (lat, lng) in enumerate(keys)}
+
+    # The indices of the points within radius metres of each location (a superset from the index, filtered by haversine after)
+    def candidates(self, lats: np.ndarray, lngs: np.ndarray, radius: float):
+        if not len(self.places):
+            return [np.zeros(0, dtype=np.int64) for _ in lats]
+        if self.tree is not None:
+            chord = 2 * np.sin(min(radius / EARTH_RADIUS, np.pi) / 2) * 1.000001
+            return [np.asarray(found, dtype=np.int64) for found in self.tree.query_ball_point(toUnitSphere(lats, lngs), chord)]
+        empty = np.zeros(0, dtype=np.int64)
+        found = []
+        for lat, lng in zip(lats, lngs):
+            latBand = np.degrees(radius / EARTH_RADIUS)
+            lngBand = latBand / max(np.cos(np.radians(lat)), 1e-6)
+            latCells = range(int(np.floor((lat - latBand) / GRID_CELL)), int(np.floor((lat + latBand) / GRID_CELL)) + 1)
+            lngCells = range(int(np.floor((lng - lngBand) / GRID_CELL)), int(np.floor((lng + lngBand) / GRID_CELL)) + 1)
+            if len(latCells) * len(lngCells) > len(self.grid):
+                found.append(np.arange(len(self.places))) # A radius this big covers more cells than there are, check every point
+                continue
+            found.append(np.concatenate([self.grid.get((latCell, lngCell), empty) for latCell in latCells for lngCell in lngCells]))
+        return found
+
+    # The places within radius metres of every location, nearest first: one list of places per location
+    def nearbyBatch(self, locations: list, radius: float = 100, limit: int = None):
+        points = np.asarray(locations, dtype=np.float64).reshape(-1, 2)
+        results = []
+        for (lat, lng), found in zip(points, self.candidates(points[:, 0], points[:, 1], radius)):
+            distances = haversine(lat, lng, self.lats[found], self.lngs[found])
+            inside = distances <= radius
+            found, distances = found[inside], distances[inside]
+            order = np.argsort(distances, kind='stable')[:limit]
+            results.append([{**self.places[index], 'distance': round(float(distances[i]), 1)} for i, index in zip(order, found[order])])
+        return results
+
+    # Drop in for googlemaps.Client.places_nearby
+    def places_nearby(self, location=None, radius=None, **kwargs):
+        return {'results': self.nearbyBatch([location], radius or 100)[0], 'status': 'OK'}
+
+    def __len__(self):
+        return len(self.places)
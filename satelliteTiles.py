@@ -0,0 +1,216 @@
+import concurrent.futures # For fetching the tiles of a mosaic at the same time
+import os # For the tile cache folders
+import threading # For sharing the tile layer between the address handlers
+import time # For the tile ttl
+import cv2
+import numpy as np
+
+# Custom imports
+from metrics import metrics
+
+TILE_SIZE = 256 # The pixels per side of a web mercator tile
+MAX_LATITUDE = 85.05112878 # The web mercator projection stops here
+EARTH_CIRCUMFERENCE = 40075016.686 # At the equator in metres
+
+
+# The global pixel coordinates of latitudes and longitudes at a zoom level (web mercator), vectorised
+def latLngToPixels(lats, lngs, zoom: int):
+    lats = np.radians(np.clip(np.asarray(lats, dtype=np.float64), -MAX_LATITUDE, MAX_LATITUDE))
+    lngs = np.asarray(lngs, dtype=np.float64)
+    scale = TILE_SIZE * 2 ** zoom
+    x = (lngs + 180) / 360 * scale
+    y = (1 - np.log(np.tan(lats) + 1 / np.cos(lats)) / np.pi) / 2 * scale
+    return x, y
+
+
+def pixelsToLatLng(x, y, zoom: int):
+    scale = TILE_SIZE * 2 ** zoom
+    lngs = np.asarray(x, dtype=np.float64) / scale * 360 - 180
+    lats = np.degrees(np.arctan(np.sinh(np.pi * (1 - 2 * np.asarray(y, dtype=np.float64) / scale))))
+    return lats, lngs
+
+
+# The ground size of a pixel at a latitude and zoom level
+def metersPerPixel(lat: float, zoom: int):
+    return EARTH_CIRCUMFERENCE * np.cos(np.radians(lat)) / (TILE_SIZE * 2 ** zoom)
+
+
+# The south west and north east corners that cover both the bounds and the viewport of a google geocode geometry,
+# None when it has neither
+def geometryBox(geometry: dict):
+    boxes = [geometry[key] for key in ['bounds', 'viewport'] if geometry.get(key) and geometry[key]['northeast']['lat'] is not None]
+    if not boxes:
+        return None
+    south = min(box['southwest']['lat'] for box in boxes)
+    west = min(box['southwest']['lng'] for box in boxes)
+    north = max(box['northeast']['lat'] for box in boxes)
+    east = max(box['northeast']['lng'] for box in boxes)
+    return (south, west), (north, east)
+
+
+# Decoded satellite tiles stored once per z/x/y on disk (./scans/tiles/<source>/<z>/<x>/<y>.npy) as raw pixels,
+# they are memory mapped when read so every location and scan (and every process of a batch) shares the same files
+class TileCache():
+    path = "./scans/tiles"
+    ttl = 30 * 24 * 60 * 60 # Imagery is only updated every few months
+    hits = 0
+    misses = 0
+    def __init__(self, source: str, path: str = None, ttl: float = None):
+        if path:
+            self.path = path
+        if ttl:
+            self.ttl = ttl
+        self.folder = f'{self.path}/{source}'
+        self.lock = threading.Lock()
+
+    def tilePath(self, z: int, x: int, y: int):
+        return f'{self.folder}/{z}/{x}/{y}.npy'
+
+    # The cached tile, None when it is missing or older than the ttl
+    def get(self, z: int, x: int, y: int):
+        path = self.tilePath(z, x, y)
+        try:
+            if time.time() - os.path.getmtime(path) > self.ttl:
+                raise FileNotFoundError(path)
+            tile = np.load(path, mmap_mode='r')
+        except (OSError, ValueError):
+            with self.lock:
+                self.misses += 1
+            return None
+        with self.lock:
+            self.hits += 1
+        return tile
+
+    # Written to a temporary file first so a reader never sees half a tile
+    def put(self, z: int, x: int, y: int, tile: np.ndarray):
+        path = self.tilePath(z, x, y)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temporary = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(temporary, 'wb') as f:
+            np.save(f, tile)
+        os.replace(temporary, path)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        hitRate = self.hits / lookups * 100 if lookups else 0
+        return f'{self.hits} tiles reused, {self.misses} fetched ({hitRate:.1f}% hit rate)'
+
+
+# Satellite imagery as a mosaic of z/x/y tiles: each location's geocode bounds map to the tiles that cover them,
+# the missing tiles are fetched at the same time and stored once in the tile cache, so neighbouring locations
+# (and later scans) reuse the tiles they share. The tiles come from an XYZ tile server (urlTemplate with {z} {x} {y})
+# or, without one, from 256x256 google static maps centred on each tile
+class TileLayer():
+    fetcher = None
+    mapsClient = None
+    urlTemplate = None
+    maxZoom = 18 # The zoom used when the area fits in maxSize pixels
+    minZoom = 15 # The zoom is never lowered below this, bigger areas are cropped around the location
+    maxSize = 1280 # The max pixels per side of a mosaic
+    tilesFetched = 0
+    def __init__(self, fetcher=None, mapsClient=None, urlTemplate: str = None, maxZoom: int = 18, maxSize: int = 1280, cache: TileCache = None, workers: int = 8):
+        self.fetcher = fetcher
+        self.mapsClient = mapsClient
+        self.urlTemplate = urlTemplate
+        self.maxZoom = maxZoom
+        self.minZoom = min(self.minZoom, maxZoom)
+        self.maxSize = max(TILE_SIZE, maxSize)
+        self.workers = max(1, workers)
+        self.cache = cache or TileCache('xyz' if urlTemplate else 'static_map')
+        self.lock = threading.Lock()
+        self.pending = {} # (z, x, y) -> Future of the tiles being fetched, so two locations never fetch the same tile
+
+    # The highest zoom at which the box fits in maxSize pixels
+    def zoomFor(self, southWest: tuple, northEast: tuple):
+        for zoom in range(self.maxZoom, self.minZoom - 1, -1):
+            x, y = latLngToPixels([southWest[0], northEast[0]], [southWest[1], northEast[1]], zoom)
+            if x[1] - x[0] <= self.maxSize and y[0] - y[1] <= self.maxSize:
+                return zoom
+        return self.minZoom
+
+    def fetchTile(self, z: int, x: int, y: int):
+        if self.urlTemplate:
+            res = self.fetcher.fetch(self.urlTemplate.format(z=z, x=x, y=y))
+            if res.status_code != 200:
+                raise IOError(f'Tile {z}/{x}/{y} returned status {res.status_code}')
+            content = res.content
+        else:
+            lat, lng = pixelsToLatLng((x + 0.5) * TILE_SIZE, (y + 0.5) * TILE_SIZE, z)
+            with metrics.span('static_map'):
+                content = b"".join(chunk for chunk in self.mapsClient.static_map(size=(TILE_SIZE, TILE_SIZE), center=(float(lat), float(lng)), zoom=z, maptype='satellite') if chunk)
+        tile = cv2.imdecode(np.frombuffer(content, np.uint8), cv2.IMREAD_COLOR)
+        if tile is None:
+            raise IOError(f'Could not decode tile {z}/{x}/{y}')
+        if tile.shape[:2] != (TILE_SIZE, TILE_SIZE):
+            tile = cv2.resize(tile, (TILE_SIZE, TILE_SIZE), interpolation=cv2.INTER_AREA)
+        self.cache.put(z, x, y, tile)
+        with self.lock:
+            self.tilesFetched += 1
+        metrics.count('tiles fetched')
+        return tile
+
+    # The tiles of the keys, from the cache or fetched at the same time. A tile another location is already fetching is waited on
+    def tiles(self, keys: list):
+        found = {}
+        waiting = {}
+        owned = []
+        for key in keys:
+            tile = self.cache.get(*key)
+            if tile is not None:
+                found[key] = tile
+                continue
+            with self.lock:
+                if key in self.pending:
+                    waiting[key] = self.pending[key]
+                else:
+                    waiting[key] = self.pending[key] = concurrent.futures.Future()
+                    owned.append(key)
+        if owned:
+            with concurrent.futures.ThreadPoolExecutor(min(len(owned), self.workers)) as executor:
+                fetches = dict(zip(owned, executor.map(self.fetchOrError, owned)))
+            for key, tile in fetches.items():
+                future = waiting[key]
+                if isinstance(tile, Exception):
+                    future.set_exception(tile)
+                else:
+                    future.set_result(tile)
+                with self.lock:
+                    del self.pending[key]
+        for key, future in waiting.items():
+            found[key] = future.result()
+        return found
+
+    def fetchOrError(self, key: tuple):
+        try:
+            return self.fetchTile(*key)
+        except Exception as e:
+            return e
+
+    # The satellite image covering a geocode geometry (the bounds and viewport around the location), the zoom it was taken at
+    # and the global pixel coordinates (x, y) of its top left corner at that zoom, so its pixels can be mapped back to lat / lng.
+    # The tiles are stitched together with numpy and cropped to the area, at most maxSize pixels per side around the location.
+    # None when the geometry has no area to cover (no bounds or viewport)
+    def mosaic(self, geometry: dict):
+        box = geometryBox(geometry)
+        if box is None:
+            return None
+        southWest, northEast = box
+        zoom = self.zoomFor(southWest, northEast)
+        xs, ys = latLngToPixels([southWest[0], northEast[0], geometry['location']['lat']], [southWest[1], northEast[1], geometry['location']['lng']], zoom)
+        centreX, centreY = xs[2], ys[2]
+        left = max(xs[0], centreX - self.maxSize / 2)
+        right = min(xs[1], centreX + self.maxSize / 2)
+        top = max(ys[1], centreY - self.maxSize / 2)
+        bottom = min(ys[0], centreY + self.maxSize / 2)
+        left, top, right, bottom = int(np.floor(left)), int(np.floor(top)), int(np.ceil(right)), int(np.ceil(bottom))
+        right, bottom = max(right, left + 1), max(bottom, top + 1)
+        tileXs = range(left // TILE_SIZE, (right - 1) // TILE_SIZE + 1)
+        tileYs = range(top // TILE_SIZE, (bottom - 1) // TILE_SIZE + 1)
+        with metrics.span('tiles'):
+            tiles = self.tiles([(zoom, x, y) for y in tileYs for x in tileXs])
+        image = np.concatenate([np.concatenate([tiles[(zoom, x, y)] for x in tileXs], axis=1) for y in tileYs], axis=0)
+        originX, originY = tileXs[0] * TILE_SIZE, tileYs[0] * TILE_SIZE
+        return np.ascontiguousarray(image[top - originY:bottom - originY, left - originX:right - originX]), zoom, (left, top)
+
+    def stats(self):
+        return f'{self.cache.stats()}, {self.tilesFetched} fetched by this scan'
@@ -0,0 +1,62 @@
+import json # For the journal records
+import os # For creating the scan folder
+import threading # For the crawl and pipeline workers recording at the same time
+
+
+# Append only journal of a scan in ./scans/<scanID>/checkpoint.jsonl, one JSON record per line.
+# Every change to the scan state (a url added or crawled, an address found, a location finishing a stage)
+# is appended and flushed as it happens, so a scan that dies midway can be picked up again with --resume
+class ScanCheckpoint():
+    path = ""
+    records = 0 # The number of records written by this run
+    def __init__(self, folder: str):
+        if not os.path.exists(folder):
+            os.makedirs(folder)
+        self.path = f'{folder}/checkpoint.jsonl'
+        self.lock = threading.Lock()
+        self.file = open(self.path, 'a', encoding='utf-8')
+
+    def record(self, kind: str, **fields):
+        line = json.dumps({'type': kind, **fields}, separators=(',', ':'), default=str)
+        with self.lock:
+            if self.file.closed:
+                return
+            self.file.write(line + '\n')
+            self.file.flush() # Survives the process dying, one write per record keeps it cheap under load
+            self.records += 1
+
+    # Replay the journal into the state of the scan:
+    # scan: the options of the scan, urls: url -> level, doneUrls: the urls that were crawled, addresses: in the order found,
+    # locations: location index -> {'address', 'stages': [finished stages], 'dropped', 'state'}, detections: location index -> rows
+    def load(self):
+        state = {'scan': {}, 'urls': {}, 'doneUrls': set(), 'addresses': [], 'locations': {}, 'detections': {}}
+        if not os.path.exists(self.path):
+            return state
+        with open(self.path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue # The last line can be cut short if the scan died while writing it
+                kind = record.pop('type', None)
+                if kind == 'scan':
+                    state['scan'].update(record)
+                elif kind == 'url':
+                    state['urls'].setdefault(record['url'], record['level'])
+                elif kind == 'urlDone':
+                    state['doneUrls'].add(record['url'])
+                elif kind == 'address':
+                    state['addresses'].append(record['address'])
+                elif kind == 'stage':
+                    location = state['locations'].setdefault(record['location'], {'address': record['address'], 'stages': [], 'dropped': False, 'state': None})
+                    location['stages'].append(record['stage'])
+                    location['dropped'] = not record['keep']
+                    if record.get('state'):
+                        location['state'] = record['state']
+                elif kind == 'detections':
+                    state['detections'][record['location']] = record
+        return state
+
+    def close(self):
+        with self.lock:
+            self.file.close()
@@ -0,0 +1,204 @@
+# Daemon mode: keeps the imports, the google maps client, the http engine, the caches and the YOLO model warm
+# and runs the scans submitted to a small local HTTP job API, so a scan starts in milliseconds instead of seconds
+# Run from the root of the repo: python scanDaemon.py --port 8765 --jobs 2 -d 2 --detector onnxruntime
+#   curl -X POST localhost:8765/scans -d '{"url": "https://www.abertay.ac.uk"}'   -> {"id": ..., "status": "queued"}
+#   curl localhost:8765/scans/<id>   curl localhost:8765/scans/<id>/results   curl localhost:8765/stats
+import argparse
+import json # For the request and response bodies
+import threading # For the job table
+import time # For the job timings
+import uuid # For the job ids
+from collections import OrderedDict # For dropping the oldest finished jobs
+from concurrent.futures import ThreadPoolExecutor # For the bounded job concurrency
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import main
+from metrics import metrics
+from batchScan import BatchScan, makeTarget, scanTarget, closeSharedResources
+from logger import Logger, logTypes
+
+
+# A scan run by the daemon, every scan shares the warm resources of the daemon including the in process detector,
+# so the images of the jobs running at the same time meet in the same detection batches
+class DaemonScan(BatchScan):
+    perScanMetrics = False # The jobs run at the same time, the profile covers the whole daemon
+
+    def setUpDetector(self):
+        return self.shared('detector', super(BatchScan, self).setUpDetector)
+
+    # The metrics are the daemon's, not the job's, so no profile.json is written per job (see GET /stats)
+    def tearDown(self):
+        self.checkpoint.close()
+
+
+# Raised when a job is submitted with the id of a known job
+class DuplicateJob(Exception):
+    pass
+
+
+# The submitted scans, their status and their results. At most maxQueued jobs wait for one of the job workers
+# and only the last keepJobs finished jobs are kept
+class ScanJobs():
+    maxQueued = 100
+    keepJobs = 1000
+    def __init__(self, logger: Logger, workers: int = 2, maxQueued: int = 100, keepJobs: int = 1000):
+        self.logger = logger
+        self.maxQueued = maxQueued
+        self.keepJobs = keepJobs
+        self.lock = threading.Lock()
+        self.jobs = OrderedDict() # job id -> job
+        self.queued = 0
+        self.executor = ThreadPoolExecutor(max(1, workers), thread_name_prefix='oslfp-job')
+
+    # Queue a scan of the target, None when the queue is full. Raises DuplicateJob when a job with its id exists
+    def submit(self, target: dict):
+        job = {'id': target['id'], 'status': 'queued', 'target': target, 'submitted': time.time(), 'started': None, 'finished': None, 'result': None}
+        with self.lock:
+            if job['id'] in self.jobs:
+                raise DuplicateJob(job['id'])
+            if self.queued >= self.maxQueued:
+                return None
+            self.queued += 1
+            self.jobs[job['id']] = job
+        self.executor.submit(self.runJob, job)
+        self.logger.vprint(logTypes.INFO, 'Queued job: {} for {}', job['id'], target['url'] or target['address'])
+        return job
+
+    def runJob(self, job: dict):
+        with self.lock:
+            self.queued -= 1
+            job['status'] = 'running'
+            job['started'] = time.time()
+        result = scanTarget(job['target'], DaemonScan)
+        with self.lock:
+            job['result'] = result
+            job['status'] = result['status']
+            job['finished'] = time.time()
+            self.dropFinished()
+        self.logger.vprint(logTypes.SUCCESS if result['status'] == 'done' else logTypes.ERROR, 'Job: {} {} in {:.1f}s', job['id'], result['status'], result['elapsedSeconds'])
+
+    # Drop the oldest finished jobs past keepJobs (called with the lock held)
+    def dropFinished(self):
+        finished = [jobId for jobId, job in self.jobs.items() if job['finished']]
+        for jobId in finished[:max(0, len(finished) - self.keepJobs)]:
+            del self.jobs[jobId]
+
+    # The status of a job without its results
+    def status(self, job: dict):
+        status = {key: job[key] for key in ['id', 'status', 'submitted', 'started', 'finished']}
+        status['target'] = {key: job['target'][key] for key in ['url', 'address', 'depth']}
+        if job['result']:
+            status['scanID'] = job['result'].get('scanID')
+            status['error'] = job['result'].get('error')
+            status['locations'] = len(job['result'].get('locations', []))
+        return status
+
+    def get(self, jobId: str):
+        with self.lock:
+            return self.jobs.get(jobId)
+
+    def list(self):
+        with self.lock:
+            return [self.status(job) for job in self.jobs.values()]
+
+    def counts(self):
+        with self.lock:
+            counts = {}
+            for job in self.jobs.values():
+                counts[job['status']] = counts.get(job['status'], 0) + 1
+            return counts
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+# POST /scans {"url", "address", "depth"} submits a scan, GET /scans lists the jobs, GET /scans/<id> is the status of a job,
+# GET /scans/<id>/results are its results once it is done and GET /stats is the metrics of the daemon
+class ScanRequestHandler(BaseHTTPRequestHandler):
+    jobs = None
+    logger = None
+
+    def reply(self, code: int, body):
+        data = json.dumps(body, default=str).encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        if self.path.rstrip('/') != '/scans':
+            return self.reply(404, {'error': f'Unknown path: {self.path}'})
+        try:
+            fields = json.loads(self.rfile.read(int(self.headers.get('Content-Length') or 0)) or b'{}')
+            target = makeTarget(fields, str(uuid.uuid4()))
+        except (ValueError, AttributeError, TypeError) as e:
+            return self.reply(400, {'error': f'The body is not a scan target: {e}'})
+        if not target['url'] and not target['address']:
+            return self.reply(400, {'error': 'Specify either a url or an address to scan'})
+        try:
+            job = self.jobs.submit(target)
+        except DuplicateJob:
+            return self.reply(409, {'error': f'A job with the id: {target["id"]} already exists'})
+        if job is None:
+            return self.reply(503, {'error': 'Too many scans are queued, try again later'})
+        return self.reply(202, self.jobs.status(job))
+
+    def do_GET(self):
+        parts = [part for part in self.path.split('?')[0].split('/') if part]
+        if parts == ['stats']:
+            return self.reply(200, {'jobs': self.jobs.counts(), **metrics.profile()})
+        if parts == ['scans']:
+            return self.reply(200, self.jobs.list())
+        if len(parts) in (2, 3) and parts[0] == 'scans':
+            job = self.jobs.get(parts[1])
+            if job is None:
+                return self.reply(404, {'error': f'No job with the id: {parts[1]}'})
+            if len(parts) == 2:
+                return self.reply(200, self.jobs.status(job))
+            if parts[2] == 'results':
+                if not job['result']:
+                    return self.reply(409, {'error': f'The job is {job["status"]}', **self.jobs.status(job)})
+                return self.reply(200, job['result'])
+        return self.reply(404, {'error': f'Unknown path: {self.path}'})
+
+    def log_message(self, format, *args):
+        self.logger.vprint(logTypes.DEBUG, 'API: {}', format % args)
+
+
+def runDaemon(daemonArgs, scanArgv: list):
+    scanArgs = main.parseArguments(scanArgv)
+    logger = Logger(scanArgs.verbose)
+    startTime = time.perf_counter()
+    DaemonScan.scanArgv = scanArgv
+    DaemonScan.warmUp(scanArgs)
+    logger.vprint(logTypes.SUCCESS, f'Warmed up the google maps client, http engine, caches and detector in {time.perf_counter() - startTime:.2f}s')
+
+    ScanRequestHandler.jobs = ScanJobs(logger, workers=daemonArgs.jobs, maxQueued=daemonArgs.max_queued, keepJobs=daemonArgs.keep_jobs)
+    ScanRequestHandler.logger = logger
+    server = ThreadingHTTPServer((daemonArgs.host, daemonArgs.port), ScanRequestHandler)
+    server.daemon_threads = True
+    logger.vprint(logTypes.SUCCESS, f'Scan daemon listening on http://{daemonArgs.host}:{daemonArgs.port}, {daemonArgs.jobs} scans at a time')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logger.vprint(logTypes.WARNING, 'Stopping the scan daemon')
+    finally:
+        server.server_close()
+        ScanRequestHandler.jobs.close()
+        closeSharedResources()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+                    prog = 'Open Source Loacation Fingerprinting - Daemon',
+                    description = 'Keeps the scan resources and the YOLO model warm and runs the scans submitted to a local HTTP job API',
+                    epilog = 'Every other argument is passed on to the scan of each job, see python main.py --help',
+                    allow_abbrev = False)
+    parser.add_argument('--host', help='Specify the address the job API listens on, only this machine by default', type=str, default='127.0.0.1')
+    parser.add_argument('--port', help='Specify the port the job API listens on', type=int, default=8765)
+    parser.add_argument('--jobs', help='Specify the number of scans run at the same time', type=int, default=2)
+    parser.add_argument('--max-queued', help='Specify the max number of scans waiting to run, more are refused with a 503', type=int, default=100)
+    parser.add_argument('--keep-jobs', help='Specify the number of finished jobs whose results are kept in memory', type=int, default=1000)
+    daemonArgs, scanArgv = parser.parse_known_args()
+    runDaemon(daemonArgs, scanArgv)
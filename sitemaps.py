@@ -0,0 +1,63 @@
+import gzip # For the .xml.gz sitemaps
+import html # For the escaped urls in the sitemaps
+import io
+import re # For the sitemap urls and the robots.txt sitemap lines
+from collections import deque # For the sitemaps still to read
+
+# Custom imports
+from crawlFrontier import linkScore
+
+LOC = re.compile(rb'<loc>\s*(?:<!\[CDATA\[)?\s*(.*?)\s*(?:\]\]>)?\s*</loc>', re.IGNORECASE | re.DOTALL)
+SITEMAP_INDEX = re.compile(rb'<sitemapindex\b', re.IGNORECASE)
+ROBOTS_SITEMAP = re.compile(r'^\s*sitemap\s*:\s*(\S+)', re.IGNORECASE | re.MULTILINE)
+DEFAULT_SITEMAPS = ['/sitemap.xml', '/sitemap_index.xml'] # Tried when robots.txt does not list any
+
+
+# The urls of a sitemap and if it is a sitemap index (its urls are other sitemaps). The <loc> tags are read with a regex
+# so a sitemap cut short at the size cap still gives the urls before the cut
+def parseSitemap(content: bytes, maxBytes: int = 10 * 1024 * 1024):
+    if content[:2] == b'\x1f\x8b':
+        try:
+            with gzip.GzipFile(fileobj=io.BytesIO(content)) as f:
+                content = f.read(maxBytes)
+        except (OSError, EOFError):
+            return False, []
+    urls = [html.unescape(url.decode('utf-8', errors='replace')) for url in LOC.findall(content)]
+    return bool(SITEMAP_INDEX.search(content, 0, 4096)), [url for url in urls if url.startswith('http')]
+
+
+# The sitemaps listed in a robots.txt
+def robotsSitemaps(text: str):
+    return ROBOTS_SITEMAP.findall(text)
+
+
+# The page urls of the sitemaps of a site (from its robots.txt, /sitemap.xml otherwise), the child sitemaps of an index
+# that look like they hold the location pages are read first. Returns the urls and the number of sitemaps read
+def sitemapUrls(fetcher, origin: str, maxUrls: int = 5000, maxSitemaps: int = 10, maxBytes: int = 10 * 1024 * 1024):
+    sitemaps = []
+    try:
+        res = fetcher.fetch(f'{origin}/robots.txt', maxBytes=512 * 1024)
+        if res.status_code == 200:
+            sitemaps = robotsSitemaps(res.text)
+    except Exception:
+        pass # No robots.txt, try the default sitemaps
+    pending = deque(sitemaps or [f'{origin}{path}' for path in DEFAULT_SITEMAPS])
+    read = set()
+    urls = []
+    while pending and len(read) < maxSitemaps and len(urls) < maxUrls:
+        sitemap = pending.popleft()
+        if sitemap in read:
+            continue
+        read.add(sitemap)
+        try:
+            res = fetcher.fetch(sitemap, maxBytes=maxBytes)
+        except Exception:
+            continue
+        if res.status_code != 200:
+            continue
+        isIndex, found = parseSitemap(res.content, maxBytes)
+        if isIndex:
+            pending.extendleft(sorted(found, key=linkScore)) # Best scoring child first, before the other default sitemaps
+        else:
+            urls.extend(found)
+    return urls[:maxUrls], len(read)
@@ -0,0 +1,28 @@
+import os
+import sys
+
+import pytest
+
+# The modules are run as scripts from the repo root, the fixtures are shared with the benchmarks
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+from fixtures import SyntheticSite, loadFixtureImages
+
+
+# A small synthetic website served from memory for the whole test run
+@pytest.fixture(scope='session')
+def site():
+    site = SyntheticSite(pages=60, depth=2, addressDensity=0.5, sites=5, crossLinks=2, images=[b'image'], seed=1).start()
+    yield site
+    site.stop()
+
+
+# The fixture images decoded to BGR arrays
+@pytest.fixture(scope='session')
+def images():
+    cv2 = pytest.importorskip('cv2')
+    np = pytest.importorskip('numpy')
+    decoded = [cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR) for data in loadFixtureImages(limit=40)]
+    return [image for image in decoded if image is not None]
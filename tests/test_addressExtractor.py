@@ -0,0 +1,51 @@
+import json
+
+import pytest
+
+pytest.importorskip('bs4')
+import addressExtractor
+from addressExtractor import extractPage, parseTargetTagsSoup, parseTargetTagsLxml
+
+
+def compact(text: str):
+    return text.upper().replace(' ', '')
+
+
+def test_finds_the_address_of_every_synthetic_page(site):
+    for page in range(site.pages):
+        content = site.page(page)
+        addresses, links = extractPage(content)
+        postcodes = [postcode for number, street, town, postcode in site.addresses if compact(postcode) in compact(content.decode())]
+        for postcode in postcodes:
+            assert any(compact(postcode) in compact(address) for address in addresses), (page, addresses)
+        if not postcodes:
+            assert addresses == []
+
+
+def test_links_keep_their_anchor_text(site):
+    addresses, links = extractPage(site.page(0))
+    assert links[0] == [f'{site.url}/1.html', 'Link 0']
+    assert all(url.startswith(site.url) for url, anchorText in links)
+
+
+def test_address_lines_split_by_br_are_joined():
+    addresses, links = extractPage(b'<html><body><address>12 High Street<br>Dundee DD1 4HN</address></body></html>')
+    assert addresses == ['12 High Street Dundee DD1 4HN']
+
+
+def test_json_ld_postal_address():
+    block = json.dumps({'@type': 'Organization', 'address': {'@type': 'PostalAddress', 'streetAddress': '1 Bell Street', 'addressLocality': 'Dundee', 'postalCode': 'DD1 1HG'}})
+    addresses, links = extractPage(f'<html><head><script type="application/ld+json">{block}</script></head></html>'.encode())
+    assert addresses == ['1 Bell Street, Dundee, DD1 1HG']
+
+
+def test_prose_and_relative_links_are_skipped():
+    content = b'<p>' + b'word ' * 40 + b'DD1 4HN</p><a href="/local">Local</a><a href="mailto:a@b.c">Mail</a>'
+    assert extractPage(content) == ([], [])
+
+
+@pytest.mark.skipif(addressExtractor.etree is None, reason='lxml is not installed')
+def test_lxml_and_soup_parsers_agree(site):
+    for page in range(site.pages):
+        content = site.page(page)
+        assert parseTargetTagsLxml(content) == parseTargetTagsSoup(content)
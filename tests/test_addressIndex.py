@@ -0,0 +1,51 @@
+import pytest
+
+pytest.importorskip('bs4')
+from addressExtractor import extractPage
+from addressIndex import AddressIndex, findPostcode, normaliseAddress
+
+
+@pytest.mark.parametrize('address, postcode', [
+    ('12 High Street, Dundee DD1 4HN', 'DD14HN'),
+    ('12 High Street, DUNDEE DD14HN', 'DD14HN'),
+    ('500 Market St, San Francisco, CA 94103', '94103'),
+    ('350 Fifth Avenue, New York, NY 10118-0110', '10118'),
+    ('1600 Pennsylvania Avenue 20500', '20500'),
+    ('12345 Main Street Suite 10001 Springfield', None),
+    ('Unit 5, 10001 Park Road', None)
+])
+def test_find_postcode(address, postcode):
+    assert findPostcode(address)[0] == postcode
+
+
+def test_normalise_expands_abbreviations_and_drops_the_postcode():
+    assert normaliseAddress('12 High St, Dundee DD1 4HN') == normaliseAddress('12 HIGH STREET, DUNDEE, DD14HN')
+    assert normaliseAddress('12 High St, Dundee DD1 4HN')[1] == frozenset({'12', 'high', 'street', 'dundee'})
+
+
+def test_variants_of_the_synthetic_sites_merge(site):
+    index = AddressIndex()
+    addresses = [address for page in range(site.pages) for address in extractPage(site.page(page))[0]]
+    for address in addresses:
+        index.add(address)
+    # One site per physical address that was written on a page, however many ways it was written
+    written = {postcode for number, street, town, postcode in site.addresses if any(postcode.replace(' ', '') in address.upper().replace(' ', '') for address in addresses)}
+    assert len(index) == len(written) > 0
+    assert index.merged > 0
+
+
+def test_different_house_numbers_are_different_sites():
+    index = AddressIndex()
+    assert index.add('12 High Street, Dundee DD1 4HN')
+    assert index.add('14 High Street, Dundee DD1 4HN')
+    assert not index.add('12 High St, Dundee DD1 4HN')
+    assert len(index) == 2 and '12 High St, Dundee DD1 4HN' in index
+
+
+def test_place_ids_merge_after_geocoding():
+    index = AddressIndex()
+    assert index.addPlace('place-1', 0)
+    assert index.addPlace('place-1', 0)
+    assert not index.addPlace('place-1', 1)
+    assert index.addPlace(None, 2)
+    assert index.placeMerged == 1
@@ -0,0 +1,76 @@
+import pytest
+
+from fixtures import FakeMapsClient
+from mapsCache import CachedMapsClient, MapsCacheMiss
+
+
+@pytest.fixture
+def mapsClient(tmp_path):
+    client = CachedMapsClient(FakeMapsClient(latency=0, images=[b'image']), path=str(tmp_path / 'maps.sqlite'), maxEntries=10)
+    yield client
+    client.close()
+
+
+def test_maps_cache_answers_repeats_from_the_cache(mapsClient):
+    first = mapsClient.geocode('12 High Street, Dundee')
+    assert mapsClient.geocode('12 high street dundee') == first
+    assert mapsClient.static_map((500, 500), center=(56.46, -2.97)) == [b'image']
+    assert mapsClient.static_map((500, 500), center=(56.46, -2.97)) == [b'image']
+    assert mapsClient.client.calls == {'geocode': 1, 'places_nearby': 0, 'static_map': 1}
+    assert mapsClient.hits == 2
+
+
+def test_maps_cache_evicts_the_least_recently_used(mapsClient):
+    for i in range(10):
+        mapsClient.geocode(f'{i} High Street, Dundee')
+    mapsClient.geocode('0 High Street, Dundee') # The oldest entry is used again so it is kept
+    mapsClient.geocode('10 High Street, Dundee')
+    assert mapsClient.evicted == 2 # Down to 90% of maxEntries at once
+    assert mapsClient.entries == mapsClient.db.execute('SELECT COUNT(*) FROM results').fetchone()[0] == 9
+    calls = mapsClient.client.calls['geocode']
+    mapsClient.geocode('0 High Street, Dundee')
+    assert mapsClient.client.calls['geocode'] == calls
+    mapsClient.geocode('1 High Street, Dundee')
+    assert mapsClient.client.calls['geocode'] == calls + 1
+
+
+def test_maps_cache_only_mode_raises_on_a_miss(mapsClient):
+    mapsClient.geocode('12 High Street, Dundee')
+    offline = CachedMapsClient(None, path=mapsClient.path, offline=True)
+    assert offline.geocode('12 High Street, Dundee')
+    with pytest.raises(MapsCacheMiss):
+        offline.places_nearby(location=(56.46, -2.97), radius=100)
+    offline.close()
+
+
+# Gives every image the same boxes and counts the images it was asked to detect
+class CountingDetector():
+    def __init__(self, boxes):
+        self.boxes = boxes
+        self.images = 0
+
+    def detect(self, images):
+        self.images += len(images)
+        return [self.boxes for _ in images]
+
+
+def test_hash_cache_reuses_and_evicts_the_least_recently_used(tmp_path, images):
+    np = pytest.importorskip('numpy')
+    from imageHash import HashCachedDetector, pHashBatch, collapseNearDuplicates
+    distinct = [images[i] for i in collapseNearDuplicates(pHashBatch(images), 4)][:12]
+    assert len(distinct) == 12
+    detector = CountingDetector(np.array([[0, 0.9, 0.5, 0.5, 0.1, 0.1]], dtype=np.float32))
+    cache = HashCachedDetector(detector, 'test', path=str(tmp_path / 'hashes.sqlite'), maxEntries=10)
+    cache.detect(distinct[:10] + distinct[:1]) # A repeat in the batch is stored once
+    assert cache.entries == len(cache.knownHashes) == 10
+    cache.detect(distinct[:1]) # Reused so it is kept
+    assert cache.hits == 1
+    cache.detect(distinct[10:12])
+    assert cache.evicted == 3 # Down to 90% of maxEntries at once
+    assert cache.entries == len(cache.knownHashes) == 9
+    detected = detector.images
+    cache.detect(distinct[:1])
+    assert detector.images == detected
+    cache.detect(distinct[1:2])
+    assert detector.images == detected + 1
+    cache.close()
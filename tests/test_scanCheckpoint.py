@@ -0,0 +1,57 @@
+import pytest
+
+from scanCheckpoint import ScanCheckpoint
+
+
+# Open the checkpoint of the folder again the way --resume does
+def load(folder):
+    checkpoint = ScanCheckpoint(str(folder))
+    state = checkpoint.load()
+    checkpoint.close()
+    return state
+
+
+def test_resume_replays_the_journal(tmp_path):
+    checkpoint = ScanCheckpoint(str(tmp_path))
+    checkpoint.record('scan', urls=['https://example.com'], depth=2)
+    checkpoint.record('url', url='https://example.com', level=0)
+    checkpoint.record('url', url='https://example.com/contact', level=1)
+    checkpoint.record('url', url='https://example.com/contact', level=2)
+    checkpoint.record('urlDone', url='https://example.com')
+    checkpoint.record('address', address='12 High Street, Dundee DD1 4HN')
+    checkpoint.record('stage', location=0, address='12 High Street, Dundee DD1 4HN', stage='geocode', keep=True, state={'address': {'id': 'place-1'}})
+    checkpoint.record('stage', location=0, address='12 High Street, Dundee DD1 4HN', stage='imagery', keep=False, state=None)
+    checkpoint.close()
+    checkpoint.record('urlDone', url='https://example.com/contact') # After close, never written
+
+    state = load(tmp_path)
+    assert state['scan'] == {'urls': ['https://example.com'], 'depth': 2}
+    assert state['urls'] == {'https://example.com': 0, 'https://example.com/contact': 1}
+    assert state['doneUrls'] == {'https://example.com'}
+    assert state['addresses'] == ['12 High Street, Dundee DD1 4HN']
+    assert state['locations'][0] == {'address': '12 High Street, Dundee DD1 4HN', 'stages': ['geocode', 'imagery'], 'dropped': True, 'state': {'address': {'id': 'place-1'}}}
+
+
+def test_resume_skips_a_line_cut_short(tmp_path):
+    checkpoint = ScanCheckpoint(str(tmp_path))
+    checkpoint.record('address', address='1 Bell Street, Dundee DD1 1HG')
+    checkpoint.file.write('{"type":"address","addr')
+    checkpoint.close()
+    assert load(tmp_path)['addresses'] == ['1 Bell Street, Dundee DD1 1HG']
+
+
+def test_resume_restores_the_detections(tmp_path):
+    np = pytest.importorskip('numpy')
+    from detectionStore import DetectionStore
+    store = DetectionStore()
+    for image in range(3):
+        imageIndex = store.addImage(4, f'image{image}.png')
+        store.add(4, imageIndex, np.array([[image % 2, 0.9, 0.5, 0.5, 0.1, 0.1]] * (image + 1), dtype=np.float32))
+    checkpoint = ScanCheckpoint(str(tmp_path))
+    checkpoint.record('detections', location=4, **store.exportLocation(4))
+    checkpoint.close()
+
+    resumed = DetectionStore()
+    resumed.importLocation(4, load(tmp_path)['detections'][4])
+    assert resumed.summary(4, ['cameras', 'feces']) == store.summary(4, ['cameras', 'feces'])
+    assert resumed.size == 6
@@ -0,0 +1,36 @@
+import pytest
+
+np = pytest.importorskip('numpy')
+pytest.importorskip('cv2')
+from tiledInference import mergeBoxes, windowStarts
+
+
+def merge(boxes, scores, classIds, iou=0.5, containment=0.8):
+    return mergeBoxes(np.array(boxes, dtype=np.float32), np.array(scores, dtype=np.float32), np.array(classIds), iou, containment).tolist()
+
+
+def test_no_boxes():
+    assert merge(np.zeros((0, 4)), [], []) == []
+
+
+def test_overlapping_boxes_of_a_class_keep_the_best():
+    assert merge([[0, 0, 10, 10], [1, 1, 11, 11], [50, 50, 60, 60]], [0.6, 0.9, 0.7], [0, 0, 0]) == [1, 2]
+
+
+def test_other_classes_are_never_merged():
+    assert merge([[0, 0, 10, 10], [0, 0, 10, 10]], [0.9, 0.8], [0, 1]) == [0, 1]
+
+
+def test_box_cut_off_at_a_window_edge_is_dropped():
+    # The lower scoring half box is mostly inside the whole box but their IoU is under the threshold
+    assert merge([[0, 0, 20, 10], [10, 0, 20, 10]], [0.9, 0.8], [0, 0]) == [0]
+
+
+def test_a_dropped_box_drops_nothing():
+    # b overlaps a and c, a and c do not overlap: a drops b, c is kept
+    assert merge([[0, 0, 10, 10], [4, 0, 14, 10], [8, 0, 18, 10]], [0.9, 0.8, 0.7], [0, 0, 0], iou=0.3, containment=0.9) == [0, 2]
+
+
+def test_window_starts_cover_the_side():
+    assert windowStarts(1000, 416, 333).tolist() == [0, 333, 584]
+    assert windowStarts(300, 416, 333).tolist() == [0]
@@ -0,0 +1,142 @@
+import cv2
+import numpy as np
+
+# Custom imports
+from metrics import metrics
+
+
+# Greedy class aware NMS over the boxes of every window of an image at once: a box is dropped when a kept higher scoring
+# box of the same class overlaps it by more than iou, or holds more than containment of it (the part of an object cut off
+# at the edge of a window). The overlaps are one matrix, only the keep pass loops. boxes are [x1, y1, x2, y2], returns the kept indices, best first
+def mergeBoxes(boxes: np.ndarray, scores: np.ndarray, classIds: np.ndarray, iou: float, containment: float):
+    if len(boxes) == 0:
+        return np.zeros(0, dtype=np.int64)
+    order = scores.argsort()[::-1]
+    boxes, classIds = boxes[order], classIds[order]
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    width = np.clip(np.minimum(boxes[:, None, 2], boxes[None, :, 2]) - np.maximum(boxes[:, None, 0], boxes[None, :, 0]), 0, None)
+    height = np.clip(np.minimum(boxes[:, None, 3], boxes[None, :, 3]) - np.maximum(boxes[:, None, 1], boxes[None, :, 1]), 0, None)
+    intersection = width * height
+    overlap = intersection / (areas[:, None] + areas[None, :] - intersection + 1e-9)
+    contained = intersection / (np.minimum(areas[:, None], areas[None, :]) + 1e-9)
+    duplicate = ((overlap > iou) | (contained > containment)) & (classIds[:, None] == classIds[None, :])
+    # Only a kept box drops the lower scoring boxes (later in the order), a dropped box drops nothing
+    suppressed = np.zeros(len(boxes), dtype=bool)
+    for index in range(len(boxes)):
+        if not suppressed[index]:
+            suppressed[index + 1:] |= duplicate[index, index + 1:]
+    return order[~suppressed]
+
+
+# The top left corners of the windows along a side, the last window is moved back to end on the edge
+def windowStarts(length: int, window: int, stride: int):
+    if length <= window:
+        return np.zeros(1, dtype=np.int64)
+    starts = np.arange(0, length - window, stride)
+    return np.append(starts, length - window)
+
+
+# Sliding window inference in front of a detector, with the same detect interface. Images bigger than the window are cut into
+# overlapping windows at full resolution (so small objects like cameras are not downscaled away), the windows of every image
+# go to the detector as one batch with a downscaled pass of the whole image for the big objects, and the boxes are mapped back
+# to the image and merged. The windows a cheap grey level deviation and edge check rules out as empty (sky, roofs, tarmac) are skipped
+class TiledDetector():
+    detector = None
+    window = 416 # The pixels per side of a window, the inference size of the model
+    overlap = 0.2 # The fraction of a window shared with its neighbour
+    minDetail = 4.0 # The min mean edge strength (0-255) of a window worth running the model on
+    minDeviation = 6.0 # The min grey level standard deviation of a window worth running the model on
+    iou = 0.3 # The iou above which two boxes of the same class are merged
+    containment = 0.7 # The fraction of a box inside a higher scoring box above which it is merged
+    detailScale = 4 # The pre-filter runs on the image shrunk by this factor
+    windows = 0
+    skipped = 0
+    def __init__(self, detector, window: int = 416, overlap: float = 0.2, minDetail: float = 4.0, iou: float = 0.3):
+        self.detector = detector
+        self.window = window
+        self.overlap = min(max(overlap, 0.0), 0.9)
+        self.minDetail = minDetail
+        self.iou = iou
+
+    # The windows [x, y, width, height] of an image that are worth running the model on, and the number of windows before the pre-filter
+    def imageWindows(self, image: np.ndarray):
+        height, width = image.shape[:2]
+        stride = max(1, int(self.window * (1 - self.overlap)))
+        xs, ys = windowStarts(width, self.window, stride), windowStarts(height, self.window, stride)
+        gridX, gridY = np.meshgrid(xs, ys)
+        windows = np.stack([gridX.ravel(), gridY.ravel(), np.minimum(self.window, width), np.minimum(self.window, height)], axis=1)
+        if self.minDetail <= 0:
+            return windows, len(windows)
+        # Mean edge strength and grey deviation of every window from integral images of a shrunk copy
+        scale = self.detailScale
+        grey = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+        small = cv2.resize(grey, (max(1, width // scale), max(1, height // scale)), interpolation=cv2.INTER_AREA).astype(np.float64)
+        edges = np.abs(cv2.Laplacian(small, cv2.CV_64F))
+        sums, squares = cv2.integral2(small)
+        edgeSums = cv2.integral(edges)
+        x1, y1 = windows[:, 0] // scale, windows[:, 1] // scale
+        x2 = np.clip((windows[:, 0] + windows[:, 2]) // scale, x1 + 1, small.shape[1])
+        y2 = np.clip((windows[:, 1] + windows[:, 3]) // scale, y1 + 1, small.shape[0])
+        def windowSums(integral):
+            return integral[y2, x2] - integral[y1, x2] - integral[y2, x1] + integral[y1, x1]
+        pixels = (x2 - x1) * (y2 - y1)
+        means = windowSums(sums) / pixels
+        deviations = np.sqrt(np.clip(windowSums(squares) / pixels - means ** 2, 0, None))
+        detail = windowSums(edgeSums) / pixels
+        return windows[(detail >= self.minDetail) & (deviations >= self.minDeviation)], len(windows)
+
+    def detect(self, images: list):
+        if not images:
+            return []
+        crops = [] # The whole images first then the windows of the images bigger than a window
+        owners = [] # (image index, window) of each crop, window is None for a whole image
+        for index, image in enumerate(images):
+            crops.append(image)
+            owners.append((index, None))
+            height, width = image.shape[:2]
+            if width <= self.window and height <= self.window:
+                continue
+            windows, total = self.imageWindows(image)
+            self.windows += len(windows)
+            self.skipped += total - len(windows)
+            metrics.count('inference windows', len(windows))
+            metrics.count('skipped windows', total - len(windows))
+            for x, y, windowWidth, windowHeight in windows:
+                crops.append(image[y:y + windowHeight, x:x + windowWidth])
+                owners.append((index, (x, y, windowWidth, windowHeight)))
+        results = self.detector.detect(crops)
+
+        # Map the boxes of every crop back to the pixels of its image
+        perImage = [[] for _ in images]
+        for (index, window), boxes in zip(owners, results):
+            if len(boxes) == 0:
+                continue
+            height, width = images[index].shape[:2]
+            x, y, windowWidth, windowHeight = window if window is not None else (0, 0, width, height)
+            centreX, centreY = x + boxes[:, 2] * windowWidth, y + boxes[:, 3] * windowHeight
+            boxWidth, boxHeight = boxes[:, 4] * windowWidth, boxes[:, 5] * windowHeight
+            perImage[index].append(np.stack([boxes[:, 0], boxes[:, 1], centreX - boxWidth / 2, centreY - boxHeight / 2, centreX + boxWidth / 2, centreY + boxHeight / 2], axis=1))
+
+        detections = []
+        for image, found in zip(images, perImage):
+            if not found:
+                detections.append(np.zeros((0, 6), dtype=np.float32))
+                continue
+            found = np.concatenate(found)
+            kept = mergeBoxes(found[:, 2:6], found[:, 1], found[:, 0], self.iou, self.containment)
+            found = found[kept]
+            height, width = image.shape[:2]
+            detections.append(np.stack([
+                found[:, 0],
+                found[:, 1],
+                (found[:, 2] + found[:, 4]) / 2 / width,
+                (found[:, 3] + found[:, 5]) / 2 / height,
+                (found[:, 4] - found[:, 2]) / width,
+                (found[:, 5] - found[:, 3]) / height
+            ], axis=1).astype(np.float32))
+        return detections
+
+    def stats(self):
+        total = self.windows + self.skipped
+        skippedRate = self.skipped / total * 100 if total else 0
+        return f'{self.windows} windows run, {self.skipped} skipped as empty ({skippedRate:.1f}%)'
@@ -0,0 +1,200 @@
+import os # For finding the exported onnx weights
+import threading # For sharing the model between the location workers
+import cv2
+import numpy as np
+
+try:
+    import torch # Optional: only needed for the torch backend
+except ImportError:
+    torch = None
+
+try:
+    import onnxruntime # Optional: only needed for the onnxruntime backend
+except ImportError:
+    onnxruntime = None
+
+BACKENDS = ['torch', 'opencv', 'onnxruntime']
+
+
+# Greedy class aware non max suppression over all the boxes of an image at once.
+# boxes are [x1, y1, x2, y2], returns the indices of the boxes that are kept, highest score first
+def nonMaxSuppression(boxes: np.ndarray, scores: np.ndarray, classIds: np.ndarray, iou: float):
+    if len(boxes) == 0:
+        return np.zeros(0, dtype=np.int64)
+    # Offset the boxes of each class so boxes of different classes never overlap
+    offsets = classIds.astype(np.float32)[:, None] * (boxes.max() + 1)
+    shifted = boxes + offsets
+    areas = (shifted[:, 2] - shifted[:, 0]) * (shifted[:, 3] - shifted[:, 1])
+    order = scores.argsort()[::-1]
+    keep = []
+    while order.size:
+        best = order[0]
+        keep.append(best)
+        rest = order[1:]
+        width = np.clip(np.minimum(shifted[best, 2], shifted[rest, 2]) - np.maximum(shifted[best, 0], shifted[rest, 0]), 0, None)
+        height = np.clip(np.minimum(shifted[best, 3], shifted[rest, 3]) - np.maximum(shifted[best, 1], shifted[rest, 1]), 0, None)
+        overlap = width * height / (areas[best] + areas[rest] - width * height + 1e-9)
+        order = rest[overlap <= iou]
+    return np.array(keep, dtype=np.int64)
+
+
+# In process YOLO detector, the weights are loaded once and shared by every location in the scan.
+# This is the torch backend that runs the yolov5 .pt weights
+class YoloDetector():
+    backend = "torch"
+    classes = ["gate", "camera"] # The classes the model was trained on, index = class id
+    weights = "./yolov5/runs/train/exp6/weights/best.pt"
+    yoloRepo = "./yolov5" # The local yolov5 checkout, used to build the model from the weights
+    imageSize = 416 # The inference size in pixels
+    confidence = 0.6 # The min confidence of a detection
+    iou = 0.3 # The NMS iou threshold
+    threads = 0 # The number of CPU threads used for inference, 0 leaves it to the library
+    model = None
+    def __init__(self, weights: str = None, confidence: float = 0.6, iou: float = 0.3, imageSize: int = 416, threads: int = 0):
+        if weights:
+            self.weights = weights
+        self.confidence = confidence
+        self.iou = iou
+        self.imageSize = imageSize
+        self.threads = threads
+        self.lock = threading.Lock()
+        self.loadModel()
+
+    def loadModel(self):
+        if torch is None:
+            raise ImportError('torch is required for the torch backend, install the yolov5 requirements with: pip install -r ./yolov5/requirements.txt')
+        if self.threads:
+            torch.set_num_threads(self.threads)
+        self.model = torch.hub.load(self.yoloRepo, 'custom', path=self.weights, source='local', verbose=False)
+        self.model.conf = self.confidence
+        self.model.iou = self.iou
+        self.model.eval()
+
+    # Run the model on a batch of BGR images (as read by cv2).
+    # Returns one array per image with a row per detection: [class id, confidence, x centre, y centre, width, height],
+    # the box is normalised to the image size (the same as the yolo labels/*.txt format)
+    def detect(self, images: list):
+        if not images:
+            return []
+        rgbImages = [np.ascontiguousarray(image[..., ::-1]) for image in images]
+        with self.lock, torch.inference_mode():
+            results = self.model(rgbImages, size=self.imageSize)
+        detections = []
+        for boxes in results.xywhn:
+            boxes = boxes.cpu().numpy().astype(np.float32) # [x centre, y centre, width, height, confidence, class id]
+            detections.append(boxes[:, [5, 4, 0, 1, 2, 3]])
+        return detections
+
+
+# Runs the onnx export of the weights with the opencv dnn module, CPU only and no torch needed.
+# Export the weights with: python ./yolov5/export.py --weights best.pt --include onnx --img 416
+class OpenCVYoloDetector(YoloDetector):
+    backend = "opencv"
+
+    def loadModel(self):
+        self.weights = onnxWeights(self.weights)
+        if self.threads:
+            cv2.setNumThreads(self.threads)
+        self.model = cv2.dnn.readNetFromONNX(self.weights)
+        self.model.setPreferableBackend(cv2.dnn.DNN_BACKEND_OPENCV)
+        self.model.setPreferableTarget(cv2.dnn.DNN_TARGET_CPU)
+
+    # Resize the image to fit imageSize keeping its aspect ratio and pad the rest (the yolov5 letterbox)
+    def letterbox(self, image: np.ndarray):
+        height, width = image.shape[:2]
+        scale = min(self.imageSize / height, self.imageSize / width)
+        resizedWidth, resizedHeight = round(width * scale), round(height * scale)
+        padX, padY = (self.imageSize - resizedWidth) / 2, (self.imageSize - resizedHeight) / 2
+        resized = cv2.resize(image, (resizedWidth, resizedHeight), interpolation=cv2.INTER_LINEAR)
+        padded = cv2.copyMakeBorder(resized, int(round(padY - 0.1)), int(round(padY + 0.1)), int(round(padX - 0.1)), int(round(padX + 0.1)), cv2.BORDER_CONSTANT, value=(114, 114, 114))
+        return padded, scale, padX, padY
+
+    def infer(self, blob: np.ndarray):
+        self.model.setInput(blob)
+        return self.model.forward()
+
+    # Turn the raw output of one image into detections in the yolo label layout
+    def postprocess(self, output: np.ndarray, shape: tuple, scale: float, padX: float, padY: float):
+        # output rows are [x centre, y centre, width, height, objectness, class scores...] in letterbox pixels
+        classScores = output[:, 5:] * output[:, 4:5]
+        classIds = classScores.argmax(axis=1)
+        scores = classScores[np.arange(len(output)), classIds]
+        keep = scores >= self.confidence
+        output, classIds, scores = output[keep], classIds[keep], scores[keep]
+        height, width = shape[:2]
+        # Undo the letterbox so the boxes are relative to the original image
+        centreX = (output[:, 0] - padX) / scale
+        centreY = (output[:, 1] - padY) / scale
+        boxWidth = output[:, 2] / scale
+        boxHeight = output[:, 3] / scale
+        corners = np.stack([centreX - boxWidth / 2, centreY - boxHeight / 2, centreX + boxWidth / 2, centreY + boxHeight / 2], axis=1)
+        kept = nonMaxSuppression(corners, scores, classIds, self.iou)
+        return np.stack([
+            classIds[kept].astype(np.float32),
+            scores[kept],
+            centreX[kept] / width,
+            centreY[kept] / height,
+            boxWidth[kept] / width,
+            boxHeight[kept] / height
+        ], axis=1).astype(np.float32)
+
+    def detect(self, images: list):
+        detections = []
+        for image in images:
+            padded, scale, padX, padY = self.letterbox(image)
+            blob = cv2.dnn.blobFromImage(padded, 1 / 255.0, (self.imageSize, self.imageSize), swapRB=True, crop=False)
+            with self.lock:
+                output = self.infer(blob)
+            detections.append(self.postprocess(output[0], image.shape, scale, padX, padY))
+        return detections
+
+
+# Runs the onnx export of the weights with onnxruntime, CPU only and no torch needed.
+# The whole batch is run at once when the model was exported with a dynamic batch size (--dynamic)
+class OnnxRuntimeYoloDetector(OpenCVYoloDetector):
+    backend = "onnxruntime"
+
+    def loadModel(self):
+        if onnxruntime is None:
+            raise ImportError('onnxruntime is required for the onnxruntime backend, install it with: pip install onnxruntime')
+        self.weights = onnxWeights(self.weights)
+        options = onnxruntime.SessionOptions()
+        if self.threads:
+            options.intra_op_num_threads = self.threads
+        self.model = onnxruntime.InferenceSession(self.weights, sess_options=options, providers=['CPUExecutionProvider'])
+        modelInput = self.model.get_inputs()[0]
+        self.inputName = modelInput.name
+        self.dynamicBatch = not isinstance(modelInput.shape[0], int)
+
+    def infer(self, blob: np.ndarray):
+        return self.model.run(None, {self.inputName: blob})[0]
+
+    def detect(self, images: list):
+        if not self.dynamicBatch:
+            return super().detect(images)
+        if not images:
+            return []
+        letterboxed = [self.letterbox(image) for image in images]
+        blob = cv2.dnn.blobFromImages([padded for padded, scale, padX, padY in letterboxed], 1 / 255.0, (self.imageSize, self.imageSize), swapRB=True, crop=False)
+        with self.lock:
+            outputs = self.infer(blob)
+        return [self.postprocess(output, image.shape, scale, padX, padY) for output, image, (padded, scale, padX, padY) in zip(outputs, images, letterboxed)]
+
+
+# The onnx export sits next to the .pt weights
+def onnxWeights(weights: str):
+    if weights.endswith('.pt'):
+        weights = weights[:-3] + '.onnx'
+    if not os.path.exists(weights):
+        raise FileNotFoundError(f'No onnx weights found at: {weights}, export them with: python ./yolov5/export.py --weights {weights[:-5]}.pt --include onnx --img 416')
+    return weights
+
+
+# Create the detector for the backend selected at runtime
+def createDetector(backend: str, weights: str = None, confidence: float = 0.6, iou: float = 0.3, imageSize: int = 416, threads: int = 0):
+    detectors = {
+        'torch': YoloDetector,
+        'opencv': OpenCVYoloDetector,
+        'onnxruntime': OnnxRuntimeYoloDetector
+    }
+    return detectors[backend](weights, confidence=confidence, iou=iou, imageSize=imageSize, threads=threads)